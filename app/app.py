@@ -1,38 +1,37 @@
 import asyncio
 
-from aiogram import Bot, Dispatcher
-from aiogram.client.default import DefaultBotProperties
-from aiogram.fsm.storage.memory import MemoryStorage
+import uvicorn
 
 from .bot.config import Settings
 from .bot.logging_setup import setup_logging
-from .bot.routers import start, access, payments, chat_member
-from .bot.db.init_db import init_db
-from .bot.jobs.scheduler import start_background_jobs
+from .runtime import Runtime
+from .webhooks.app import create_app
 
 
 async def main() -> None:
     setup_logging()
     settings = Settings()
 
-    bot = Bot(
-        token=settings.BOT_TOKEN,
-        default=DefaultBotProperties(parse_mode="Markdown"),
+    # бот и вебхуки оплат в одном процессе и одном event loop:
+    # общий Bot, пул БД, провайдеры и фоновые задачи; старт/стоп — через lifespan FastAPI
+    mode = settings.updates_mode
+
+    runtime = Runtime(settings)
+    server = uvicorn.Server(
+        uvicorn.Config(
+            create_app(
+                runtime,
+                polling=mode == "polling",
+                telegram_webhook=mode == "webhook",
+                bot_jobs=settings.BOT_JOBS,
+            ),
+            host=settings.HTTP_HOST,
+            port=settings.HTTP_PORT,
+            log_config=None,
+        )
     )
-
-    dp = Dispatcher(storage=MemoryStorage())
-    dp["settings"] = settings
-
-    dp.include_router(start.router)
-    dp.include_router(access.router)
-    dp.include_router(payments.router)
-    dp.include_router(chat_member.router)
-
-    await init_db(settings)
-    start_background_jobs(dp, bot, settings)
-
-    await dp.start_polling(bot)
+    await server.serve()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
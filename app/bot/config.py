@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import hashlib
 from pathlib import Path
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -15,18 +16,42 @@ class Settings(BaseSettings):
     # Telegram
     BOT_TOKEN: str = Field(...)
     ADMIN_IDS: str = Field(default="")  # comma-separated
+    ADMIN_DIGEST_SIZE: int = Field(default=0)  # >1 — сводка админам по N оплат вместо сообщения на каждую
+    ADMIN_DIGEST_SECONDS: float = Field(default=30)  # ...или за столько секунд с первой оплаты в сводке
     MANAGER_URL: str = Field(default="https://t.me/")
     TARGET_CHAT_ID: int = Field(...)
+    BOT_UPDATES_MODE: str = Field(default="polling")  # polling | webhook
+    TELEGRAM_WEBHOOK_URL: str = Field(default="")  # публичный https://host, путь добавится сам
+    TELEGRAM_WEBHOOK_SECRET: str = Field(default="")  # X-Telegram-Bot-Api-Secret-Token: A-Z a-z 0-9 _ -
+    BOT_JOBS: bool = Field(default=True)  # планировщик и сверка оплат; false — в доп. воркерах за балансировщиком
+    UPDATES_CONCURRENCY: int = Field(default=100)  # сколько апдейтов (разных пользователей) обрабатываем одновременно
+    TELEGRAM_GLOBAL_RATE: float = Field(default=30)  # исходящих сообщений в секунду на бота (лимит Telegram ~30)
 
     # Payments
     CRYPTOBOT_TOKEN: str = Field(default="")
     CACTUSPAY_API_KEY: str = Field(default="")
     CACTUSPAY_SHOP_ID: str = Field(default="")
     WEBHOOK_SECRET: str = Field(default="")
+    # HTTP (вебхуки оплат в том же процессе, что и бот)
+    HTTP_HOST: str = Field(default="0.0.0.0")
+    HTTP_PORT: int = Field(default=8080)
     # App
     DB_PATH: str = Field(default="bot.db")  # можно относительный, будет резолвиться от BASE_DIR
+    DB_POOL_READERS: int = Field(default=4)  # сколько долгоживущих читающих соединений держим
+    USER_WRITES_FLUSH_MS: int = Field(default=5)  # как часто сбрасываем отложенные записи users
+    USER_WRITES_MAX_BATCH: int = Field(default=200)  # ...или сразу, если набралось столько
+    LAST_SCREEN_CACHE_SIZE: int = Field(default=10_000)  # сколько пользователей держим в кэше экранов
+    LAST_SCREEN_CACHE_TTL: int = Field(default=300)  # секунды
+    FSM_STORAGE: str = Field(default="sqlite")  # sqlite | memory (без БД, теряется при рестарте)
+    FSM_CACHE_SIZE: int = Field(default=10_000)  # сколько FSM-записей держим в памяти (LRU)
+    FSM_CACHE_TTL: int = Field(default=0)  # секунды; 0 — без кэша (нужно при нескольких воркерах)
+    FSM_STATE_TTL_HOURS: int = Field(default=24)  # брошенный сценарий (FSM) забываем через столько часов
     ORDER_TTL_MINUTES: int = Field(default=10)
     TIMEZONE: str = Field(default="Europe/Moscow")
+    RECONCILE_INTERVAL_SECONDS: int = Field(default=60)  # страховочная сверка оплат без webhook
+    LATE_PAYMENT_GRACE_MINUTES: int = Field(default=60)  # сколько после дедлайна ещё сверяем истёкшие заказы
+    OUTBOX_WORKERS: int = Field(default=4)  # сколько параллельных воркеров разбирают события оплат
+    WEBHOOK_LEDGER_TTL_DAYS: int = Field(default=7)  # сколько помним уже принятые события вебхуков
 
     @property
     def admin_ids(self) -> list[int]:
@@ -35,6 +60,18 @@ class Settings(BaseSettings):
             return []
         return [int(x.strip()) for x in raw.split(",") if x.strip()]
 
+    @property
+    def updates_mode(self) -> str:
+        mode = self.BOT_UPDATES_MODE.strip().lower()
+        if mode not in ("polling", "webhook"):
+            raise ValueError(f"Unknown BOT_UPDATES_MODE: {self.BOT_UPDATES_MODE!r}")
+        return mode
+
+    @property
+    def telegram_webhook_path(self) -> str:
+        # путь не угадать без токена бота, и сам токен в URL не светится
+        return "/hooks/telegram/" + hashlib.sha256(self.BOT_TOKEN.encode("utf-8")).hexdigest()[:32]
+
     def assets_path(self, relative: str) -> str:
         return str((self.BASE_DIR / relative).resolve())
 
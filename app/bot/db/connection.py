@@ -1,10 +1,170 @@
 from __future__ import annotations
 
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
 import aiosqlite
 
+log = logging.getLogger(__name__)
+
 
 async def connect(db_path: str) -> aiosqlite.Connection:
     conn = await aiosqlite.connect(db_path)
     await conn.execute("PRAGMA journal_mode=WAL;")
     await conn.execute("PRAGMA foreign_keys=ON;")
+    # если параллельно пишет другой процесс (второй воркер) — ждём lock, а не падаем сразу
+    await conn.execute("PRAGMA busy_timeout=5000;")
     return conn
+
+
+class Pool:
+    """
+    Долгоживущие соединения к одной SQLite-базе:
+      - N читателей (WAL позволяет читать параллельно с записью)
+      - 1 писатель (SQLite всё равно сериализует запись, лишние писатели только ждут lock)
+
+    PRAGMA выполняются один раз — при открытии соединения, а не на каждый запрос.
+    После close() все, кто ждёт читателя или писателя, получают RuntimeError, а не висят.
+    """
+
+    def __init__(self, db_path: str, readers: int = 4) -> None:
+        self.db_path = db_path
+        self._readers_count = max(1, readers)
+        # None в очереди — пул закрыт (см. close)
+        self._idle: asyncio.Queue[aiosqlite.Connection | None] = asyncio.Queue()
+        self._readers: list[aiosqlite.Connection] = []
+        self._writer: aiosqlite.Connection | None = None
+        self._write_lock = asyncio.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self._writer is not None
+
+    async def open(self) -> None:
+        if self.is_open:
+            return
+
+        # писатель первым: он переключает файл в WAL до того, как откроются читатели
+        self._writer = await connect(self.db_path)
+        self._idle = asyncio.Queue()
+        for _ in range(self._readers_count):
+            conn = await connect(self.db_path)
+            await conn.execute("PRAGMA query_only=ON;")
+            self._readers.append(conn)
+            self._idle.put_nowait(conn)
+
+        log.info("DB pool opened: %s (readers=%s)", self.db_path, self._readers_count)
+
+    async def close(self) -> None:
+        if not self.is_open:
+            return
+
+        async with self._write_lock:
+            writer, self._writer = self._writer, None
+            readers, self._readers = self._readers, []
+            # свободные соединения больше не раздаём; ожидающих reader() будит None
+            while not self._idle.empty():
+                self._idle.get_nowait()
+            self._idle.put_nowait(None)
+
+            for conn in [writer, *readers]:
+                try:
+                    await conn.close()
+                except Exception:
+                    log.exception("Failed to close DB connection")
+
+        log.info("DB pool closed: %s", self.db_path)
+
+    @asynccontextmanager
+    async def reader(self) -> AsyncIterator[aiosqlite.Connection]:
+        idle = self._idle
+        conn = await idle.get()
+        if conn is None:
+            # передаём дальше: следующий ожидающий тоже должен проснуться
+            idle.put_nowait(None)
+            raise RuntimeError(f"DB pool is closed: {self.db_path}")
+        try:
+            yield conn
+        finally:
+            if conn in self._readers:
+                self._idle.put_nowait(conn)
+
+    @asynccontextmanager
+    async def writer(self) -> AsyncIterator[aiosqlite.Connection]:
+        """
+        Эксклюзивный доступ к писателю. Всё, что выполнено внутри блока, —
+        одна транзакция: commit при выходе, rollback при исключении.
+        """
+        async with self._write_lock:
+            conn = self._writer
+            if conn is None:
+                raise RuntimeError(f"DB pool is closed: {self.db_path}")
+            try:
+                yield conn
+            except BaseException:
+                await conn.rollback()
+                raise
+            else:
+                await conn.commit()
+
+
+# -------------------------
+# Process-wide registry
+# -------------------------
+
+_pools: dict[str, Pool] = {}
+_pools_lock = asyncio.Lock()
+# после close_pools() ленивого открытия нет: shutdown не должен поднимать пул заново
+_closed = False
+
+
+async def open_pool(db_path: str, readers: int = 4) -> Pool:
+    global _closed
+    async with _pools_lock:
+        _closed = False
+        pool = _pools.get(db_path)
+        if pool is None:
+            pool = Pool(db_path, readers=readers)
+            _pools[db_path] = pool
+        await pool.open()
+        return pool
+
+
+async def get_pool(db_path: str) -> Pool:
+    """
+    Пул для db_path. Обычно открыт в startup-хуке; если нет — откроется лениво
+    (но не после close_pools(): тогда RuntimeError, как у закрытого пула).
+    """
+    pool = _pools.get(db_path)
+    if pool is not None and pool.is_open:
+        return pool
+    if _closed:
+        raise RuntimeError(f"DB pool is closed: {db_path}")
+    return await open_pool(db_path)
+
+
+async def close_pools() -> None:
+    global _closed
+    async with _pools_lock:
+        _closed = True
+        pools = list(_pools.values())
+        _pools.clear()
+
+    for pool in pools:
+        await pool.close()
+
+
+@asynccontextmanager
+async def reader(db_path: str) -> AsyncIterator[aiosqlite.Connection]:
+    pool = await get_pool(db_path)
+    async with pool.reader() as conn:
+        yield conn
+
+
+@asynccontextmanager
+async def writer(db_path: str) -> AsyncIterator[aiosqlite.Connection]:
+    pool = await get_pool(db_path)
+    async with pool.writer() as conn:
+        yield conn
@@ -0,0 +1,276 @@
+from __future__ import annotations
+
+import asyncio
+import copy
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from . import repo
+from ..utils.cache import MISSING, TTLCache
+
+log = logging.getLogger(__name__)
+
+Record = tuple[Optional[str], Dict[str, Any]]
+
+_EMPTY: Record = (None, {})
+
+
+def _key(key: StorageKey) -> str:
+    return ":".join(
+        str(part if part is not None else "")
+        for part in (
+            key.bot_id,
+            key.chat_id,
+            key.user_id,
+            key.thread_id,
+            getattr(key, "business_connection_id", None),
+            key.destiny,
+        )
+    )
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    FSM-хранилище aiogram в SQLite (таблица fsm_states): сценарии переживают рестарт.
+
+    Перед БД — необязательный write-through LRU/TTL-кэш (cache_ttl > 0): чтения активных
+    пользователей в БД не ходят.
+    Записи, как в user_writes, копятся в буфере (повторные по одному ключу схлопываются)
+    и сбрасываются одной транзакцией раз в flush_ms или по max_batch.
+
+    Запись, не менявшаяся state_ttl, считается протухшей (брошенный сценарий):
+    при чтении её нет, а фоновая задача раз в prune_interval удаляет такие строки.
+
+    Кэш видит только записи своего процесса: при нескольких воркерах (апдейты одного
+    пользователя могут попасть в разные) он отдаст устаревшее состояние — там cache_ttl=0,
+    каждое чтение идёт в БД. Тогда между воркерами отставание — лишь до flush_ms.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        *,
+        flush_ms: int = 5,
+        max_batch: int = 200,
+        cache_size: int = 10_000,
+        cache_ttl: float | None = 0,
+        state_ttl: timedelta = timedelta(hours=24),
+        prune_interval: float = 3600,
+    ) -> None:
+        self.db_path = db_path
+        # cache_ttl=0 — без кэша; None — без TTL (только LRU)
+        self.cache: TTLCache[str, Record] | None = TTLCache(cache_size, cache_ttl) if cache_ttl != 0 else None
+        self._flush_interval = max(flush_ms, 0) / 1000
+        self._max_batch = max(1, max_batch)
+        self._state_ttl = state_ttl
+        self._prune_interval = prune_interval
+
+        self._dirty: dict[str, Record] = {}
+        # то, что прямо сейчас пишется в БД: читатели должны видеть и это
+        self._inflight: dict[str, Record] = {}
+
+        self._wakeup = asyncio.Event()
+        self._full = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+        self._prune_task: asyncio.Task | None = None
+
+    # -------- BaseStorage --------
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        k = _key(key)
+        _, data = await self._get(k)
+        self._put(k, (state.state if isinstance(state, State) else state, data))
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = await self._get(_key(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        k = _key(key)
+        state, _ = await self._get(k)
+        self._put(k, (state, copy.deepcopy(data)))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data = await self._get(_key(key))
+        return copy.deepcopy(data)
+
+    async def close(self) -> None:
+        tasks = [t for t in (self._task, self._prune_task) if t is not None]
+        self._task = self._prune_task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.flush()
+
+    # -------- lifecycle --------
+
+    def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._run())
+        if self._prune_task is None or self._prune_task.done():
+            self._prune_task = loop.create_task(self._prune_loop())
+
+    def stats(self) -> dict[str, int]:
+        cache_stats = self.cache.stats() if self.cache is not None else {}
+        return {**cache_stats, "pending": len(self._dirty)}
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+
+            records, self._dirty = self._dirty, {}
+            self._inflight = records
+            try:
+                await repo.apply_fsm_writes(self.db_path, records)
+            except Exception:
+                # возвращаем в буфер, не затирая более свежие значения
+                for k, record in records.items():
+                    self._dirty.setdefault(k, record)
+                raise
+            finally:
+                self._inflight = {}
+
+    # -------- internals --------
+
+    async def _get(self, k: str) -> Record:
+        """
+        Порядок: ещё не сброшенная запись -> кэш (если включён) -> БД (с прогревом кэша).
+        """
+        pending = self._dirty.get(k) or self._inflight.get(k)
+        if pending is not None:
+            return pending
+
+        if self.cache is not None:
+            cached = self.cache.get(k, MISSING)
+            if cached is not MISSING:
+                return cached
+
+        not_before = (datetime.utcnow() - self._state_ttl).isoformat()
+        record = await repo.get_fsm_record(self.db_path, k, not_before) or _EMPTY
+        # пока ждали БД, могла прийти свежая запись — её не затираем
+        if self.cache is not None and k not in self._dirty and k not in self._inflight:
+            self.cache.set(k, record)
+        return record
+
+    def _put(self, k: str, record: Record) -> None:
+        self._dirty[k] = record
+        if self.cache is not None:
+            self.cache.set(k, record)
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        self._wakeup.set()
+        if len(self._dirty) >= self._max_batch:
+            self._full.set()
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+
+            if len(self._dirty) < self._max_batch:
+                try:
+                    await asyncio.wait_for(self._full.wait(), timeout=self._flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+            self._wakeup.clear()
+            self._full.clear()
+
+            try:
+                await self.flush()
+            except Exception:
+                log.exception("FSM flush failed (%s pending), retrying", len(self._dirty))
+                self._wakeup.set()
+                await asyncio.sleep(1)
+
+    async def _prune_loop(self) -> None:
+        while True:
+            try:
+                before_iso = (datetime.utcnow() - self._state_ttl).isoformat()
+                pruned = await repo.prune_fsm_states(self.db_path, before_iso)
+                if self.cache is not None:
+                    self.cache.purge_expired()
+                if pruned:
+                    log.info("Pruned %s stale FSM records", pruned)
+            except Exception:
+                log.exception("FSM prune failed")
+            await asyncio.sleep(self._prune_interval)
+
+
+class BoundedMemoryStorage(BaseStorage):
+    """
+    FSM в памяти процесса (без БД), но ограниченная: не больше max_entries записей,
+    вытеснение LRU, запись без обращений idle_ttl секунд забывается (брошенный сценарий).
+    Размер и счётчики вытеснений — stats().
+    """
+
+    def __init__(
+        self,
+        *,
+        max_entries: int = 10_000,
+        idle_ttl: float | None = 24 * 3600,
+        purge_interval: float = 60,
+    ) -> None:
+        self.records: TTLCache[str, Record] = TTLCache(max_entries, idle_ttl)
+        self._purge_interval = purge_interval
+        self._task: asyncio.Task | None = None
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        k = _key(key)
+        _, data = self._get(k)
+        self._put(k, (state.state if isinstance(state, State) else state, data))
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = self._get(_key(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        k = _key(key)
+        state, _ = self._get(k)
+        self._put(k, (state, copy.deepcopy(data)))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data = self._get(_key(key))
+        return copy.deepcopy(data)
+
+    async def close(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    def start(self) -> None:
+        # протухшие записи убираем и без обращений к ним, чтобы память не росла
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._purge_loop())
+
+    def stats(self) -> dict[str, int]:
+        return self.records.stats()
+
+    def _get(self, k: str) -> Record:
+        record = self.records.get(k, MISSING)
+        if record is MISSING:
+            return _EMPTY
+        # обращение продлевает idle TTL и поднимает запись в LRU
+        self.records.set(k, record)
+        return record
+
+    def _put(self, k: str, record: Record) -> None:
+        if record[0] is None and not record[1]:
+            self.records.pop(k)
+        else:
+            self.records.set(k, record)
+
+    async def _purge_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self._purge_interval)
+            purged = self.records.purge_expired()
+            if purged:
+                log.info("FSM memory: purged %s idle records, stats=%s", purged, self.stats())
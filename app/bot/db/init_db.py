@@ -1,13 +1,72 @@
 from __future__ import annotations
 
 import logging
+import re
 from pathlib import Path
+from typing import TYPE_CHECKING
+
+import aiosqlite
 
 from .connection import connect
-from ..config import Settings
+
+if TYPE_CHECKING:
+    from ..config import Settings
 
 log = logging.getLogger(__name__)
 
+MIGRATIONS_DIR = Path(__file__).with_name("migrations")
+_MIGRATION_RE = re.compile(r"^(\d+)_[\w-]+\.sql$")
+
+
+def _load_migrations() -> list[tuple[int, Path]]:
+    """
+    migrations/0001_xxx.sql, 0002_yyy.sql, ... — номер файла = целевой PRAGMA user_version.
+    """
+    migrations: list[tuple[int, Path]] = []
+    seen: dict[int, Path] = {}
+
+    for path in MIGRATIONS_DIR.glob("*.sql"):
+        m = _MIGRATION_RE.match(path.name)
+        if not m:
+            log.warning("Skip migration with bad name: %s", path.name)
+            continue
+        num = int(m.group(1))
+        if num in seen:
+            raise RuntimeError(f"Duplicate migration number {num}: {seen[num].name}, {path.name}")
+        seen[num] = path
+        migrations.append((num, path))
+
+    return sorted(migrations)
+
+
+async def _get_user_version(conn: aiosqlite.Connection) -> int:
+    cur = await conn.execute("PRAGMA user_version;")
+    row = await cur.fetchone()
+    return int(row[0]) if row else 0
+
+
+async def _apply_migrations(conn: aiosqlite.Connection) -> None:
+    version = await _get_user_version(conn)
+
+    for num, path in _load_migrations():
+        if num <= version:
+            continue
+
+        log.info("DB migrate: %s -> %s (%s)", version, num, path.name)
+        sql = path.read_text(encoding="utf-8")
+
+        # миграция + новый user_version — одна транзакция: либо всё, либо ничего
+        try:
+            await conn.executescript(f"BEGIN IMMEDIATE;\n{sql}\nPRAGMA user_version={num};\nCOMMIT;")
+        except Exception:
+            try:
+                await conn.execute("ROLLBACK;")
+            except Exception:
+                pass
+            raise
+
+        version = num
+
 
 async def init_db(settings: Settings) -> None:
     # гарантируем, что папка под БД существует
@@ -22,5 +81,6 @@ async def init_db(settings: Settings) -> None:
     try:
         await conn.executescript(schema)
         await conn.commit()
+        await _apply_migrations(conn)
     finally:
-        await conn.close()
\ No newline at end of file
+        await conn.close()
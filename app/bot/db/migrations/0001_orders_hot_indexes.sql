@@ -0,0 +1,17 @@
+-- Заказы: индексы под реальные запросы.
+-- Почти все заказы рано или поздно уходят из 'created', поэтому partial-индексы
+-- по status='created' остаются маленькими и не растут вместе с историей.
+
+-- get_expired_created_orders: status='created' AND expires_at <= ? ORDER BY expires_at
+CREATE INDEX IF NOT EXISTS idx_orders_created_expires
+    ON orders(expires_at)
+    WHERE status='created';
+
+-- get_order_by_provider_invoice: provider=? AND provider_invoice_id=? (инвойс принадлежит одному заказу).
+-- Раньше создавался в schema.sql — на таких БД он уже есть
+CREATE UNIQUE INDEX IF NOT EXISTS idx_orders_provider_invoice
+    ON orders(provider, provider_invoice_id);
+
+-- одноколоночные индексы полностью покрываются partial-индексами выше
+DROP INDEX IF EXISTS idx_orders_status;
+DROP INDEX IF EXISTS idx_orders_expires;
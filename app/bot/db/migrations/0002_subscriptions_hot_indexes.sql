@@ -0,0 +1,14 @@
+-- Подписки: индексы под реальные запросы.
+
+-- get_due_subscriptions_to_expire: status='active' AND ends_at IS NOT NULL AND ends_at <= ? ORDER BY ends_at
+CREATE INDEX IF NOT EXISTS idx_subs_active_ends
+    ON subscriptions(ends_at)
+    WHERE status='active' AND ends_at IS NOT NULL;
+
+-- get_active_subscription_for_user: user_id=? AND status='active' ORDER BY starts_at DESC
+-- revoke_active_subscriptions_for_user: user_id=? AND status='active'
+CREATE INDEX IF NOT EXISTS idx_subs_user_status_starts
+    ON subscriptions(user_id, status, starts_at);
+
+DROP INDEX IF EXISTS idx_subs_status;
+DROP INDEX IF EXISTS idx_subs_ends;
@@ -0,0 +1,13 @@
+-- Планировщик дренирует просроченные заказы/подписки пачками с keyset-пагинацией
+-- по (deadline, id): добавляем id в partial-индексы, чтобы ORDER BY deadline, id
+-- шёл прямо по индексу, без временной сортировки.
+
+DROP INDEX IF EXISTS idx_orders_created_expires;
+CREATE INDEX IF NOT EXISTS idx_orders_created_expires
+    ON orders(expires_at, id)
+    WHERE status='created';
+
+DROP INDEX IF EXISTS idx_subs_active_ends;
+CREATE INDEX IF NOT EXISTS idx_subs_active_ends
+    ON subscriptions(ends_at, id)
+    WHERE status='active' AND ends_at IS NOT NULL;
@@ -0,0 +1,12 @@
+-- Реконсайлер проходит по неоплаченным заказам конкретного провайдера (keyset по id).
+-- Partial-индекс содержит только created-заказы, история оплаченных его не раздувает.
+CREATE INDEX IF NOT EXISTS idx_orders_created_provider
+    ON orders(provider, id)
+    WHERE status='created';
+
+-- Оплата могла пройти у провайдера уже после нашего дедлайна: реконсайлер ещё
+-- late_grace проверяет недавно истёкшие заказы (get_late_invoice_orders):
+-- WHERE provider=? AND status='expired' AND expires_at > ? ORDER BY expires_at, id
+CREATE INDEX IF NOT EXISTS idx_orders_expired_provider
+    ON orders(provider, expires_at, id)
+    WHERE status='expired' AND provider_invoice_id IS NOT NULL;
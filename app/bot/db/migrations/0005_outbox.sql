@@ -0,0 +1,21 @@
+-- Outbox: webhook только записывает событие оплаты и сразу отвечает,
+-- выдачу доступа делают фоновые воркеры (jobs/outbox.py).
+
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    provider TEXT NOT NULL,
+    payload TEXT NOT NULL,            -- JSON события (order_id / invoice_id)
+    status TEXT NOT NULL,             -- pending/processing/done/failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at TEXT NOT NULL,       -- pending: когда можно брать; processing: до какого момента действует аренда
+    claimed_order_id TEXT,            -- заказ, который ИМЕННО это событие перевело в paid (выдачу доводит оно же)
+    result TEXT,
+    last_error TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+
+-- claim_outbox: status IN ('pending','processing') AND available_at <= ? ORDER BY available_at, id
+CREATE INDEX IF NOT EXISTS idx_outbox_ready
+    ON outbox(available_at, id)
+    WHERE status IN ('pending', 'processing');
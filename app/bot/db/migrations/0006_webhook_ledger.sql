@@ -0,0 +1,10 @@
+-- Журнал идемпотентности вебхуков: одно событие (provider, event_key) попадает в outbox один раз.
+-- Старые записи чистит jobs/outbox.py (prune_webhook_events).
+CREATE TABLE IF NOT EXISTS webhook_events (
+    provider TEXT NOT NULL,
+    event_key TEXT NOT NULL,
+    received_at TEXT NOT NULL,
+    PRIMARY KEY (provider, event_key)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_webhook_events_received ON webhook_events(received_at);
@@ -0,0 +1,9 @@
+-- Кэш Telegram file_id для картинок экранов (utils/media.py): загружаем файл один раз,
+-- дальше шлём по file_id. Ключ — путь ассета + sha256 содержимого: заменили картинку — новая запись.
+CREATE TABLE IF NOT EXISTS media_files (
+    asset_path TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    file_id TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (asset_path, content_hash)
+) WITHOUT ROWID;
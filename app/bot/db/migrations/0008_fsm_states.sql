@@ -0,0 +1,10 @@
+-- FSM aiogram (db/fsm_storage.py): состояние и данные сценариев переживают рестарт
+-- и видны всем воркерам. Записи старше TTL удаляются (prune_fsm_states).
+CREATE TABLE IF NOT EXISTS fsm_states (
+    key TEXT PRIMARY KEY,             -- bot_id:chat_id:user_id:thread_id:business_connection_id:destiny
+    state TEXT,
+    data TEXT NOT NULL DEFAULT '{}',  -- JSON
+    updated_at TEXT NOT NULL
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_fsm_states_updated ON fsm_states(updated_at);
@@ -0,0 +1,5 @@
+-- Повторный выбор того же тарифа/способа оплаты показывает уже выставленный инвойс (get_reusable_order):
+-- WHERE user_id=? AND tariff_code=? AND provider=? AND status='created' AND pay_url IS NOT NULL AND expires_at > ?
+CREATE INDEX IF NOT EXISTS idx_orders_checkout_reuse
+    ON orders(user_id, tariff_code, provider, expires_at)
+    WHERE status='created' AND pay_url IS NOT NULL;
@@ -1,17 +1,24 @@
 from __future__ import annotations
 
+import json
 import uuid
 from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Optional
 
-from .connection import connect
+import aiosqlite
+
+from .connection import reader, writer
 
 
 # -------------------------
 # Orders
 # -------------------------
 
+# по каким статусам заказ ещё можно провести как оплаченный (см. claim_order_paid)
+PAYABLE_ORDER_STATUSES = ("created", "expired")
+
+
 @dataclass
 class Order:
     id: str
@@ -43,16 +50,15 @@ def _row_to_order(row) -> Order:
     )
 
 
-async def ensure_user(db_path: str, user_id: int) -> None:
-    conn = await connect(db_path)
-    try:
-        await conn.execute(
-            "INSERT OR IGNORE INTO users(user_id, created_at) VALUES(?, ?)",
-            (user_id, datetime.utcnow().isoformat()),
-        )
-        await conn.commit()
-    finally:
-        await conn.close()
+async def _ensure_user(conn: aiosqlite.Connection, user_id: int) -> None:
+    await conn.execute(
+        "INSERT OR IGNORE INTO users(user_id, created_at) VALUES(?, ?)",
+        (user_id, datetime.utcnow().isoformat()),
+    )
+
+
+def new_order_id() -> str:
+    return uuid.uuid4().hex[:10]
 
 
 async def create_order(
@@ -62,10 +68,16 @@ async def create_order(
     price_rub: int,
     provider: str,
     ttl_minutes: int,
+    *,
+    order_id: Optional[str] = None,
+    provider_invoice_id: Optional[str] = None,
+    pay_url: Optional[str] = None,
 ) -> Order:
-    await ensure_user(db_path, user_id)
-
-    order_id = uuid.uuid4().hex[:10]
+    """
+    order_id можно сгенерировать заранее (new_order_id), а поля инвойса
+    передать сразу — тогда заказ и инвойс попадают в БД одним коммитом.
+    """
+    order_id = order_id or new_order_id()
     now = datetime.utcnow()
     expires = now + timedelta(minutes=ttl_minutes)
 
@@ -78,16 +90,19 @@ async def create_order(
         status="created",
         created_at=now.isoformat(),
         expires_at=expires.isoformat(),
+        provider_invoice_id=provider_invoice_id,
+        pay_url=pay_url,
     )
 
-    conn = await connect(db_path)
-    try:
+    async with writer(db_path) as conn:
+        await _ensure_user(conn, user_id)
         await conn.execute(
             """
             INSERT INTO orders(
-              id, user_id, tariff_code, price_rub, provider, status, created_at, expires_at
+              id, user_id, tariff_code, price_rub, provider, status,
+              provider_invoice_id, pay_url, created_at, expires_at
             )
-            VALUES(?, ?, ?, ?, ?, ?, ?, ?)
+            VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """,
             (
                 order.id,
@@ -96,123 +111,265 @@ async def create_order(
                 order.price_rub,
                 order.provider,
                 order.status,
+                order.provider_invoice_id,
+                order.pay_url,
                 order.created_at,
                 order.expires_at,
             ),
         )
-        await conn.commit()
-    finally:
-        await conn.close()
 
     return order
 
 
-async def update_order_payment(
-    db_path: str,
-    order_id: str,
-    provider_invoice_id: str,
-    pay_url: str,
-) -> None:
-    conn = await connect(db_path)
-    try:
+async def set_order_status(db_path: str, order_id: str, status: str) -> None:
+    async with writer(db_path) as conn:
         await conn.execute(
+            "UPDATE orders SET status=? WHERE id=?",
+            (status, order_id),
+        )
+
+
+async def get_order_by_id(db_path: str, order_id: str) -> Optional[Order]:
+    async with reader(db_path) as conn:
+        cur = await conn.execute(
             """
-            UPDATE orders
-            SET provider_invoice_id=?, pay_url=?
+            SELECT id, user_id, tariff_code, price_rub, provider, status,
+                   provider_invoice_id, pay_url, created_at, expires_at, paid_at
+            FROM orders
             WHERE id=?
             """,
-            (provider_invoice_id, pay_url, order_id),
+            (order_id,),
         )
-        await conn.commit()
-    finally:
-        await conn.close()
+        row = await cur.fetchone()
+    if not row:
+        return None
+    return _row_to_order(row)
 
 
-async def set_order_status(db_path: str, order_id: str, status: str) -> None:
-    conn = await connect(db_path)
-    try:
-        await conn.execute(
-            "UPDATE orders SET status=? WHERE id=?",
-            (status, order_id),
+async def get_created_order_by_id(db_path: str, order_id: str) -> Optional[Order]:
+    """
+    Точечный поиск неоплаченного заказа (по PK), без выборки всех created.
+    """
+    async with reader(db_path) as conn:
+        cur = await conn.execute(
+            """
+            SELECT id, user_id, tariff_code, price_rub, provider, status,
+                   provider_invoice_id, pay_url, created_at, expires_at, paid_at
+            FROM orders
+            WHERE id=? AND status='created'
+            """,
+            (order_id,),
         )
-        await conn.commit()
-    finally:
-        await conn.close()
+        row = await cur.fetchone()
+    if not row:
+        return None
+    return _row_to_order(row)
 
 
-async def get_order_by_id(db_path: str, order_id: str) -> Optional[Order]:
-    conn = await connect(db_path)
-    try:
+async def get_payable_order_by_id(db_path: str, order_id: str) -> Optional[Order]:
+    """
+    Заказ, который ещё можно провести как оплаченный: created или уже expired
+    (провайдер подтвердил оплату после нашего дедлайна — деньги списаны, доступ выдаём).
+    """
+    async with reader(db_path) as conn:
         cur = await conn.execute(
             """
             SELECT id, user_id, tariff_code, price_rub, provider, status,
                    provider_invoice_id, pay_url, created_at, expires_at, paid_at
             FROM orders
-            WHERE id=?
+            WHERE id=? AND status IN ('created', 'expired')
             """,
             (order_id,),
         )
         row = await cur.fetchone()
-        if not row:
-            return None
-        return _row_to_order(row)
-    finally:
-        await conn.close()
+    if not row:
+        return None
+    return _row_to_order(row)
 
 
-async def get_created_orders(db_path: str, limit: int = 50) -> list[Order]:
-    conn = await connect(db_path)
-    try:
+async def get_reusable_order(
+    db_path: str,
+    user_id: int,
+    tariff_code: str,
+    provider: str,
+    price_rub: int,
+    not_before_iso: str,
+) -> Optional[Order]:
+    """
+    Неоплаченный заказ того же пользователя на тот же тариф и способ оплаты, с уже выставленным
+    инвойсом и живой ещё хотя бы до not_before_iso — его можно показать повторно вместо нового.
+    """
+    async with reader(db_path) as conn:
         cur = await conn.execute(
             """
             SELECT id, user_id, tariff_code, price_rub, provider, status,
                    provider_invoice_id, pay_url, created_at, expires_at, paid_at
             FROM orders
-            WHERE status='created'
-            ORDER BY created_at ASC
-            LIMIT ?
+            WHERE user_id=? AND tariff_code=? AND provider=?
+              AND status='created' AND pay_url IS NOT NULL
+              AND expires_at > ? AND price_rub=?
+            ORDER BY expires_at DESC
+            LIMIT 1
             """,
-            (limit,),
+            (user_id, tariff_code, provider, not_before_iso, price_rub),
         )
-        rows = await cur.fetchall()
-        return [_row_to_order(r) for r in rows]
-    finally:
-        await conn.close()
+        row = await cur.fetchone()
+    return _row_to_order(row) if row else None
 
 
-async def get_expired_created_orders(db_path: str, now_iso: str) -> list[Order]:
-    conn = await connect(db_path)
-    try:
+async def get_order_by_provider_invoice(db_path: str, provider: str, invoice_id: str) -> Optional[Order]:
+    """
+    Заказ по инвойсу провайдера (uniq-индекс idx_orders_provider_invoice).
+    Статус не фильтруем — вызывающий сам решает, что делать с уже оплаченным.
+    """
+    async with reader(db_path) as conn:
         cur = await conn.execute(
             """
             SELECT id, user_id, tariff_code, price_rub, provider, status,
                    provider_invoice_id, pay_url, created_at, expires_at, paid_at
             FROM orders
-            WHERE status='created' AND expires_at <= ?
-            ORDER BY expires_at ASC
+            WHERE provider=? AND provider_invoice_id=?
             """,
-            (now_iso,),
+            (provider, str(invoice_id)),
         )
+        row = await cur.fetchone()
+    if not row:
+        return None
+    return _row_to_order(row)
+
+
+async def get_pending_invoice_orders(
+    db_path: str,
+    provider: str,
+    *,
+    limit: int = 1000,
+    after_id: str | None = None,
+) -> list[Order]:
+    """
+    Неоплаченные заказы провайдера, по которым уже выставлен инвойс.
+    after_id — id последней строки прошлой пачки (keyset-пагинация).
+    """
+    async with reader(db_path) as conn:
+        cur = await conn.execute(
+            """
+            SELECT id, user_id, tariff_code, price_rub, provider, status,
+                   provider_invoice_id, pay_url, created_at, expires_at, paid_at
+            FROM orders
+            WHERE provider=? AND status='created' AND id > ?
+              AND provider_invoice_id IS NOT NULL
+            ORDER BY id ASC
+            LIMIT ?
+            """,
+            (provider, after_id or "", limit),
+        )
+        rows = await cur.fetchall()
+    return [_row_to_order(r) for r in rows]
+
+
+async def get_late_invoice_orders(
+    db_path: str,
+    provider: str,
+    expired_after_iso: str,
+    *,
+    limit: int = 1000,
+    after: tuple[str, str] | None = None,
+) -> list[Order]:
+    """
+    Заказы провайдера, истёкшие позже expired_after_iso, с выставленным инвойсом:
+    оплата могла пройти у провайдера уже после нашего дедлайна.
+    after=(expires_at, id) последней строки прошлой пачки — keyset-пагинация.
+    """
+    sql = """
+        SELECT id, user_id, tariff_code, price_rub, provider, status,
+               provider_invoice_id, pay_url, created_at, expires_at, paid_at
+        FROM orders
+        WHERE provider=? AND status='expired' AND expires_at > ?
+          AND provider_invoice_id IS NOT NULL
+    """
+    params: list = [provider, expired_after_iso]
+    if after is not None:
+        sql += " AND (expires_at, id) > (?, ?)"
+        params.extend(after)
+    sql += " ORDER BY expires_at ASC, id ASC LIMIT ?"
+    params.append(limit)
+
+    async with reader(db_path) as conn:
+        cur = await conn.execute(sql, params)
         rows = await cur.fetchall()
-        return [_row_to_order(r) for r in rows]
-    finally:
-        await conn.close()
+    return [_row_to_order(r) for r in rows]
+
+
+async def get_expired_created_orders(
+    db_path: str,
+    now_iso: str,
+    *,
+    limit: int | None = None,
+    after: tuple[str, str] | None = None,
+) -> list[Order]:
+    """
+    Неоплаченные заказы с наступившим expires_at.
+    after=(expires_at, id) последней строки прошлой пачки — keyset-пагинация.
+    """
+    sql = """
+        SELECT id, user_id, tariff_code, price_rub, provider, status,
+               provider_invoice_id, pay_url, created_at, expires_at, paid_at
+        FROM orders
+        WHERE status='created' AND expires_at <= ?
+    """
+    params: list = [now_iso]
+    if after is not None:
+        sql += " AND (expires_at, id) > (?, ?)"
+        params.extend(after)
+    sql += " ORDER BY expires_at ASC, id ASC"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+
+    async with reader(db_path) as conn:
+        cur = await conn.execute(sql, params)
+        rows = await cur.fetchall()
+    return [_row_to_order(r) for r in rows]
+
+
+async def get_next_order_deadline(db_path: str, after_iso: str | None = None) -> Optional[str]:
+    """
+    Ближайший expires_at среди неоплаченных заказов (min по partial-индексу).
+    after_iso — только дедлайны позже него (уже наступившие ждут ретрая).
+    """
+    sql = "SELECT MIN(expires_at) FROM orders WHERE status='created'"
+    params: list = []
+    if after_iso is not None:
+        sql += " AND expires_at > ?"
+        params.append(after_iso)
+
+    async with reader(db_path) as conn:
+        cur = await conn.execute(sql, params)
+        row = await cur.fetchone()
+    return row[0] if row else None
+
+
+async def expire_order(db_path: str, order_id: str) -> bool:
+    """
+    created -> expired. False, если заказ уже успели оплатить/отменить.
+    """
+    async with writer(db_path) as conn:
+        cur = await conn.execute(
+            "UPDATE orders SET status='expired' WHERE id=? AND status='created'",
+            (order_id,),
+        )
+        return cur.rowcount == 1
 
 
 async def mark_order_paid(db_path: str, order_id: str) -> None:
-    conn = await connect(db_path)
-    try:
+    async with writer(db_path) as conn:
         await conn.execute(
             """
             UPDATE orders
             SET status='paid', paid_at=?
-            WHERE id=? AND status='created'
+            WHERE id=? AND status IN ('created', 'expired')
             """,
             (datetime.utcnow().isoformat(), order_id),
         )
-        await conn.commit()
-    finally:
-        await conn.close()
 
 
 # -------------------------
@@ -257,8 +414,7 @@ async def create_subscription(
     """
     sub_id = uuid.uuid4().hex[:12]
 
-    conn = await connect(db_path)
-    try:
+    async with writer(db_path) as conn:
         await conn.execute(
             """
             INSERT INTO subscriptions(id, user_id, tariff_code, starts_at, ends_at, status, order_id)
@@ -266,9 +422,6 @@ async def create_subscription(
             """,
             (sub_id, user_id, tariff_code, starts_at_iso, ends_at_iso, status, order_id),
         )
-        await conn.commit()
-    finally:
-        await conn.close()
 
     return Subscription(
         id=sub_id,
@@ -281,12 +434,88 @@ async def create_subscription(
     )
 
 
+async def claim_order_paid(
+    db_path: str,
+    order_id: str,
+    *,
+    paid_at_iso: str,
+    ends_at_iso: Optional[str],
+    outbox_id: Optional[int] = None,
+) -> Optional[tuple[Order, Subscription]]:
+    """
+    Compare-and-set: переводит заказ created/expired -> paid и создаёт подписку в ОДНОЙ транзакции.
+    expired тоже принимаем: провайдер мог подтвердить оплату уже после нашего дедлайна.
+    Возвращает (order, subscription) только тому, кто выиграл claim;
+    всем остальным (ретрай вебхука, второй воркер, поллер) — None.
+
+    outbox_id — событие outbox, от имени которого делается claim: в той же транзакции
+    помечаем его claimed_order_id, чтобы после падения процесса выдачу довело именно оно.
+    """
+    sub_id = uuid.uuid4().hex[:12]
+
+    async with writer(db_path) as conn:
+        cur = await conn.execute(
+            """
+            UPDATE orders
+            SET status='paid', paid_at=?
+            WHERE id=? AND status IN ('created', 'expired')
+            RETURNING id, user_id, tariff_code, price_rub, provider, status,
+                      provider_invoice_id, pay_url, created_at, expires_at, paid_at
+            """,
+            (paid_at_iso, order_id),
+        )
+        row = await cur.fetchone()
+        if not row:
+            return None
+
+        order = _row_to_order(row)
+        await conn.execute(
+            """
+            INSERT INTO subscriptions(id, user_id, tariff_code, starts_at, ends_at, status, order_id)
+            VALUES(?, ?, ?, ?, ?, 'active', ?)
+            """,
+            (sub_id, order.user_id, order.tariff_code, paid_at_iso, ends_at_iso, order.id),
+        )
+        if outbox_id is not None:
+            await conn.execute(
+                "UPDATE outbox SET claimed_order_id=? WHERE id=?",
+                (order.id, outbox_id),
+            )
+
+    sub = Subscription(
+        id=sub_id,
+        user_id=order.user_id,
+        tariff_code=order.tariff_code,
+        starts_at=paid_at_iso,
+        ends_at=ends_at_iso,
+        status="active",
+        order_id=order.id,
+    )
+    return order, sub
+
+
+async def get_subscription_by_order_id(db_path: str, order_id: str) -> Optional[Subscription]:
+    async with reader(db_path) as conn:
+        cur = await conn.execute(
+            """
+            SELECT id, user_id, tariff_code, starts_at, ends_at, status, order_id
+            FROM subscriptions
+            WHERE order_id=?
+            LIMIT 1
+            """,
+            (order_id,),
+        )
+        row = await cur.fetchone()
+    if not row:
+        return None
+    return _row_to_subscription(row)
+
+
 async def get_active_subscription_for_user(db_path: str, user_id: int) -> Optional[Subscription]:
     """
     Берём активную подписку пользователя (самую свежую).
     """
-    conn = await connect(db_path)
-    try:
+    async with reader(db_path) as conn:
         cur = await conn.execute(
             """
             SELECT id, user_id, tariff_code, starts_at, ends_at, status, order_id
@@ -298,45 +527,94 @@ async def get_active_subscription_for_user(db_path: str, user_id: int) -> Option
             (user_id,),
         )
         row = await cur.fetchone()
-        if not row:
-            return None
-        return _row_to_subscription(row)
-    finally:
-        await conn.close()
+    if not row:
+        return None
+    return _row_to_subscription(row)
 
 
-async def get_due_subscriptions_to_expire(db_path: str, now_iso: str, limit: int = 200) -> list[Subscription]:
+async def has_other_active_subscription(db_path: str, user_id: int, sub_id: str, now_iso: str) -> bool:
     """
-    Активные подписки, у которых ends_at наступил (и ends_at не NULL).
+    Есть ли у пользователя другая действующая подписка (продлил доступ новой оплатой).
     """
-    conn = await connect(db_path)
-    try:
+    async with reader(db_path) as conn:
         cur = await conn.execute(
             """
-            SELECT id, user_id, tariff_code, starts_at, ends_at, status, order_id
+            SELECT 1
             FROM subscriptions
-            WHERE status='active' AND ends_at IS NOT NULL AND ends_at <= ?
-            ORDER BY ends_at ASC
-            LIMIT ?
+            WHERE user_id=? AND status='active' AND id<>?
+              AND (ends_at IS NULL OR ends_at > ?)
+            LIMIT 1
             """,
-            (now_iso, limit),
+            (user_id, sub_id, now_iso),
         )
+        row = await cur.fetchone()
+    return row is not None
+
+
+async def get_due_subscriptions_to_expire(
+    db_path: str,
+    now_iso: str,
+    limit: int = 200,
+    *,
+    after: tuple[str, str] | None = None,
+) -> list[Subscription]:
+    """
+    Активные подписки, у которых ends_at наступил (и ends_at не NULL).
+    after=(ends_at, id) последней строки прошлой пачки — keyset-пагинация.
+    """
+    sql = """
+        SELECT id, user_id, tariff_code, starts_at, ends_at, status, order_id
+        FROM subscriptions
+        WHERE status='active' AND ends_at IS NOT NULL AND ends_at <= ?
+    """
+    params: list = [now_iso]
+    if after is not None:
+        sql += " AND (ends_at, id) > (?, ?)"
+        params.extend(after)
+    sql += " ORDER BY ends_at ASC, id ASC LIMIT ?"
+    params.append(limit)
+
+    async with reader(db_path) as conn:
+        cur = await conn.execute(sql, params)
         rows = await cur.fetchall()
-        return [_row_to_subscription(r) for r in rows]
-    finally:
-        await conn.close()
+    return [_row_to_subscription(r) for r in rows]
+
+
+async def get_next_subscription_deadline(db_path: str, after_iso: str | None = None) -> Optional[str]:
+    """
+    Ближайший ends_at среди активных подписок (min по partial-индексу).
+    after_iso — только дедлайны позже него (уже наступившие ждут ретрая).
+    """
+    sql = "SELECT MIN(ends_at) FROM subscriptions WHERE status='active' AND ends_at IS NOT NULL"
+    params: list = []
+    if after_iso is not None:
+        sql += " AND ends_at > ?"
+        params.append(after_iso)
+
+    async with reader(db_path) as conn:
+        cur = await conn.execute(sql, params)
+        row = await cur.fetchone()
+    return row[0] if row else None
+
+
+async def expire_subscription(db_path: str, sub_id: str) -> bool:
+    """
+    active -> expired. False, если подписку уже отозвали/истекла раньше.
+    """
+    async with writer(db_path) as conn:
+        cur = await conn.execute(
+            "UPDATE subscriptions SET status='expired' WHERE id=? AND status='active'",
+            (sub_id,),
+        )
+        return cur.rowcount == 1
 
 
 async def set_subscription_status(db_path: str, sub_id: str, status: str) -> None:
-    conn = await connect(db_path)
-    try:
+    async with writer(db_path) as conn:
         await conn.execute(
             "UPDATE subscriptions SET status=? WHERE id=?",
             (status, sub_id),
         )
-        await conn.commit()
-    finally:
-        await conn.close()
 
 
 async def revoke_active_subscriptions_for_user(db_path: str, user_id: int) -> None:
@@ -344,8 +622,7 @@ async def revoke_active_subscriptions_for_user(db_path: str, user_id: int) -> No
     Если пользователь вышел из группы/канала — считаем доступ отозванным.
     (А дальше: "вышел = повторная оплата")
     """
-    conn = await connect(db_path)
-    try:
+    async with writer(db_path) as conn:
         await conn.execute(
             """
             UPDATE subscriptions
@@ -354,38 +631,284 @@ async def revoke_active_subscriptions_for_user(db_path: str, user_id: int) -> No
             """,
             (user_id,),
         )
-        await conn.commit()
-    finally:
-        await conn.close()
 
 async def get_last_screen(db_path: str, user_id: int) -> tuple[int | None, int | None]:
-    conn = await connect(db_path)
-    try:
+    async with reader(db_path) as conn:
         cur = await conn.execute(
             "SELECT last_screen_chat_id, last_screen_message_id FROM users WHERE user_id=?",
             (user_id,),
         )
         row = await cur.fetchone()
-        if not row:
-            return None, None
-        return row[0], row[1]
-    finally:
-        await conn.close()
+    if not row:
+        return None, None
+    return row[0], row[1]
+
+
+_UPSERT_LAST_SCREEN = """
+    INSERT INTO users(user_id, created_at, last_screen_chat_id, last_screen_message_id)
+    VALUES(?, ?, ?, ?)
+    ON CONFLICT(user_id) DO UPDATE SET
+      last_screen_chat_id=excluded.last_screen_chat_id,
+      last_screen_message_id=excluded.last_screen_message_id
+"""
+
+
+async def apply_user_writes(db_path: str, screens: dict[int, tuple[int, int]]) -> None:
+    """
+    Пачка отложенных записей по users (см. user_writes) — одной транзакцией, один fsync.
+    screens: user_id -> (chat_id, message_id)
+    """
+    now_iso = datetime.utcnow().isoformat()
+    screen_rows = [(uid, now_iso, chat_id, msg_id) for uid, (chat_id, msg_id) in screens.items()]
+
+    async with writer(db_path) as conn:
+        await conn.executemany(_UPSERT_LAST_SCREEN, screen_rows)
+
+
+# -------------------------
+# Outbox
+# -------------------------
+
+@dataclass
+class OutboxItem:
+    id: int
+    provider: str
+    payload: dict
+    status: str             # pending/processing/done/failed
+    attempts: int
+    claimed_order_id: Optional[str]
+
+
+def _row_to_outbox(row) -> OutboxItem:
+    return OutboxItem(
+        id=row[0],
+        provider=row[1],
+        payload=json.loads(row[2]),
+        status=row[3],
+        attempts=row[4],
+        claimed_order_id=row[5],
+    )
+
+
+async def enqueue_outbox(
+    db_path: str,
+    provider: str,
+    payload: dict,
+    *,
+    dedupe_key: Optional[str] = None,
+) -> Optional[int]:
+    """
+    dedupe_key — ключ события в журнале webhook_events. Если такое событие уже было,
+    ничего не пишем и возвращаем None (запись в журнал и в outbox — одна транзакция).
+    """
+    now_iso = datetime.utcnow().isoformat()
+    async with writer(db_path) as conn:
+        if dedupe_key is not None:
+            cur = await conn.execute(
+                "INSERT OR IGNORE INTO webhook_events(provider, event_key, received_at) VALUES(?, ?, ?)",
+                (provider, dedupe_key, now_iso),
+            )
+            if cur.rowcount == 0:
+                return None
+
+        cur = await conn.execute(
+            """
+            INSERT INTO outbox(provider, payload, status, available_at, created_at, updated_at)
+            VALUES(?, ?, 'pending', ?, ?, ?)
+            """,
+            (provider, json.dumps(payload, ensure_ascii=False), now_iso, now_iso, now_iso),
+        )
+        return cur.lastrowid
 
 
-async def set_last_screen(db_path: str, user_id: int, chat_id: int, message_id: int) -> None:
-    await ensure_user(db_path, user_id)
+async def forget_webhook_event(db_path: str, provider: str, event_key: str) -> None:
+    """Разрешить повторную доставку события (например, оплата ещё не подтвердилась)."""
+    async with writer(db_path) as conn:
+        await conn.execute(
+            "DELETE FROM webhook_events WHERE provider=? AND event_key=?",
+            (provider, event_key),
+        )
+
+
+async def prune_webhook_events(db_path: str, before_iso: str) -> int:
+    async with writer(db_path) as conn:
+        cur = await conn.execute(
+            "DELETE FROM webhook_events WHERE received_at < ?",
+            (before_iso,),
+        )
+        return cur.rowcount
+
+
+async def claim_outbox(db_path: str, lease_seconds: float) -> Optional[OutboxItem]:
+    """
+    Берём одно готовое событие в аренду на lease_seconds.
+    processing с истёкшей арендой (воркер/процесс упал) снова считается готовым.
+    """
+    now = datetime.utcnow()
+    lease_until = now + timedelta(seconds=lease_seconds)
+
+    async with writer(db_path) as conn:
+        cur = await conn.execute(
+            """
+            UPDATE outbox
+            SET status='processing', attempts=attempts+1, available_at=?, updated_at=?
+            WHERE id = (
+              SELECT id FROM outbox
+              WHERE status IN ('pending', 'processing') AND available_at <= ?
+              ORDER BY available_at ASC, id ASC
+              LIMIT 1
+            )
+            RETURNING id, provider, payload, status, attempts, claimed_order_id
+            """,
+            (lease_until.isoformat(), now.isoformat(), now.isoformat()),
+        )
+        row = await cur.fetchone()
+    if not row:
+        return None
+    return _row_to_outbox(row)
 
-    conn = await connect(db_path)
-    try:
+
+async def renew_outbox_lease(db_path: str, outbox_id: int, attempts: int, lease_seconds: float) -> bool:
+    """
+    Продлить аренду события, пока воркер его обрабатывает.
+    attempts — номер попытки из claim: False, если аренда уже истекла и событие взял другой воркер.
+    """
+    now = datetime.utcnow()
+    lease_until = now + timedelta(seconds=lease_seconds)
+
+    async with writer(db_path) as conn:
+        cur = await conn.execute(
+            """
+            UPDATE outbox
+            SET available_at=?, updated_at=?
+            WHERE id=? AND status='processing' AND attempts=?
+            """,
+            (lease_until.isoformat(), now.isoformat(), outbox_id, attempts),
+        )
+        return cur.rowcount == 1
+
+
+async def complete_outbox(db_path: str, outbox_id: int, result: str) -> None:
+    async with writer(db_path) as conn:
+        await conn.execute(
+            "UPDATE outbox SET status='done', result=?, last_error=NULL, updated_at=? WHERE id=?",
+            (result, datetime.utcnow().isoformat(), outbox_id),
+        )
+
+
+async def fail_outbox(db_path: str, outbox_id: int, error: str, retry_at_iso: Optional[str]) -> None:
+    """
+    retry_at_iso=None — попытки исчерпаны, событие уходит в failed (разбирать руками).
+    """
+    now_iso = datetime.utcnow().isoformat()
+    async with writer(db_path) as conn:
+        if retry_at_iso is None:
+            await conn.execute(
+                "UPDATE outbox SET status='failed', last_error=?, updated_at=? WHERE id=?",
+                (error, now_iso, outbox_id),
+            )
+        else:
+            await conn.execute(
+                """
+                UPDATE outbox
+                SET status='pending', last_error=?, available_at=?, updated_at=?
+                WHERE id=?
+                """,
+                (error, retry_at_iso, now_iso, outbox_id),
+            )
+
+
+# -------------------------
+# Media (file_id картинок)
+# -------------------------
+
+async def get_media_file_id(db_path: str, asset_path: str, content_hash: str) -> Optional[str]:
+    async with reader(db_path) as conn:
+        cur = await conn.execute(
+            "SELECT file_id FROM media_files WHERE asset_path=? AND content_hash=?",
+            (asset_path, content_hash),
+        )
+        row = await cur.fetchone()
+    return row[0] if row else None
+
+
+async def set_media_file_id(db_path: str, asset_path: str, content_hash: str, file_id: str) -> None:
+    async with writer(db_path) as conn:
         await conn.execute(
             """
-            UPDATE users
-            SET last_screen_chat_id=?, last_screen_message_id=?
-            WHERE user_id=?
+            INSERT INTO media_files(asset_path, content_hash, file_id, updated_at)
+            VALUES(?, ?, ?, ?)
+            ON CONFLICT(asset_path, content_hash) DO UPDATE SET
+              file_id=excluded.file_id,
+              updated_at=excluded.updated_at
             """,
-            (chat_id, message_id, user_id),
+            (asset_path, content_hash, file_id, datetime.utcnow().isoformat()),
+        )
+
+
+async def forget_media_file_id(db_path: str, asset_path: str, content_hash: str) -> None:
+    async with writer(db_path) as conn:
+        await conn.execute(
+            "DELETE FROM media_files WHERE asset_path=? AND content_hash=?",
+            (asset_path, content_hash),
+        )
+
+
+# -------------------------
+# FSM
+# -------------------------
+
+async def get_fsm_record(
+    db_path: str,
+    key: str,
+    not_before_iso: str,
+) -> Optional[tuple[Optional[str], dict]]:
+    """(state, data) или None, если записи нет или она старше not_before_iso (протухла)."""
+    async with reader(db_path) as conn:
+        cur = await conn.execute(
+            "SELECT state, data FROM fsm_states WHERE key=? AND updated_at >= ?",
+            (key, not_before_iso),
+        )
+        row = await cur.fetchone()
+    if not row:
+        return None
+    return row[0], json.loads(row[1] or "{}")
+
+
+async def apply_fsm_writes(db_path: str, records: dict[str, tuple[Optional[str], dict]]) -> None:
+    """
+    Пачка отложенных записей FSM одной транзакцией.
+    Пустая запись (state=None, data={}) — удаление.
+    """
+    now_iso = datetime.utcnow().isoformat()
+    upserts = [
+        (key, state, json.dumps(data, ensure_ascii=False), now_iso)
+        for key, (state, data) in records.items()
+        if state is not None or data
+    ]
+    deletes = [(key,) for key, (state, data) in records.items() if state is None and not data]
+
+    async with writer(db_path) as conn:
+        if upserts:
+            await conn.executemany(
+                """
+                INSERT INTO fsm_states(key, state, data, updated_at)
+                VALUES(?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                  state=excluded.state,
+                  data=excluded.data,
+                  updated_at=excluded.updated_at
+                """,
+                upserts,
+            )
+        if deletes:
+            await conn.executemany("DELETE FROM fsm_states WHERE key=?", deletes)
+
+
+async def prune_fsm_states(db_path: str, before_iso: str) -> int:
+    async with writer(db_path) as conn:
+        cur = await conn.execute(
+            "DELETE FROM fsm_states WHERE updated_at < ?",
+            (before_iso,),
         )
-        await conn.commit()
-    finally:
-        await conn.close()
\ No newline at end of file
+        return cur.rowcount
@@ -1,4 +1,5 @@
 -- Users / Orders / Subscriptions
+-- Базовая схема (идемпотентная, выполняется при каждом старте).
 
 CREATE TABLE IF NOT EXISTS users (
     user_id INTEGER PRIMARY KEY,
@@ -34,8 +35,5 @@ CREATE TABLE IF NOT EXISTS subscriptions (
     FOREIGN KEY (order_id) REFERENCES orders(id)
 );
 
-CREATE INDEX IF NOT EXISTS idx_orders_status ON orders(status);
-CREATE INDEX IF NOT EXISTS idx_orders_expires ON orders(expires_at);
-
-CREATE INDEX IF NOT EXISTS idx_subs_status ON subscriptions(status);
-CREATE INDEX IF NOT EXISTS idx_subs_ends ON subscriptions(ends_at);
\ No newline at end of file
+-- Индексы (и любые изменения схемы живой БД) — в migrations/NNNN_*.sql,
+-- применяются по PRAGMA user_version (см. init_db.py).
\ No newline at end of file
@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+
+from . import repo
+from ..utils.cache import MISSING, TTLCache
+
+log = logging.getLogger(__name__)
+
+
+class UserWriteQueue:
+    """
+    Write-behind для частых записей по users (set_last_screen).
+
+    Вызовы только кладут данные в буфер (повторные апдейты одного user_id схлопываются),
+    фоновая задача сбрасывает буфер одной транзакцией — раз в flush_ms
+    или сразу, как только набралось max_batch пользователей.
+
+    Перед таблицей users стоит LRU/TTL-кэш last screen (write-through):
+    у активных пользователей учёт экранов вообще не ходит в БД.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        *,
+        flush_ms: int = 5,
+        max_batch: int = 200,
+        cache_size: int = 10_000,
+        cache_ttl: float | None = 300,
+    ) -> None:
+        self.db_path = db_path
+        self.screen_cache: TTLCache[int, tuple[int | None, int | None]] = TTLCache(cache_size, cache_ttl)
+        self._flush_interval = max(flush_ms, 0) / 1000
+        self._max_batch = max(1, max_batch)
+
+        self._screens: dict[int, tuple[int, int]] = {}
+        # то, что прямо сейчас пишется в БД: читатели должны видеть и это
+        self._inflight: dict[int, tuple[int, int]] = {}
+
+        self._wakeup = asyncio.Event()
+        self._full = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return len(self._screens)
+
+    # -------- producers --------
+
+    def set_last_screen(self, user_id: int, chat_id: int, message_id: int) -> None:
+        self._screens[user_id] = (chat_id, message_id)
+        self.screen_cache.set(user_id, (chat_id, message_id))
+        self._kick()
+
+    def pending_last_screen(self, user_id: int) -> tuple[int, int] | None:
+        return self._screens.get(user_id) or self._inflight.get(user_id)
+
+    # -------- lifecycle --------
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            if not self._screens:
+                return
+
+            screens, self._screens = self._screens, {}
+            self._inflight = screens
+            try:
+                await repo.apply_user_writes(self.db_path, screens)
+            except Exception:
+                # возвращаем в буфер, не затирая более свежие значения
+                for user_id, screen in screens.items():
+                    self._screens.setdefault(user_id, screen)
+                raise
+            finally:
+                self._inflight = {}
+
+    # -------- internals --------
+
+    def _kick(self) -> None:
+        self.start()
+        self._wakeup.set()
+        if len(self) >= self._max_batch:
+            self._full.set()
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+
+            if len(self) < self._max_batch:
+                try:
+                    await asyncio.wait_for(self._full.wait(), timeout=self._flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+            self._wakeup.clear()
+            self._full.clear()
+
+            try:
+                await self.flush()
+            except Exception:
+                log.exception("User writes flush failed (%s pending), retrying", len(self))
+                self._wakeup.set()
+                await asyncio.sleep(1)
+
+
+# -------------------------
+# Process-wide registry
+# -------------------------
+
+_queues: dict[str, UserWriteQueue] = {}
+
+
+def get_queue(db_path: str, **options) -> UserWriteQueue:
+    queue = _queues.get(db_path)
+    if queue is None:
+        queue = UserWriteQueue(db_path, **options)
+        _queues[db_path] = queue
+    return queue
+
+
+def start_user_writes(db_path: str, **options) -> UserWriteQueue:
+    """
+    options — параметры UserWriteQueue (flush_ms, max_batch, cache_size, cache_ttl).
+    """
+    queue = get_queue(db_path, **options)
+    queue.start()
+    return queue
+
+
+async def stop_user_writes() -> None:
+    """
+    Сбрасывает всё накопленное. Вызывать в shutdown ДО закрытия пула соединений.
+    """
+    for queue in list(_queues.values()):
+        try:
+            await queue.stop()
+        except Exception:
+            log.exception("Failed to flush user writes for %s", queue.db_path)
+    _queues.clear()
+
+
+def set_last_screen(db_path: str, user_id: int, chat_id: int, message_id: int) -> None:
+    get_queue(db_path).set_last_screen(user_id, chat_id, message_id)
+
+
+async def get_last_screen(db_path: str, user_id: int) -> tuple[int | None, int | None]:
+    """
+    Порядок: ещё не сброшенная запись -> кэш -> БД (с прогревом кэша).
+    """
+    queue = get_queue(db_path)
+    pending = queue.pending_last_screen(user_id)
+    if pending is not None:
+        return pending
+
+    cached = queue.screen_cache.get(user_id, MISSING)
+    if cached is not MISSING:
+        return cached
+
+    value = await repo.get_last_screen(db_path, user_id)
+    # пока ждали БД, мог прийти свежий set_last_screen — его не затираем
+    if queue.pending_last_screen(user_id) is None:
+        queue.screen_cache.set(user_id, value)
+    return value
@@ -0,0 +1,229 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+from aiogram import Bot
+
+from ..config import Settings
+from ..db import repo
+from ..services.payments import idempotency
+from ..services.payments.events import process_payment_event
+
+log = logging.getLogger(__name__)
+
+# итоги process_payment_event, после которых повторная доставка события ничего не изменит
+FINAL_RESULTS = frozenset(
+    {
+        "paid_processed",
+        "already_processed_or_not_found",
+        "order_missing_invoice_id",
+        "unknown_provider",
+        "expired",
+        "canceled",
+    }
+)
+# оплата ещё не подтвердилась — следующая доставка того же события должна пройти
+PENDING_RESULTS = frozenset({"created"})
+
+
+class OutboxWorkerPool:
+    """
+    Ограниченный пул воркеров, разбирающих outbox с событиями оплат.
+
+    Каждый воркер берёт событие в аренду (lease), обрабатывает и пишет итог:
+      - done + result — обработано (в т.ч. "ещё не оплачено" / "уже обработано")
+      - pending + available_at в будущем — ошибка, ретрай с экспоненциальной задержкой
+      - failed — попытки исчерпаны
+    Пока событие обрабатывается, воркер продлевает аренду (каждые lease_seconds / 3).
+    Если процесс упал посреди обработки, аренда истечёт и событие возьмёт другой воркер.
+
+    Заодно раз в prune_interval чистит журнал идемпотентности вебхуков старше ledger_ttl.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        settings: Settings,
+        *,
+        workers: int = 4,
+        lease_seconds: float = 120,
+        max_attempts: int = 8,
+        poll_interval: float = 1.0,
+        ledger_ttl: timedelta = timedelta(days=7),
+        prune_interval: float = 3600,
+    ) -> None:
+        self._bot = bot
+        self._settings = settings
+        self._db_path = settings.db_path_abs
+        self._workers = max(1, workers)
+        self._lease_seconds = lease_seconds
+        self._max_attempts = max_attempts
+        self._poll_interval = poll_interval
+        self._ledger_ttl = ledger_ttl
+        self._prune_interval = prune_interval
+
+        self._wakeup = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+
+    def notify(self) -> None:
+        self._wakeup.set()
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._worker(i)) for i in range(self._workers)]
+        self._tasks.append(loop.create_task(self._prune_loop()))
+        log.info("Outbox workers started: %s", self._workers)
+
+    async def stop(self) -> None:
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _worker(self, n: int) -> None:
+        while True:
+            try:
+                item = await repo.claim_outbox(self._db_path, self._lease_seconds)
+            except Exception:
+                log.exception("Outbox worker %s: claim failed", n)
+                await asyncio.sleep(self._poll_interval)
+                continue
+
+            if item is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self._poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+
+            await self._handle(item)
+
+    async def _handle(self, item: repo.OutboxItem) -> None:
+        heartbeat = asyncio.create_task(self._keep_lease(item))
+        try:
+            result = await process_payment_event(self._bot, self._settings, item)
+        except Exception as e:
+            log.exception("Outbox item %s (%s) failed, attempt %s", item.id, item.provider, item.attempts)
+            await self._record_failure(item, repr(e))
+            return
+        finally:
+            heartbeat.cancel()
+
+        try:
+            await repo.complete_outbox(self._db_path, item.id, result)
+        except Exception:
+            # не записали итог — аренда истечёт и событие обработают повторно (claim защитит от дублей)
+            log.exception("Outbox item %s processed (%s) but not marked done", item.id, result)
+            return
+
+        log.info("Outbox item %s (%s): %s", item.id, item.provider, result)
+
+        if result in FINAL_RESULTS:
+            # теперь дубли можно отбивать из памяти, не доходя до журнала
+            key = idempotency.event_key(item.provider, item.payload)
+            if key is not None:
+                idempotency.remember(item.provider, key)
+            return
+
+        if result not in PENDING_RESULTS:
+            log.warning("Outbox item %s: unexpected result %r, accepting the event again", item.id, result)
+        await self._forget_event(item)
+
+    async def _keep_lease(self, item: repo.OutboxItem) -> None:
+        interval = self._lease_seconds / 3
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                renewed = await repo.renew_outbox_lease(
+                    self._db_path, item.id, item.attempts, self._lease_seconds
+                )
+            except Exception:
+                log.exception("Failed to renew lease of outbox item %s", item.id)
+                continue
+            if not renewed:
+                log.warning("Outbox item %s: lease lost, another worker may redeliver it", item.id)
+                return
+
+    async def _record_failure(self, item: repo.OutboxItem, error: str) -> None:
+        retry_at_iso = None
+        if item.attempts < self._max_attempts:
+            delay = min(5 * 2 ** (item.attempts - 1), 600)
+            retry_at_iso = (datetime.utcnow() + timedelta(seconds=delay)).isoformat()
+        else:
+            log.error("Outbox item %s gave up after %s attempts", item.id, item.attempts)
+            await self._forget_event(item)
+
+        try:
+            await repo.fail_outbox(self._db_path, item.id, error, retry_at_iso)
+        except Exception:
+            log.exception("Failed to record failure of outbox item %s", item.id)
+
+    async def _forget_event(self, item: repo.OutboxItem) -> None:
+        key = idempotency.event_key(item.provider, item.payload)
+        if key is None:
+            return
+        idempotency.forget(item.provider, key)
+        try:
+            await repo.forget_webhook_event(self._db_path, item.provider, key)
+        except Exception:
+            log.exception("Failed to forget webhook event %s/%s", item.provider, key)
+
+    async def _prune_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self._prune_interval)
+            try:
+                before_iso = (datetime.utcnow() - self._ledger_ttl).isoformat()
+                pruned = await repo.prune_webhook_events(self._db_path, before_iso)
+                idempotency.purge_expired()
+                if pruned:
+                    log.info("Pruned %s old webhook ledger entries", pruned)
+            except Exception:
+                log.exception("Webhook ledger prune failed")
+
+
+_pool: OutboxWorkerPool | None = None
+
+
+def start_outbox_workers(bot: Bot, settings: Settings) -> OutboxWorkerPool:
+    global _pool
+    if _pool is None:
+        _pool = OutboxWorkerPool(
+            bot,
+            settings,
+            workers=settings.OUTBOX_WORKERS,
+            ledger_ttl=timedelta(days=settings.WEBHOOK_LEDGER_TTL_DAYS),
+        )
+    _pool.start()
+    return _pool
+
+
+async def stop_outbox_workers() -> None:
+    global _pool
+    pool, _pool = _pool, None
+    if pool is not None:
+        await pool.stop()
+
+
+async def enqueue_payment_event(settings: Settings, provider: str, payload: dict) -> int | None:
+    """
+    Записать событие оплаты (один коммит) и разбудить воркеров этого процесса.
+    None — событие уже было (повторная доставка): из памяти или по журналу webhook_events.
+    В память ключ попадает только после окончательного итога (см. FINAL_RESULTS):
+    пока событие в обработке, дубли отсекает журнал.
+    """
+    key = idempotency.event_key(provider, payload)
+    if key is not None and idempotency.seen(provider, key):
+        return None
+
+    outbox_id = await repo.enqueue_outbox(settings.db_path_abs, provider, payload, dedupe_key=key)
+    if outbox_id is None:
+        return None
+
+    if _pool is not None:
+        _pool.notify()
+    return outbox_id
@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+from ..config import Settings
+from ..db import repo
+from ..services.payments.base import SupportsBatchStatus
+from ..services.payments.factory import all_providers
+from .outbox import enqueue_payment_event
+
+log = logging.getLogger(__name__)
+
+
+class InvoiceReconciler:
+    """
+    Страховка на случай, если webhook об оплате не дошёл.
+
+    Раз в interval секунд проходит по неоплаченным заказам (keyset-пачками) у провайдеров,
+    которые умеют check_status_many, и ставит оплаченные в outbox — как если бы пришёл webhook.
+    Заказы, истёкшие не раньше late_grace назад, тоже проверяем: оплата могла пройти после дедлайна.
+    Выдачу делают outbox-воркеры: claim несёт outbox_id, так что после падения её доведут.
+    Дубли с webhook отсекает журнал webhook_events (тот же ключ события).
+    """
+
+    def __init__(
+        self,
+        settings: Settings,
+        *,
+        interval: float = 60,
+        page_size: int = 1000,
+        late_grace: timedelta = timedelta(hours=1),
+    ) -> None:
+        self._settings = settings
+        self._interval = interval
+        self._page_size = page_size
+        self._late_grace = late_grace
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is None:
+            return
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    async def _run(self) -> None:
+        log.info("Invoice reconciler started (interval=%ss)", self._interval)
+        while True:
+            await asyncio.sleep(self._interval)
+            try:
+                await self.reconcile()
+            except Exception:
+                log.exception("Invoice reconcile failed")
+
+    async def reconcile(self) -> int:
+        queued = 0
+        for provider in all_providers():
+            if isinstance(provider, SupportsBatchStatus):
+                queued += await self._reconcile_provider(provider.name, provider)
+                queued += await self._reconcile_late(provider.name, provider)
+        return queued
+
+    async def _reconcile_provider(self, name: str, provider: SupportsBatchStatus) -> int:
+        db_path = self._settings.db_path_abs
+        after_id: str | None = None
+        queued = 0
+
+        while True:
+            orders = await repo.get_pending_invoice_orders(
+                db_path, name, limit=self._page_size, after_id=after_id
+            )
+            if not orders:
+                break
+
+            queued += await self._enqueue_paid(name, provider, orders)
+
+            if len(orders) < self._page_size:
+                break
+            after_id = orders[-1].id
+
+        return queued
+
+    async def _reconcile_late(self, name: str, provider: SupportsBatchStatus) -> int:
+        db_path = self._settings.db_path_abs
+        expired_after = (datetime.utcnow() - self._late_grace).isoformat()
+        after: tuple[str, str] | None = None
+        queued = 0
+
+        while True:
+            orders = await repo.get_late_invoice_orders(
+                db_path, name, expired_after, limit=self._page_size, after=after
+            )
+            if not orders:
+                break
+
+            queued += await self._enqueue_paid(name, provider, orders)
+
+            if len(orders) < self._page_size:
+                break
+            after = (orders[-1].expires_at, orders[-1].id)
+
+        return queued
+
+    async def _enqueue_paid(self, name: str, provider: SupportsBatchStatus, orders: list[repo.Order]) -> int:
+        # обёртка single-flight сама кладёт терминальные статусы в кэш: воркер их не перепроверит
+        statuses = await provider.check_status_many(o.provider_invoice_id for o in orders)
+
+        queued = 0
+        for order in orders:
+            if statuses.get(str(order.provider_invoice_id)) != "paid":
+                continue
+            event = {"order_id": order.id, "invoice_id": str(order.provider_invoice_id)}
+            try:
+                if await enqueue_payment_event(self._settings, name, event) is not None:
+                    queued += 1
+                    log.info("Reconciled paid order %s (%s, %s) without webhook", order.id, name, order.status)
+            except Exception:
+                log.exception("Failed to enqueue reconciled order %s", order.id)
+
+        return queued
+
+
+_reconciler: InvoiceReconciler | None = None
+
+
+def start_reconciler(settings: Settings) -> InvoiceReconciler:
+    global _reconciler
+    if _reconciler is None:
+        _reconciler = InvoiceReconciler(
+            settings,
+            interval=settings.RECONCILE_INTERVAL_SECONDS,
+            late_grace=timedelta(minutes=settings.LATE_PAYMENT_GRACE_MINUTES),
+        )
+    _reconciler.start()
+    return _reconciler
+
+
+async def stop_reconciler() -> None:
+    global _reconciler
+    reconciler, _reconciler = _reconciler, None
+    if reconciler is not None:
+        await reconciler.stop()
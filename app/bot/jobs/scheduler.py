@@ -1,147 +1,299 @@
 from __future__ import annotations
 
+import asyncio
+import heapq
 import logging
-import json
-from typing import Any
-
-from fastapi import FastAPI, Request, HTTPException, Response
-from aiogram import Bot
-from aiogram.client.default import DefaultBotProperties
-
-from app.bot.config import Settings
-from app.bot.db import repo
-from app.bot.services.payments.factory import get_provider
-from app.bot.services.payments.fulfill import fulfill_paid_order
-
-log = logging.getLogger("webhooks")
-app = FastAPI()
-
-settings = Settings()
-bot = Bot(token=settings.BOT_TOKEN, default=DefaultBotProperties(parse_mode="Markdown"))
-
-
-def _check_secret(request: Request) -> None:
-    need = (settings.WEBHOOK_SECRET or "").strip()
-    if not need:
-        # можно оставить пустым на тестах, но лучше всегда ставить
-        return
-    got = (request.query_params.get("s") or "").strip()
-    if got != need:
-        raise HTTPException(status_code=403, detail="forbidden")
-
-
-async def _find_created_order_by_id(order_id: str):
-    orders = await repo.get_created_orders(settings.db_path_abs, limit=500)
-    return next((o for o in orders if o.id == order_id), None)
-
-
-async def _find_created_order_by_crypto_invoice(invoice_id: str):
-    orders = await repo.get_created_orders(settings.db_path_abs, limit=500)
-    return next((o for o in orders if o.provider == "crypto" and str(o.provider_invoice_id) == str(invoice_id)), None)
-
-
-@app.get("/hooks/health")
-async def health():
-    return {"ok": True}
-
-
-@app.post("/hooks/cactus")
-async def cactus_hook(request: Request):
-    _check_secret(request)
-
-    # Cactus: application/x-www-form-urlencoded: id, order_id, amount
-    form = await request.form()
-    order_id = str(form.get("order_id") or "").strip()
-    amount = str(form.get("amount") or "").strip()
-
-    log.warning("CACTUS_HOOK form=%s", dict(form))
-
-    if not order_id:
-        raise HTTPException(status_code=400, detail="order_id missing")
-
-    # по доке: после webhook обязательно проверить статус через get (ACCEPT/WAIT)
-    provider = get_provider("cactus")
-    st = await provider.check_status(order_id)
-    if st != "paid":
-        return {"ok": True, "status": st}
-
-    order = await _find_created_order_by_id(order_id)
-    if not order:
-        return {"ok": True, "status": "already_processed_or_not_found"}
-
-    await fulfill_paid_order(bot, settings, order)
-    return {"ok": True, "status": "paid_processed", "amount": amount}
-
-
-@app.post("/hooks/crypto")
-async def crypto_hook(request: Request):
-    _check_secret(request)
-
-    raw = await request.body()
-    data: dict[str, Any] = {}
-
-    # CryptoBot обычно шлёт JSON, но мы не будем доверять формату — делаем “железно”
-    try:
-        data = await request.json()
-    except Exception:
+from datetime import datetime, timedelta
+
+from aiogram import Bot, Dispatcher
+
+from ..config import Settings
+from ..db import repo
+from ..middlewares.outgoing import BROADCAST, send_priority
+from ..services.access.invites import kick_user
+from ..services.payments.factory import get_provider
+
+log = logging.getLogger(__name__)
+
+ORDER = "order"
+SUBSCRIPTION = "subscription"
+
+
+class DeadlineScheduler:
+    """
+    Авто-отмена неоплаченных заказов (orders.expires_at) и окончание подписок (subscriptions.ends_at).
+
+    Вместо опроса раз в N секунд держим min-heap ближайших дедлайнов и спим ровно до первого.
+    Новые заказы/подписки будят планировщик через notify_deadline(), если их дедлайн раньше.
+    Просроченное дренируется пачками (keyset по (deadline, id)).
+
+    Подписка становится expired только после успешного кика. Если кик (или запись в БД) не
+    удался, запись остаётся в выборке и ждёт ретрая с экспоненциальной задержкой
+    (retry .. retry_max), а не перебирается в горячем цикле. Так же ретраятся заказы.
+
+    max_sleep — страховочная пересинхронизация с БД (дедлайны, созданные другим процессом).
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        settings: Settings,
+        *,
+        batch_size: int = 200,
+        max_sleep: float = 300,
+        retry: float = 5,
+        retry_max: float = 600,
+    ) -> None:
+        self._bot = bot
+        self._settings = settings
+        self._db_path = settings.db_path_abs
+        self._batch_size = batch_size
+        self._max_sleep = max_sleep
+        self._retry = retry
+        self._retry_max = retry_max
+
+        # вид -> {id -> (когда повторить, сколько раз уже не получилось)}
+        self._backoff: dict[str, dict[str, tuple[datetime, int]]] = {ORDER: {}, SUBSCRIPTION: {}}
+
+        self._heap: list[tuple[datetime, str]] = []
+        self._queued: set[tuple[datetime, str]] = set()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    # -------- public --------
+
+    def notify(self, kind: str, when_iso: str) -> None:
+        when = datetime.fromisoformat(when_iso)
+        if self._push(kind, when) and self._heap[0] == (when, kind):
+            self._wakeup.set()
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is None:
+            return
+        task.cancel()
         try:
-            form = await request.form()
-            data = dict(form)
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    # -------- heap --------
+
+    def _push(self, kind: str, when: datetime) -> bool:
+        item = (when, kind)
+        if item in self._queued:
+            return False
+        heapq.heappush(self._heap, item)
+        self._queued.add(item)
+        return True
+
+    def _pop_due(self, now: datetime) -> set[str]:
+        due: set[str] = set()
+        while self._heap and self._heap[0][0] <= now:
+            item = heapq.heappop(self._heap)
+            self._queued.discard(item)
+            due.add(item[1])
+        return due
+
+    def _seconds_until_next(self) -> float:
+        if not self._heap:
+            return self._max_sleep
+        delta = (self._heap[0][0] - datetime.utcnow()).total_seconds()
+        return min(max(delta, 0.0), self._max_sleep)
+
+    async def _reload(self, drained_at: datetime | None = None) -> None:
+        """
+        Ближайшие дедлайны из БД. После дренажа (drained_at) всё, что наступило не позже него
+        и осталось в БД, ждёт ретрая: будимся к ретраю, а из БД берём только более поздние
+        дедлайны — в том числе наступившие уже во время дренажа.
+        """
+        after_iso = drained_at.isoformat() if drained_at else None
+        for kind, get_next in (
+            (ORDER, repo.get_next_order_deadline),
+            (SUBSCRIPTION, repo.get_next_subscription_deadline),
+        ):
+            backoff = self._backoff[kind]
+            if backoff:
+                self._push(kind, min(at for at, _ in backoff.values()))
+            next_at = await get_next(self._db_path, after_iso)
+            if next_at:
+                self._push(kind, datetime.fromisoformat(next_at))
+
+    def _retry_later(self, kind: str, item_id: str, now: datetime, failures: int) -> None:
+        delay = min(self._retry * 2 ** failures, self._retry_max)
+        self._backoff[kind][item_id] = (now + timedelta(seconds=delay), failures + 1)
+
+    # -------- loop --------
+
+    async def _run(self) -> None:
+        log.info("Deadline scheduler started")
+        while True:
+            try:
+                await self._tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("Deadline scheduler tick failed")
+                await asyncio.sleep(5)
+
+    async def _tick(self) -> None:
+        # первый проход и каждая страховочная пересинхронизация — из БД
+        await self._reload()
+
+        while True:
+            timeout = self._seconds_until_next()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            now = datetime.utcnow()
+            due = self._pop_due(now)
+            if not due:
+                if timeout >= self._max_sleep:
+                    return
+                continue
+
+            if ORDER in due:
+                await self._expire_orders(now)
+            if SUBSCRIPTION in due:
+                await self._expire_subscriptions(now)
+
+            # после дренажа следующий дедлайн каждого вида берём из БД
+            await self._reload(now)
+
+    # -------- orders --------
+
+    async def _expire_orders(self, now: datetime) -> None:
+        now_iso = now.isoformat()
+        after: tuple[str, str] | None = None
+        total = 0
+        backoff, self._backoff[ORDER] = self._backoff[ORDER], {}
+
+        while True:
+            batch = await repo.get_expired_created_orders(
+                self._db_path, now_iso, limit=self._batch_size, after=after
+            )
+            for order in batch:
+                retry_at, failures = backoff.get(order.id, (now, 0))
+                if retry_at > now:
+                    self._backoff[ORDER][order.id] = (retry_at, failures)
+                    continue
+                try:
+                    expired = await repo.expire_order(self._db_path, order.id)
+                except Exception:
+                    log.exception("Failed to expire order %s", order.id)
+                    self._retry_later(ORDER, order.id, now, failures)
+                    continue
+                # False — заказ уже оплатили/отменили, из выборки он ушёл сам
+                if expired:
+                    await self._cancel_invoice(order)
+                    total += 1
+            if len(batch) < self._batch_size:
+                break
+            after = (batch[-1].expires_at, batch[-1].id)
+
+        if total:
+            log.info("Expired %s unpaid orders", total)
+        if self._backoff[ORDER]:
+            log.warning("%s expired orders are waiting for a retry", len(self._backoff[ORDER]))
+
+    async def _cancel_invoice(self, order: repo.Order) -> None:
+        if order.provider_invoice_id:
+            try:
+                await get_provider(order.provider).cancel(order.provider_invoice_id)
+            except Exception:
+                log.exception("Failed to cancel invoice %s for order %s", order.provider_invoice_id, order.id)
+
+    # -------- subscriptions --------
+
+    async def _expire_subscriptions(self, now: datetime) -> None:
+        now_iso = now.isoformat()
+        after: tuple[str, str] | None = None
+        total = 0
+        backoff, self._backoff[SUBSCRIPTION] = self._backoff[SUBSCRIPTION], {}
+
+        while True:
+            batch = await repo.get_due_subscriptions_to_expire(
+                self._db_path, now_iso, limit=self._batch_size, after=after
+            )
+            for sub in batch:
+                retry_at, failures = backoff.get(sub.id, (now, 0))
+                if retry_at > now:
+                    self._backoff[SUBSCRIPTION][sub.id] = (retry_at, failures)
+                elif await self._expire_subscription(sub, now_iso):
+                    total += 1
+                else:
+                    self._retry_later(SUBSCRIPTION, sub.id, now, failures)
+            if len(batch) < self._batch_size:
+                break
+            after = (batch[-1].ends_at, batch[-1].id)
+
+        if total:
+            log.info("Expired %s subscriptions", total)
+        if self._backoff[SUBSCRIPTION]:
+            log.warning(
+                "%s expired subscriptions are waiting for a kick retry", len(self._backoff[SUBSCRIPTION])
+            )
+
+    async def _expire_subscription(self, sub: repo.Subscription, now_iso: str) -> bool:
+        """
+        Сначала кик, потом expired: иначе при ошибке Telegram пользователь остался бы в чате
+        с уже закрытой подпиской и больше никогда не попал бы в выборку.
+        """
+        try:
+            # продлил доступ другой оплатой — не кикаем
+            if await repo.has_other_active_subscription(self._db_path, sub.user_id, sub.id, now_iso):
+                await repo.expire_subscription(self._db_path, sub.id)
+                return True
         except Exception:
-            data = {}
-
-    log.warning("CRYPTO_HOOK raw=%s json=%s", raw.decode("utf-8", "ignore"), json.dumps(data, ensure_ascii=False))
-
-    # 1) пытаемся вытащить invoice_id
-    invoice_id = str(
-        data.get("invoice_id")
-        or data.get("invoiceId")
-        or data.get("id")
-        or ""
-    ).strip()
-
-    # 2) иногда можно получить order_id из payload: "order:<id>"
-    payload = str(data.get("payload") or data.get("data") or "").strip()
-    order_id_from_payload = ""
-    if payload.startswith("order:"):
-        order_id_from_payload = payload.split("order:", 1)[1].strip()
+            log.exception("Failed to expire subscription %s", sub.id)
+            return False
 
-    provider = get_provider("crypto")
+        # массовые кики — самым низким приоритетом, не мешают выдаче доступа и ответам
+        with send_priority(BROADCAST):
+            kicked = await kick_user(self._bot, self._settings.TARGET_CHAT_ID, sub.user_id)
+        if not kicked:
+            return False
 
-    # Если есть order_id в payload — попробуем найти order по id
-    if order_id_from_payload:
-        order = await _find_created_order_by_id(order_id_from_payload)
-        if not order:
-            return {"ok": True, "status": "already_processed_or_not_found"}
-
-        if not order.provider_invoice_id:
-            # на всякий: если вдруг invoice_id не записался
-            return {"ok": True, "status": "order_missing_invoice_id"}
+        try:
+            await repo.expire_subscription(self._db_path, sub.id)
+        except Exception:
+            # подписка осталась active: на ретрае кикнем ещё раз (это безопасно) и закроем
+            log.exception("User %s kicked, but subscription %s not marked expired", sub.user_id, sub.id)
+            return False
+        log.info("Subscription %s of user %s expired, user kicked", sub.id, sub.user_id)
+        return True
 
-        st = await provider.check_status(order.provider_invoice_id)
-        if st != "paid":
-            return {"ok": True, "status": st}
 
-        await fulfill_paid_order(bot, settings, order)
-        return {"ok": True, "status": "paid_processed"}
+_scheduler: DeadlineScheduler | None = None
 
-    # Иначе работаем по invoice_id
-    if not invoice_id:
-        return {"ok": True, "status": "no_invoice_id"}
 
-    st = await provider.check_status(invoice_id)
-    if st != "paid":
-        return {"ok": True, "status": st}
+def start_background_jobs(dp: Dispatcher, bot: Bot, settings: Settings) -> DeadlineScheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = DeadlineScheduler(bot, settings)
+    _scheduler.start()
+    return _scheduler
 
-    order = await _find_created_order_by_crypto_invoice(invoice_id)
-    if not order:
-        return {"ok": True, "status": "already_processed_or_not_found"}
 
-    await fulfill_paid_order(bot, settings, order)
-    return {"ok": True, "status": "paid_processed"}
+async def stop_background_jobs() -> None:
+    global _scheduler
+    scheduler, _scheduler = _scheduler, None
+    if scheduler is not None:
+        await scheduler.stop()
 
 
-@app.head("/hooks/cactus")
-@app.head("/hooks/crypto")
-async def hook_head():
-    return Response(status_code=200)
\ No newline at end of file
+def notify_deadline(kind: str, when_iso: str | None) -> None:
+    """
+    Сообщить планировщику о новом дедлайне (ORDER / SUBSCRIPTION).
+    В процессе без планировщика (например, webhooks) — no-op: там подхватит пересинхронизация.
+    """
+    if _scheduler is None or not when_iso:
+        return
+    _scheduler.notify(kind, when_iso)
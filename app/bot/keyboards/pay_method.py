@@ -1,23 +1,40 @@
+from typing import Iterable, Optional
+
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 
 from ..callbacks import PayMethodCb, MenuCb, ConfirmCb
 
 
-def pay_method_kb(tariff_code: str) -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup(
-        inline_keyboard=[
+def pay_method_kb(tariff_code: str, providers: Optional[Iterable[str]] = None) -> InlineKeyboardMarkup:
+    """
+    providers — какие способы оплаты показывать (None => все).
+    Нездоровых провайдеров роутер сюда не передаёт.
+    """
+    shown = set(providers) if providers is not None else {"cactus", "crypto"}
+
+    rows: list[list[InlineKeyboardButton]] = []
+    if "cactus" in shown:
+        rows.append(
             [
                 InlineKeyboardButton(
                     text="🏦 Cactus | РФ | СБП | QR",
                     callback_data=PayMethodCb(provider="cactus", tariff=tariff_code).pack(),
                 )
-            ],
+            ]
+        )
+    if "crypto" in shown:
+        rows.append(
             [
                 InlineKeyboardButton(
                     text="🪙 CryptoBot",
                     callback_data=PayMethodCb(provider="crypto", tariff=tariff_code).pack(),
                 )
-            ],
+            ]
+        )
+
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            *rows,
             [
                 InlineKeyboardButton(
                     text="🔙 Назад",
@@ -31,4 +48,4 @@ def pay_method_kb(tariff_code: str) -> InlineKeyboardMarkup:
                 )
             ],
         ]
-    )
\ No newline at end of file
+    )
@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from ..utils.cache import TTLCache
+
+log = logging.getLogger(__name__)
+
+# приоритеты исходящих сообщений: меньше — раньше
+PAYMENT = 0       # подтверждение оплаты, инвайт
+INTERACTIVE = 1   # ответы на нажатия (по умолчанию)
+ADMIN = 2         # уведомления админам
+BROADCAST = 3     # рассылки, кики по истечении подписок
+
+_priority: ContextVar[int] = ContextVar("send_priority", default=INTERACTIVE)
+
+# что ограничиваем: отправка и правка сообщений (getUpdates, answerCallbackQuery и т.п. — без лимита)
+_LIMITED_PREFIXES = ("send", "copy", "forward", "edit")
+# управление участниками и инвайты: только общий лимит (per-chat ~20/мин — про сообщения,
+# а все они идут в один TARGET_CHAT_ID и иначе встали бы в очередь друг за другом)
+_CHAT_ADMIN_METHODS = frozenset({"banChatMember", "unbanChatMember", "createChatInviteLink"})
+
+
+@contextmanager
+def send_priority(priority: int) -> Iterator[None]:
+    """Всё, что бот отправит внутри блока (и в задачах, созданных в нём), идёт с этим приоритетом."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def delay(self, now: float) -> float:
+        """Через сколько секунд будет токен (0 — есть сейчас)."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        wait = max(0.0, self.paused_until - now)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+    def pause(self, seconds: float) -> None:
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class _Chat:
+    __slots__ = ("bucket", "lock")
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.bucket = TokenBucket(rate, burst)
+        self.lock = asyncio.Lock()
+
+
+class OutgoingRateLimiter(BaseRequestMiddleware):
+    """
+    Единая очередь исходящих вызовов Bot API (bot.session.middleware):
+      - per-chat token bucket: в личку ~1 сообщение/сек, в группы ~20/мин; в одном чате — по порядку
+      - общий token bucket (~30/сек на бота), токены раздаются по приоритету (send_priority),
+        так что подтверждение оплаты не ждёт за уведомлениями админам, рассылками и киками
+      - ban/unban/createChatInviteLink — только через общий bucket
+      - TelegramRetryAfter: чат (или весь бот, если чата нет) ставится на паузу, запрос повторяется
+    """
+
+    def __init__(
+        self,
+        *,
+        global_rate: float = 30,
+        private_rate: float = 1,
+        group_rate: float = 20 / 60,
+        burst: float = 3,
+        max_retries: int = 3,
+    ) -> None:
+        self._global = TokenBucket(global_rate, global_rate)
+        self._private_rate = private_rate
+        self._group_rate = group_rate
+        self._burst = burst
+        self._max_retries = max_retries
+
+        self._chats: TTLCache[Any, _Chat] = TTLCache(50_000, 600)
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._pump: asyncio.Task | None = None
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Any:
+        api_method = method.__api_method__
+        if api_method in _CHAT_ADMIN_METHODS:
+            chat_id = None
+        elif api_method.startswith(_LIMITED_PREFIXES):
+            chat_id = getattr(method, "chat_id", None)
+        else:
+            return await make_request(bot, method)
+
+        priority = _priority.get()
+
+        for attempt in range(self._max_retries + 1):
+            await self._acquire(chat_id, priority)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt >= self._max_retries:
+                    raise
+                log.warning(
+                    "Flood control on %s (chat %s): retry after %ss",
+                    api_method, getattr(method, "chat_id", None), e.retry_after,
+                )
+                if chat_id is not None:
+                    self._chat(chat_id).bucket.pause(e.retry_after)
+                else:
+                    self._global.pause(e.retry_after)
+
+    # -------- internals --------
+
+    def _chat(self, chat_id: Any) -> _Chat:
+        chat = self._chats.get(chat_id, count=False)
+        if chat is None:
+            private = isinstance(chat_id, int) and chat_id > 0
+            chat = _Chat(self._private_rate if private else self._group_rate, self._burst)
+        self._chats.set(chat_id, chat)
+        return chat
+
+    async def _acquire(self, chat_id: Any, priority: int) -> None:
+        if chat_id is not None:
+            chat = self._chat(chat_id)
+            async with chat.lock:
+                while (delay := chat.bucket.delay(time.monotonic())) > 0:
+                    await asyncio.sleep(delay)
+                chat.bucket.take()
+        await self._acquire_global(priority)
+
+    async def _acquire_global(self, priority: int) -> None:
+        if not self._waiters and self._global.delay(time.monotonic()) == 0:
+            self._global.take()
+            return
+
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+        if self._pump is None or self._pump.done():
+            self._pump = asyncio.get_running_loop().create_task(self._run_pump())
+        await fut
+
+    async def _run_pump(self) -> None:
+        # раздаём общие токены ожидающим строго по (приоритет, очередь)
+        while self._waiters:
+            delay = self._global.delay(time.monotonic())
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            _, _, fut = heapq.heappop(self._waiters)
+            if fut.done():  # ожидающего отменили
+                continue
+            self._global.take()
+            fut.set_result(None)
@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, User
+
+
+class _Shard:
+    __slots__ = ("lock", "users")
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        self.users = 0  # сколько апдейтов этого пользователя сейчас в работе или в очереди
+
+
+class UserShardMiddleware(BaseMiddleware):
+    """
+    Outer-middleware на dp.update: апдейты одного пользователя обрабатываются строго
+    по очереди (asyncio.Lock отпускает ожидающих в порядке прихода), разные пользователи —
+    параллельно, но не больше concurrency одновременно.
+
+    Двойной тап по кнопке оплаты больше не создаёт два заказа параллельно,
+    а слот общего лимита занимает только тот апдейт, чья очередь подошла.
+    """
+
+    def __init__(self, concurrency: int = 100) -> None:
+        self._slots = asyncio.Semaphore(max(1, concurrency))
+        self._shards: dict[int, _Shard] = {}
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user: User | None = data.get("event_from_user")
+        if user is None:
+            async with self._slots:
+                return await handler(event, data)
+
+        shard = self._shards.get(user.id)
+        if shard is None:
+            shard = self._shards[user.id] = _Shard()
+        shard.users += 1
+        try:
+            async with shard.lock:
+                async with self._slots:
+                    return await handler(event, data)
+        finally:
+            shard.users -= 1
+            if not shard.users:
+                del self._shards[user.id]
+
+    def __len__(self) -> int:
+        return len(self._shards)
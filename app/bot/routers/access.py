@@ -8,6 +8,7 @@ from ..keyboards.tariffs import tariffs_kb
 from ..keyboards.confirm import confirm_kb
 from ..keyboards.pay_method import pay_method_kb
 from ..data_tariffs import TARIFFS
+from ..services.payments.factory import available_providers
 from ..utils.message_cleanup import replace_screen
 
 
@@ -75,7 +76,7 @@ async def confirm_yes(call: CallbackQuery, state: FSMContext) -> None:
         message=call.message,
         text=text,
         photo_path="assets/images/pay_method.jpg",
-        reply_markup=pay_method_kb(tariff_code),
+        reply_markup=pay_method_kb(tariff_code, available_providers()),
     )
 
 
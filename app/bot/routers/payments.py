@@ -10,11 +10,13 @@ from aiogram.types import CallbackQuery
 from ..callbacks import PayMethodCb, OrderCb, MenuCb
 from ..data_tariffs import TARIFFS
 from ..keyboards.order import order_kb
+from ..keyboards.pay_method import pay_method_kb
 from ..utils.message_cleanup import replace_screen
 from ..config import Settings
 
-from ..services.payments.factory import get_provider
-from ..services.orders import create_order, cancel_order, attach_invoice
+from ..services.orders import checkout, cancel_order
+from ..services.payments.factory import available_providers
+from ..services.payments.http import ProviderUnavailable
 
 
 router = Router()
@@ -50,17 +52,21 @@ async def start_payment(call: CallbackQuery, callback_data: PayMethodCb) -> None
 
     tariff = TARIFFS[callback_data.tariff]
 
-    order = await create_order(
-        user_id=call.from_user.id,
-        tariff_code=tariff.code,
-        price_rub=tariff.price_rub,
-        provider=callback_data.provider,
-    )
-
-    provider = get_provider(callback_data.provider)
-    invoice = await provider.create_invoice(order_id=order.id, amount_rub=order.price_rub)
-
-    await attach_invoice(order.id, provider_invoice_id=invoice.invoice_id, pay_url=invoice.pay_url)
+    try:
+        order, invoice = await checkout(
+            user_id=call.from_user.id,
+            tariff_code=tariff.code,
+            price_rub=tariff.price_rub,
+            provider_name=callback_data.provider,
+        )
+    except ProviderUnavailable:
+        await replace_screen(
+            message=call.message,
+            text="⚠️ *Этот способ оплаты временно недоступен.*\n\n💳 Выберите другой:",
+            photo_path="assets/images/pay_method.jpg",
+            reply_markup=pay_method_kb(tariff.code, available_providers()),
+        )
+        return
 
     now_str = datetime.now().strftime("%Y-%m-%d %H:%M")
 
@@ -42,20 +42,24 @@ async def create_one_time_invite(
     return InviteResult(url=invite.invite_link, expires_at=expires_at)
 
 
-async def kick_user(bot: Bot, chat_id: int, user_id: int) -> None:
+async def kick_user(bot: Bot, chat_id: int, user_id: int) -> bool:
     """
     Кикаем пользователя из чата/канала.
     Делается бан+разбан, чтобы:
       - пользователь сразу вылетел
       - и мог снова зайти ТОЛЬКО по новой оплате/новой ссылке
+    False — не получилось (ошибка уже в логе): повторять целиком, бан+разбан идемпотентны.
     """
     try:
         await bot.ban_chat_member(chat_id=chat_id, user_id=user_id)
     except Exception:
         log.exception("Failed to ban user %s in chat %s", user_id, chat_id)
+        return False
 
     # unban чтобы не оставлять вечный бан
     try:
         await bot.unban_chat_member(chat_id=chat_id, user_id=user_id)
     except Exception:
-        log.exception("Failed to unban user %s in chat %s", user_id, chat_id)
\ No newline at end of file
+        log.exception("Failed to unban user %s in chat %s", user_id, chat_id)
+        return False
+    return True
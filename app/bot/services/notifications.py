@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+
+from aiogram import Bot
+
+from ..config import Settings
+from ..db.repo import Order, Subscription
+from ..middlewares.outgoing import ADMIN, send_priority
+
+log = logging.getLogger(__name__)
+
+
+def _format_payment(order: Order, sub: Subscription) -> str:
+    return (
+        "✅ *Оплата получена!*\n\n"
+        f"👤 *User ID:* {order.user_id}\n"
+        f"🧾 *Заказ:* `{order.id}`\n"
+        f"💰 *Сумма:* {order.price_rub}₽\n"
+        f"🏷️ *Тариф:* {order.tariff_code}\n"
+        f"💳 *Провайдер:* `{order.provider.upper()}`\n"
+        f"📌 *Subscription:* `{sub.id}`\n"
+    )
+
+
+def _format_digest(items: list[tuple[Order, Subscription]]) -> str:
+    total = sum(order.price_rub for order, _ in items)
+    lines = [
+        f"• `{order.id}` — {order.user_id} — {order.price_rub}₽ — {order.tariff_code} — `{order.provider.upper()}`"
+        for order, _ in items
+    ]
+    return f"✅ *Оплаты:* {len(items)} шт. на {total}₽\n\n" + "\n".join(lines)
+
+
+class AdminNotifier:
+    """
+    Уведомления админам об оплатах — вне критического пути выдачи доступа:
+    notify_paid() только ставит отправку в фон, всем админам шлём параллельно
+    (лимиты и приоритет ADMIN — в OutgoingRateLimiter).
+
+    Digest (digest_size > 1): копим оплаты и шлём одно сводное сообщение на админа,
+    как только набралось digest_size или прошло digest_seconds с первой оплаты в пачке.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        admin_ids: list[int],
+        *,
+        digest_size: int = 0,
+        digest_seconds: float = 30,
+    ) -> None:
+        self._bot = bot
+        self._admin_ids = admin_ids
+        self._digest_size = digest_size
+        self._digest_seconds = digest_seconds
+
+        self._pending: list[tuple[Order, Subscription]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+    @property
+    def digest(self) -> bool:
+        return self._digest_size > 1
+
+    def notify_paid(self, order: Order, sub: Subscription) -> None:
+        if not self._admin_ids:
+            return
+        if not self.digest:
+            self._spawn(_format_payment(order, sub), order.id)
+            return
+
+        self._pending.append((order, sub))
+        if len(self._pending) >= self._digest_size:
+            self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self._digest_seconds, self.flush)
+
+    def flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        items, self._pending = self._pending, []
+        if not items:
+            return
+        if len(items) == 1:
+            self._spawn(_format_payment(*items[0]), items[0][0].id)
+        else:
+            self._spawn(_format_digest(items), ", ".join(order.id for order, _ in items))
+
+    async def stop(self) -> None:
+        # недособранный digest отправляем сразу и ждём всё, что в полёте
+        self.flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _spawn(self, text: str, orders: str) -> None:
+        task = asyncio.get_running_loop().create_task(self._send_all(text, orders))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send_all(self, text: str, orders: str) -> None:
+        with send_priority(ADMIN):
+            results = await asyncio.gather(
+                *(self._bot.send_message(admin_id, text) for admin_id in self._admin_ids),
+                return_exceptions=True,
+            )
+        for admin_id, result in zip(self._admin_ids, results):
+            if isinstance(result, BaseException):
+                log.error("Failed to notify admin %s about paid order(s) %s", admin_id, orders, exc_info=result)
+
+
+_notifier: AdminNotifier | None = None
+
+
+def start_admin_notifier(bot: Bot, settings: Settings) -> AdminNotifier:
+    global _notifier
+    if _notifier is None:
+        _notifier = AdminNotifier(
+            bot,
+            settings.admin_ids,
+            digest_size=settings.ADMIN_DIGEST_SIZE,
+            digest_seconds=settings.ADMIN_DIGEST_SECONDS,
+        )
+    return _notifier
+
+
+async def stop_admin_notifier() -> None:
+    global _notifier
+    notifier, _notifier = _notifier, None
+    if notifier is not None:
+        await notifier.stop()
+
+
+def notify_admins_paid(bot: Bot, settings: Settings, order: Order, sub: Subscription) -> None:
+    """Не ждёт отправки. Без запущенного нотифаера (скрипты, тесты) — создаёт его лениво."""
+    start_admin_notifier(bot, settings).notify_paid(order, sub)
@@ -1,32 +1,130 @@
 from __future__ import annotations
 
+import logging
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
 from ..config import Settings
 from ..db.repo import Order as OrderModel
 from ..db import repo
+from ..jobs.scheduler import ORDER, notify_deadline
+from ..utils.cache import TTLCache
+from .payments.base import Invoice
+from .payments.factory import get_provider
 
+log = logging.getLogger(__name__)
 
-async def create_order(user_id: int, tariff_code: str, price_rub: int, provider: str) -> OrderModel:
-    settings = Settings()
-    return await repo.create_order(
-        db_path=settings.db_path_abs,
-        user_id=user_id,
-        tariff_code=tariff_code,
-        price_rub=price_rub,
-        provider=provider,
-        ttl_minutes=settings.ORDER_TTL_MINUTES,
-    )
+# повторно показываем заказ, только если на оплату остаётся хотя бы столько
+REUSE_MIN_REMAINING = timedelta(minutes=1)
+
+# (user_id, tariff_code, provider) -> (order_id, Invoice): последний выставленный инвойс,
+# с полями, которых нет в orders (QR, срок от провайдера). Кэш на процесс, см. _find_reusable_checkout
+_recent_checkouts: TTLCache[tuple[int, str, str], tuple[str, Invoice]] = TTLCache(10_000, 3600)
 
 
-async def attach_invoice(order_id: str, provider_invoice_id: str, pay_url: str) -> None:
+async def checkout(
+    user_id: int,
+    tariff_code: str,
+    price_rub: int,
+    provider_name: str,
+) -> tuple[OrderModel, Invoice]:
+    """
+    Заказ + инвойс за один внешний запрос и один коммит:
+      1) order_id генерируем заранее (CactusPay использует его как invoice_id)
+      2) создаём инвойс у провайдера — БД в это время не трогаем и writer не держим
+      3) пишем заказ сразу с provider_invoice_id/pay_url одной транзакцией
+
+    Если провайдер упал — в БД ничего не осталось, откатывать нечего.
+    Если упала запись в БД — отменяем уже созданный инвойс (компенсация).
+    """
     settings = Settings()
-    await repo.update_order_payment(
-        db_path=settings.db_path_abs,
-        order_id=order_id,
-        provider_invoice_id=provider_invoice_id,
-        pay_url=pay_url,
+
+    reused = await _find_reusable_checkout(settings, user_id, tariff_code, price_rub, provider_name)
+    if reused is not None:
+        return reused
+
+    provider = get_provider(provider_name)
+    order_id = repo.new_order_id()
+
+    invoice = await provider.create_invoice(order_id=order_id, amount_rub=price_rub)
+
+    try:
+        order = await repo.create_order(
+            db_path=settings.db_path_abs,
+            user_id=user_id,
+            tariff_code=tariff_code,
+            price_rub=price_rub,
+            provider=provider_name,
+            ttl_minutes=settings.ORDER_TTL_MINUTES,
+            order_id=order_id,
+            provider_invoice_id=invoice.invoice_id,
+            pay_url=invoice.pay_url,
+        )
+    except Exception:
+        log.exception("Failed to save order %s, cancelling invoice %s", order_id, invoice.invoice_id)
+        try:
+            await provider.cancel(invoice.invoice_id)
+        except Exception:
+            log.exception("Failed to cancel invoice %s", invoice.invoice_id)
+        raise
+
+    notify_deadline(ORDER, order.expires_at)
+    _recent_checkouts.set((user_id, tariff_code, provider_name), (order.id, invoice))
+    return order, invoice
+
+
+async def _find_reusable_checkout(
+    settings: Settings,
+    user_id: int,
+    tariff_code: str,
+    price_rub: int,
+    provider_name: str,
+) -> tuple[OrderModel, Invoice] | None:
+    """
+    Пользователь вернулся назад и выбрал то же самое — показываем уже выставленный инвойс,
+    а не создаём новый заказ и инвойс у провайдера.
+    Из памяти — точечная проверка по PK (заказ могли оплатить/отменить в другом воркере),
+    иначе — поиск по индексу idx_orders_checkout_reuse.
+    Параллельных дублей нет только в пределах процесса: апдейты одного пользователя идут
+    по очереди (UserShardMiddleware), а кэш у каждого процесса свой. При нескольких воркерах
+    два одновременных нажатия могут попасть в разные и выставить два инвойса — оба заказа
+    валидны, лишний истечёт по дедлайну; БД от этого не защищает.
+    """
+    key = (user_id, tariff_code, provider_name)
+    not_before = datetime.utcnow() + REUSE_MIN_REMAINING
+
+    cached = _recent_checkouts.get(key)
+    if cached is not None:
+        order_id, invoice = cached
+        order = await repo.get_created_order_by_id(settings.db_path_abs, order_id)
+        if order is not None and order.price_rub == price_rub and order.expires_at > not_before.isoformat():
+            log.info("Reusing order %s for user %s (%s)", order.id, user_id, provider_name)
+            return order, invoice
+        _recent_checkouts.pop(key)
+
+    order = await repo.get_reusable_order(
+        settings.db_path_abs,
+        user_id,
+        tariff_code,
+        provider_name,
+        price_rub,
+        not_before.isoformat(),
+    )
+    if order is None:
+        return None
+
+    expires_at = datetime.fromisoformat(order.expires_at).replace(tzinfo=timezone.utc)
+    invoice = Invoice(
+        invoice_id=str(order.provider_invoice_id),
+        pay_url=str(order.pay_url),
+        pay_until=format_datetime(expires_at),
+        pay_until_timestamp=int(expires_at.timestamp()),
     )
+    _recent_checkouts.set(key, (order.id, invoice))
+    log.info("Reusing order %s for user %s (%s)", order.id, user_id, provider_name)
+    return order, invoice
 
 
 async def cancel_order(order_id: str) -> None:
     settings = Settings()
-    await repo.set_order_status(settings.db_path_abs, order_id, "canceled")
\ No newline at end of file
+    await repo.set_order_status(settings.db_path_abs, order_id, "canceled")
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Protocol
+from typing import Iterable, Protocol, runtime_checkable
 
 
 @dataclass(frozen=True)
@@ -26,4 +26,24 @@ class PaymentProvider(Protocol):
         ...
 
     async def cancel(self, invoice_id: str) -> None:
-        ...
\ No newline at end of file
+        ...
+
+    async def close(self) -> None:
+        """Закрыть HTTP-сессию провайдера (shutdown)."""
+        ...
+
+    @property
+    def healthy(self) -> bool:
+        """False, пока провайдер недавно падал (circuit breaker открыт)."""
+        ...
+
+
+@runtime_checkable
+class SupportsBatchStatus(Protocol):
+    """
+    Провайдер умеет проверять статусы пачкой (например, CryptoBot getInvoices).
+    """
+
+    async def check_status_many(self, invoice_ids: Iterable[str]) -> dict[str, str]:
+        """invoice_id -> created/paid/expired/canceled"""
+        ...
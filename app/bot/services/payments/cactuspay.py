@@ -7,9 +7,13 @@ import aiohttp
 
 from ...config import Settings
 from .base import Invoice
+from .http import ProviderGuard, ProviderHTTPError, new_session
 
 log = logging.getLogger(__name__)
 
+# безопасно повторять при сетевых сбоях (только чтение статуса)
+IDEMPOTENT_METHODS = frozenset({"get"})
+
 
 class CactusPayProvider:
     """
@@ -28,7 +32,10 @@ class CactusPayProvider:
     def __init__(self) -> None:
         self._settings = Settings()
         self._token = self._settings.CACTUSPAY_API_KEY.strip()
-        self._timeout = aiohttp.ClientTimeout(total=20)
+        # connect — быстро понять, что хост недоступен; sock_read — ждать ответ API
+        self._timeout = aiohttp.ClientTimeout(total=20, connect=5, sock_read=15)
+        self._session: aiohttp.ClientSession | None = None
+        self._guard = ProviderGuard(self.name)
         self._base = "https://lk.cactuspay.pro/api/?method="
 
         if not self._token:
@@ -119,17 +126,37 @@ class CactusPayProvider:
         except Exception:
             log.exception("CactusPay cancel error (ignored)")
 
+    @property
+    def healthy(self) -> bool:
+        return self._guard.healthy
+
+    async def close(self) -> None:
+        session, self._session = self._session, None
+        if session is not None and not session.closed:
+            await session.close()
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # одна keep-alive сессия на провайдера, создаётся лениво (нужен запущенный loop)
+        if self._session is None or self._session.closed:
+            self._session = new_session(self._timeout)
+        return self._session
+
     async def _post_json(self, method: str, payload: dict[str, Any]) -> dict[str, Any]:
+        return await self._guard.call(
+            lambda: self._post_json_once(method, payload),
+            idempotent=method in IDEMPOTENT_METHODS,
+        )
+
+    async def _post_json_once(self, method: str, payload: dict[str, Any]) -> dict[str, Any]:
         url = f"{self._base}{method}"
         headers = {"Accept": "application/json", "Content-Type": "application/json"}
 
-        async with aiohttp.ClientSession(timeout=self._timeout) as session:
-            async with session.post(url, json=payload, headers=headers) as r:
-                text = await r.text()
-                if r.status >= 400:
-                    raise RuntimeError(f"CactusPay HTTP {r.status}: {text}")
+        async with self._get_session().post(url, json=payload, headers=headers) as r:
+            text = await r.text()
+            if r.status >= 400:
+                raise ProviderHTTPError(r.status, f"CactusPay HTTP {r.status}: {text}")
 
-                try:
-                    return await r.json()
-                except Exception as e:
-                    raise RuntimeError(f"CactusPay invalid JSON: {text}") from e
\ No newline at end of file
+            try:
+                return await r.json()
+            except Exception as e:
+                raise RuntimeError(f"CactusPay invalid JSON: {text}") from e
\ No newline at end of file
@@ -1,15 +1,24 @@
 from __future__ import annotations
 
+import hashlib
+import hmac
 import logging
-from typing import Any
+from typing import Any, Iterable
 
 import aiohttp
 
 from ...config import Settings
 from .base import Invoice
+from .http import ProviderGuard, ProviderHTTPError, new_session
 
 log = logging.getLogger(__name__)
 
+# getInvoices: count <= 1000
+MAX_INVOICES_PER_REQUEST = 1000
+
+# безопасно повторять при сетевых сбоях (не создают/не меняют инвойсы)
+IDEMPOTENT_METHODS = frozenset({"getInvoices"})
+
 
 class CryptoBotProvider:
     """
@@ -31,7 +40,12 @@ class CryptoBotProvider:
             log.warning("CRYPTOBOT_TOKEN is empty — CryptoBotProvider will not work")
 
         self._base = "https://pay.crypt.bot/api/"
-        self._timeout = aiohttp.ClientTimeout(total=15)
+        # ключ подписи вебхуков: SHA-256 от токена, считаем один раз
+        self._webhook_key = hashlib.sha256(self._token.encode("utf-8")).digest()
+        # connect — быстро понять, что хост недоступен; sock_read — ждать ответ API
+        self._timeout = aiohttp.ClientTimeout(total=15, connect=5, sock_read=10)
+        self._session: aiohttp.ClientSession | None = None
+        self._guard = ProviderGuard(self.name)
 
         # можно ограничить активы, которые примешь
         self._accepted_assets = "USDT,TON,BTC,ETH,LTC,BNB,TRX,USDC"
@@ -81,9 +95,43 @@ class CryptoBotProvider:
         if not invoices:
             return "created"
 
-        inv = invoices[0]
-        status = (inv.get("status") or "").lower()
+        return self._map_status(invoices[0].get("status"))
 
+    async def check_status_many(self, invoice_ids: Iterable[str]) -> dict[str, str]:
+        """
+        Статусы пачкой: getInvoices принимает invoice_ids через запятую.
+        Делим на чанки по MAX_INVOICES_PER_REQUEST — тысячи инвойсов = единицы запросов.
+        Инвойсы, которых нет в ответе, считаем "created".
+        """
+        ids = list(dict.fromkeys(str(i) for i in invoice_ids if i))
+        statuses = {invoice_id: "created" for invoice_id in ids}
+
+        for start in range(0, len(ids), MAX_INVOICES_PER_REQUEST):
+            chunk = ids[start:start + MAX_INVOICES_PER_REQUEST]
+            data = await self._post(
+                "getInvoices",
+                {"invoice_ids": ",".join(chunk), "count": len(chunk)},
+            )
+            for inv in (data.get("result") or {}).get("items") or []:
+                invoice_id = str(inv.get("invoice_id"))
+                if invoice_id in statuses:
+                    statuses[invoice_id] = self._map_status(inv.get("status"))
+
+        return statuses
+
+    def verify_webhook(self, raw_body: bytes, signature: str | None) -> bool:
+        """
+        Заголовок crypto-pay-api-signature = hex(HMAC-SHA256(key=SHA256(token), msg=raw body)).
+        Проверяется локально, без запроса к API.
+        """
+        if not self._token or not signature:
+            return False
+        expected = hmac.new(self._webhook_key, raw_body, hashlib.sha256).hexdigest()
+        return hmac.compare_digest(expected, signature.strip().lower())
+
+    @staticmethod
+    def _map_status(raw: str | None) -> str:
+        status = (raw or "").lower()
         if status == "paid":
             return "paid"
         if status == "expired":
@@ -99,10 +147,31 @@ class CryptoBotProvider:
         except Exception:
             log.exception("CryptoBot deleteInvoice failed (ignored), invoice_id=%s", invoice_id)
 
+    @property
+    def healthy(self) -> bool:
+        return self._guard.healthy
+
+    async def close(self) -> None:
+        session, self._session = self._session, None
+        if session is not None and not session.closed:
+            await session.close()
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # одна keep-alive сессия на провайдера, создаётся лениво (нужен запущенный loop)
+        if self._session is None or self._session.closed:
+            self._session = new_session(self._timeout)
+        return self._session
+
     async def _post(self, method: str, payload: dict[str, Any]) -> dict[str, Any]:
         if not self._token:
             raise RuntimeError("CRYPTOBOT_TOKEN is not set")
 
+        return await self._guard.call(
+            lambda: self._post_once(method, payload),
+            idempotent=method in IDEMPOTENT_METHODS,
+        )
+
+    async def _post_once(self, method: str, payload: dict[str, Any]) -> dict[str, Any]:
         url = f"{self._base}{method}"
         headers = {
             "Accept": "application/json",
@@ -110,16 +179,15 @@ class CryptoBotProvider:
             "Crypto-Pay-API-Token": self._token,
         }
 
-        async with aiohttp.ClientSession(timeout=self._timeout) as session:
-            async with session.post(url, json=payload, headers=headers) as r:
-                text = await r.text()
-                if r.status >= 400:
-                    raise RuntimeError(f"CryptoBot HTTP {r.status}: {text}")
+        async with self._get_session().post(url, json=payload, headers=headers) as r:
+            text = await r.text()
+            if r.status >= 400:
+                raise ProviderHTTPError(r.status, f"CryptoBot HTTP {r.status}: {text}")
 
-                try:
-                    data = await r.json()
-                except Exception as e:
-                    raise RuntimeError(f"CryptoBot invalid JSON: {text}") from e
+            try:
+                data = await r.json()
+            except Exception as e:
+                raise RuntimeError(f"CryptoBot invalid JSON: {text}") from e
 
         if not data.get("ok", False):
             raise RuntimeError(f"CryptoBot API error: {data.get('error') or data}")
@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import logging
+
+from aiogram import Bot
+
+from ...config import Settings
+from ...db import repo
+from .factory import get_provider
+from .fulfill import fulfill_paid_order, resume_delivery
+
+log = logging.getLogger(__name__)
+
+
+async def _find_payable_order_by_id(settings: Settings, order_id: str):
+    return await repo.get_payable_order_by_id(settings.db_path_abs, str(order_id))
+
+
+async def _find_payable_order_by_invoice(settings: Settings, provider: str, invoice_id: str):
+    order = await repo.get_order_by_provider_invoice(settings.db_path_abs, provider, str(invoice_id))
+    if order is None or order.status not in repo.PAYABLE_ORDER_STATUSES:
+        return None
+    return order
+
+
+async def process_payment_event(bot: Bot, settings: Settings, item: repo.OutboxItem) -> str:
+    """
+    Обработка события оплаты из outbox (то, что раньше делал webhook прямо в запросе).
+    Возвращает итог для outbox.result; исключение => попытка неудачная, будет ретрай.
+    Новый итог нужно добавить в FINAL_RESULTS или PENDING_RESULTS (jobs/outbox.py).
+    """
+    # это событие уже выиграло claim, но процесс упал до отправки — доводим выдачу
+    if item.claimed_order_id:
+        await resume_delivery(bot, settings, item.claimed_order_id)
+        return "paid_processed"
+
+    if item.provider == "cactus":
+        return await _process_cactus(bot, settings, item)
+    if item.provider == "crypto":
+        return await _process_crypto(bot, settings, item)
+
+    log.warning("Unknown provider in outbox item %s: %s", item.id, item.provider)
+    return "unknown_provider"
+
+
+async def _fulfill(bot: Bot, settings: Settings, order, item: repo.OutboxItem) -> str:
+    if not order:
+        return "already_processed_or_not_found"
+    if not await fulfill_paid_order(bot, settings, order, outbox_id=item.id):
+        return "already_processed_or_not_found"
+    return "paid_processed"
+
+
+async def _process_cactus(bot: Bot, settings: Settings, item: repo.OutboxItem) -> str:
+    order_id = str(item.payload.get("order_id") or "")
+
+    # По доке: после webhook обязательно проверить статус через API /get => ACCEPT/WAIT
+    provider = get_provider("cactus")
+    status = await provider.check_status(order_id)  # должен вернуть "paid" если ACCEPT
+    if status != "paid":
+        return status
+
+    order = await _find_payable_order_by_id(settings, order_id)
+    return await _fulfill(bot, settings, order, item)
+
+
+async def _process_crypto(bot: Bot, settings: Settings, item: repo.OutboxItem) -> str:
+    order_id = str(item.payload.get("order_id") or "")
+    invoice_id = str(item.payload.get("invoice_id") or "")
+    provider = get_provider("crypto")
+
+    # статус из подписанного вебхука: кладём в кэш single-flight, и check_status ниже
+    # отдаст его без похода в getInvoices (для терминальных статусов)
+    signed_status = item.payload.get("signed_status")
+    if signed_status and invoice_id:
+        provider.remember(invoice_id, signed_status)
+
+    # Если в payload есть order_id — ищем по order.id и проверяем статус по сохраненному invoice_id
+    if order_id:
+        order = await _find_payable_order_by_id(settings, order_id)
+        if not order:
+            return "already_processed_or_not_found"
+
+        if not order.provider_invoice_id:
+            return "order_missing_invoice_id"
+
+        status = await provider.check_status(order.provider_invoice_id)
+        if status != "paid":
+            return status
+
+        return await _fulfill(bot, settings, order, item)
+
+    # Иначе — работаем по invoice_id
+    status = await provider.check_status(invoice_id)
+    if status != "paid":
+        return status
+
+    order = await _find_payable_order_by_invoice(settings, "crypto", invoice_id)
+    return await _fulfill(bot, settings, order, item)
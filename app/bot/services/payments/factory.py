@@ -1,13 +1,19 @@
 from __future__ import annotations
 
+import logging
+
 from .base import PaymentProvider
 from .cryptobot import CryptoBotProvider
 from .cactuspay import CactusPayProvider
+from .singleflight import single_flight
+
+log = logging.getLogger(__name__)
 
 
+# check_status у всех провайдеров идёт через single-flight + кэш терминальных статусов
 _providers: dict[str, PaymentProvider] = {
-    "crypto": CryptoBotProvider(),
-    "cactus": CactusPayProvider(),
+    "crypto": single_flight(CryptoBotProvider()),
+    "cactus": single_flight(CactusPayProvider()),
 }
 
 
@@ -15,3 +21,24 @@ def get_provider(name: str) -> PaymentProvider:
     if name not in _providers:
         raise ValueError(f"Unknown provider: {name}")
     return _providers[name]
+
+
+def all_providers() -> list[PaymentProvider]:
+    return list(_providers.values())
+
+
+def available_providers() -> list[str]:
+    """
+    Провайдеры, которые сейчас можно предлагать пользователю.
+    Если нездоровы все — отдаём всех: пусть лучше упадёт конкретный запрос, чем пустое меню.
+    """
+    healthy = [name for name, p in _providers.items() if p.healthy]
+    return healthy or list(_providers)
+
+
+async def close_providers() -> None:
+    for provider in _providers.values():
+        try:
+            await provider.close()
+        except Exception:
+            log.exception("Failed to close provider %s", provider.name)
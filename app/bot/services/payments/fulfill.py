@@ -1,56 +1,25 @@
 from __future__ import annotations
 
-import os
 import logging
 from datetime import datetime
 from zoneinfo import ZoneInfo
 
 from aiogram import Bot
-from aiogram.types import FSInputFile, InlineKeyboardButton, InlineKeyboardMarkup
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 
 from ...config import Settings
 from ...db import repo
 from ...data_tariffs import TARIFFS
+from ...utils.message_cleanup import show_screen
+from ...middlewares.outgoing import PAYMENT, send_priority
 from ..access.invites import create_one_time_invite
+from ..notifications import notify_admins_paid
 from ...callbacks import MenuCb
+from ...jobs.scheduler import SUBSCRIPTION, notify_deadline
 
 log = logging.getLogger(__name__)
 
 
-async def _send_screen(
-    bot: Bot,
-    settings: Settings,
-    user_id: int,
-    text: str,
-    *,
-    photo_path: str | None = None,
-    reply_markup: InlineKeyboardMarkup | None = None,
-) -> None:
-    try:
-        last_chat_id, last_msg_id = await repo.get_last_screen(settings.db_path_abs, user_id)
-        if last_chat_id and last_msg_id:
-            await bot.delete_message(chat_id=last_chat_id, message_id=last_msg_id)
-    except Exception:
-        pass
-
-    abs_photo_path = settings.assets_path(photo_path) if photo_path else None
-
-    if abs_photo_path and os.path.exists(abs_photo_path):
-        sent = await bot.send_photo(
-            chat_id=user_id,
-            photo=FSInputFile(abs_photo_path),
-            caption=text,
-            reply_markup=reply_markup,
-        )
-    else:
-        sent = await bot.send_message(chat_id=user_id, text=text, reply_markup=reply_markup)
-
-    try:
-        await repo.set_last_screen(settings.db_path_abs, user_id, sent.chat.id, sent.message_id)
-    except Exception:
-        pass
-
-
 def _join_kb(invite_url: str) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(
         inline_keyboard=[
@@ -66,39 +35,67 @@ def _fmt_local(settings: Settings, iso_utc_naive: str) -> str:
     return dt.astimezone(tz).strftime("%Y-%m-%d %H:%M")
 
 
-async def fulfill_paid_order(bot: Bot, settings: Settings, order) -> None:
-    # защита от дублей: если уже не created — ничего не делаем
-    if getattr(order, "status", "created") != "created":
-        return
+async def fulfill_paid_order(bot: Bot, settings: Settings, order, *, outbox_id: int | None = None) -> bool:
+    """
+    Выдаёт доступ по оплаченному заказу (в том числе уже истёкшему: оплата пришла после дедлайна).
+    Возвращает True, если именно этот вызов выиграл claim и выполнил выдачу;
+    False — если заказ уже обработан кем-то другим (дубль вебхука, другой воркер).
 
-    await repo.mark_order_paid(settings.db_path_abs, order.id)
+    outbox_id — событие outbox, от имени которого идёт выдача (см. repo.claim_order_paid).
+    """
+    # быстрый выход по in-memory статусу; настоящая защита от дублей — claim в БД
+    if getattr(order, "status", "created") not in repo.PAYABLE_ORDER_STATUSES:
+        return False
 
     now_utc = datetime.utcnow()
     tariff = TARIFFS.get(order.tariff_code)
     if not tariff:
         log.warning("Unknown tariff_code=%s for order=%s", order.tariff_code, order.id)
-        return
+        await repo.mark_order_paid(settings.db_path_abs, order.id)
+        return False
 
     ends_at_iso = None
     if tariff.duration is not None:
         ends_at_iso = (now_utc + tariff.duration).isoformat()
 
-    sub = await repo.create_subscription(
-        db_path=settings.db_path_abs,
-        user_id=order.user_id,
-        tariff_code=order.tariff_code,
-        starts_at_iso=now_utc.isoformat(),
+    claimed = await repo.claim_order_paid(
+        settings.db_path_abs,
+        order.id,
+        paid_at_iso=now_utc.isoformat(),
         ends_at_iso=ends_at_iso,
-        order_id=order.id,
-        status="active",
+        outbox_id=outbox_id,
     )
+    if claimed is None:
+        log.info("Order %s already claimed by another worker, skipping", order.id)
+        return False
+
+    order, sub = claimed
+    notify_deadline(SUBSCRIPTION, sub.ends_at)
+
+    await deliver_access(bot, settings, order, sub)
+    return True
 
-    invite = await create_one_time_invite(
-        bot,
-        settings.TARGET_CHAT_ID,
-        ttl_minutes=60,
-        name=f"🔑 Доступ по заказу {order.id}",
-    )
+
+async def resume_delivery(bot: Bot, settings: Settings, order_id: str) -> bool:
+    """
+    Довести выдачу по уже заклеймленному заказу (процесс упал между claim и отправкой).
+    Вызывать только от имени события, которое выиграло claim, иначе будет дубль сообщений.
+    """
+    order = await repo.get_order_by_id(settings.db_path_abs, order_id)
+    sub = await repo.get_subscription_by_order_id(settings.db_path_abs, order_id)
+    if order is None or sub is None:
+        log.warning("Cannot resume delivery for order %s: order or subscription missing", order_id)
+        return False
+
+    await deliver_access(bot, settings, order, sub)
+    return True
+
+
+async def deliver_access(bot: Bot, settings: Settings, order, sub) -> None:
+    """
+    Telegram-часть выдачи: инвайт, экран пользователю, уведомления админам.
+    """
+    ends_at_iso = sub.ends_at
 
     if ends_at_iso:
         period_line = f"⏳ *Доступ до (МСК):* {_fmt_local(settings, ends_at_iso)}\n"
@@ -115,28 +112,24 @@ async def fulfill_paid_order(bot: Bot, settings: Settings, order) -> None:
         "⚠️ Если вы выйдете — потребуется повторная оплата."
     )
 
-    await _send_screen(
-        bot,
-        settings,
-        order.user_id,
-        user_text,
-        photo_path="assets/images/success.jpg",
-        reply_markup=_join_kb(invite.url),
-    )
+    # инвайт и экран — оба вызова выдачи доступа, с приоритетом оплаты
+    with send_priority(PAYMENT):
+        invite = await create_one_time_invite(
+            bot,
+            settings.TARGET_CHAT_ID,
+            ttl_minutes=60,
+            name=f"🔑 Доступ по заказу {order.id}",
+        )
+        await show_screen(
+            bot,
+            settings,
+            order.user_id,
+            order.user_id,
+            user_text,
+            photo_path="assets/images/success.jpg",
+            reply_markup=_join_kb(invite.url),
+            edit=False,  # об оплате — новым сообщением, чтобы пришло уведомление
+        )
 
-    for admin_id in settings.admin_ids:
-        try:
-            await bot.send_message(
-                admin_id,
-                (
-                    "✅ *Оплата получена!*\n\n"
-                    f"👤 *User ID:* {order.user_id}\n"
-                    f"🧾 *Заказ:* `{order.id}`\n"
-                    f"💰 *Сумма:* {order.price_rub}₽\n"
-                    f"🏷️ *Тариф:* {order.tariff_code}\n"
-                    f"💳 *Провайдер:* `{order.provider.upper()}`\n"
-                    f"📌 *Subscription:* `{sub.id}`\n"
-                ),
-            )
-        except Exception:
-            log.exception("Failed to notify admin %s about paid order %s", admin_id, order.id)
\ No newline at end of file
+    # админам — в фоне и параллельно (или сводкой, см. ADMIN_DIGEST_SIZE), выдачу не задерживаем
+    notify_admins_paid(bot, settings, order, sub)
@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable, TypeVar
+
+import aiohttp
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def new_session(
+    timeout: aiohttp.ClientTimeout,
+    *,
+    limit: int = 20,
+    dns_ttl: int = 300,
+    keepalive: float = 30,
+) -> aiohttp.ClientSession:
+    """
+    Долгоживущая сессия провайдера: keep-alive + кэш DNS,
+    чтобы не платить TCP/TLS-хендшейк и резолв на каждом запросе.
+    Создавать только внутри запущенного event loop.
+    """
+    connector = aiohttp.TCPConnector(
+        limit=limit,
+        ttl_dns_cache=dns_ttl,
+        keepalive_timeout=keepalive,
+    )
+    return aiohttp.ClientSession(timeout=timeout, connector=connector)
+
+
+class ProviderHTTPError(RuntimeError):
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+
+    @property
+    def transient(self) -> bool:
+        return self.status == 429 or self.status >= 500
+
+
+class ProviderUnavailable(RuntimeError):
+    """Circuit breaker открыт: провайдер недавно падал, запрос даже не отправляем."""
+
+
+def _is_transient(exc: BaseException) -> bool:
+    if isinstance(exc, ProviderHTTPError):
+        return exc.transient
+    return isinstance(exc, (aiohttp.ClientError, asyncio.TimeoutError))
+
+
+class ProviderGuard:
+    """
+    Устойчивость вызовов к одному провайдеру:
+      - ретраи с экспоненциальной задержкой и jitter — только для идемпотентных вызовов
+      - circuit breaker: после failure_threshold сбоев подряд провайдер считается
+        нездоровым на reset_timeout секунд, запросы падают сразу (ProviderUnavailable);
+        потом пропускаем один пробный запрос (half-open)
+
+    Сбоем считаются только сетевые ошибки, таймауты, HTTP 5xx/429 —
+    ошибки API (неверные параметры и т.п.) здоровье провайдера не портят.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30,
+        retries: int = 2,
+        base_delay: float = 0.2,
+        max_delay: float = 2.0,
+    ) -> None:
+        self.name = name
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._retries = retries
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._probing = False
+
+    @property
+    def healthy(self) -> bool:
+        """False, пока breaker открыт (half-open уже считаем шансом — True)."""
+        if self._opened_at is None:
+            return True
+        return time.monotonic() - self._opened_at >= self._reset_timeout
+
+    async def call(self, fn: Callable[[], Awaitable[T]], *, idempotent: bool = False) -> T:
+        probe = self._acquire()
+        attempts = 1 + (self._retries if idempotent else 0)
+        try:
+            for attempt in range(attempts):
+                try:
+                    result = await fn()
+                except Exception as e:
+                    if not _is_transient(e):
+                        self._on_success()
+                        raise
+                    if attempt + 1 >= attempts:
+                        self._on_failure(e)
+                        raise
+                    await asyncio.sleep(self._backoff(attempt))
+                else:
+                    self._on_success()
+                    return result
+            raise AssertionError("unreachable")
+        finally:
+            if probe:
+                self._probing = False
+
+    def _acquire(self) -> bool:
+        if self._opened_at is None:
+            return False
+        if not self.healthy or self._probing:
+            raise ProviderUnavailable(f"{self.name}: provider temporarily unavailable")
+        self._probing = True
+        return True
+
+    def _backoff(self, attempt: int) -> float:
+        # full jitter: равномерно в [0, base * 2^attempt], но не больше max_delay
+        return random.uniform(0, min(self._max_delay, self._base_delay * (2 ** attempt)))
+
+    def _on_success(self) -> None:
+        if self._opened_at is not None:
+            log.info("Provider %s recovered", self.name)
+        self._failures = 0
+        self._opened_at = None
+
+    def _on_failure(self, exc: BaseException) -> None:
+        self._failures += 1
+        if self._opened_at is not None or self._failures >= self._failure_threshold:
+            if self._opened_at is None:
+                log.warning("Provider %s marked unhealthy after %s failures: %r", self.name, self._failures, exc)
+            self._opened_at = time.monotonic()
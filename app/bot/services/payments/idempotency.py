@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+from ...utils.cache import TTLCache
+
+# последние увиденные события: повторная доставка отбивается из памяти, без I/O.
+# Источник истины — таблица webhook_events; кэш лишь срезает дубли до неё.
+_recent: TTLCache[tuple[str, str], bool] = TTLCache(maxsize=100_000, ttl=24 * 3600)
+
+
+def event_key(provider: str, payload: dict) -> str | None:
+    """
+    Ключ события для журнала идемпотентности.
+      cactus: order_id (он же invoice_id)
+      crypto: invoice_id, иначе order_id из payload инвойса
+    """
+    if provider == "cactus":
+        order_id = str(payload.get("order_id") or "")
+        return order_id or None
+    if provider == "crypto":
+        invoice_id = str(payload.get("invoice_id") or "")
+        if invoice_id:
+            return f"invoice:{invoice_id}"
+        order_id = str(payload.get("order_id") or "")
+        return f"order:{order_id}" if order_id else None
+    return None
+
+
+def seen(provider: str, key: str) -> bool:
+    return _recent.get((provider, key), False)
+
+
+def remember(provider: str, key: str) -> None:
+    _recent.set((provider, key), True)
+
+
+def forget(provider: str, key: str) -> None:
+    _recent.pop((provider, key))
+
+
+def purge_expired() -> int:
+    return _recent.purge_expired()
@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, Iterable
+
+from ...utils.cache import MISSING, TTLCache
+from .base import PaymentProvider, SupportsBatchStatus
+
+log = logging.getLogger(__name__)
+
+# статусы, которые уже не поменяются — их можно отдавать из кэша
+TERMINAL_STATUSES = frozenset({"paid", "expired", "canceled"})
+
+
+class SingleFlightProvider:
+    """
+    Обёртка над провайдером для check_status:
+      - одновременные запросы по одному invoice_id делят один HTTP-вызов (single-flight)
+      - терминальные статусы (paid/expired/canceled) кэшируются с TTL и LRU-вытеснением
+
+    Ретраи вебхуков, реконсайлер и "я оплатил" по одному инвойсу = один запрос к API.
+    Всё остальное проксируется в исходный провайдер как есть.
+    """
+
+    def __init__(self, provider: PaymentProvider, *, ttl: float = 600, maxsize: int = 10_000) -> None:
+        self._provider = provider
+        self.name = provider.name
+        self._terminal: TTLCache[str, str] = TTLCache(maxsize, ttl)
+        self._inflight: dict[str, asyncio.Future[str]] = {}
+
+    def __getattr__(self, item: str) -> Any:
+        return getattr(self._provider, item)
+
+    async def check_status(self, invoice_id: str) -> str:
+        key = str(invoice_id)
+
+        cached = self._terminal.get(key, MISSING)
+        if cached is not MISSING:
+            return cached
+
+        fut = self._inflight.get(key)
+        if fut is None:
+            fut = asyncio.ensure_future(self._fetch(key))
+            self._inflight[key] = fut
+            fut.add_done_callback(lambda _: self._inflight.pop(key, None))
+
+        # shield: отмена одного ожидающего не должна рвать общий запрос
+        return await asyncio.shield(fut)
+
+    def remember(self, invoice_id: str, status: str) -> None:
+        """Положить в кэш статус, полученный другим путём (батч-проверка, подписанный webhook)."""
+        if status in TERMINAL_STATUSES:
+            self._terminal.set(str(invoice_id), status)
+
+    async def _fetch(self, invoice_id: str) -> str:
+        status = await self._provider.check_status(invoice_id)
+        self.remember(invoice_id, status)
+        return status
+
+
+class BatchSingleFlightProvider(SingleFlightProvider):
+    """
+    То же для провайдеров с check_status_many. Метод объявлен явно, а не через __getattr__:
+    isinstance(..., SupportsBatchStatus) (Python 3.12+) смотрит атрибуты статически.
+    """
+
+    async def check_status_many(self, invoice_ids: Iterable[str]) -> dict[str, str]:
+        statuses = await self._provider.check_status_many(invoice_ids)
+        for invoice_id, status in statuses.items():
+            self.remember(invoice_id, status)
+        return statuses
+
+
+def single_flight(provider: PaymentProvider) -> SingleFlightProvider:
+    if isinstance(provider, SupportsBatchStatus):
+        return BatchSingleFlightProvider(provider)
+    return SingleFlightProvider(provider)
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import os
+from typing import Any, Awaitable, Callable
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import FSInputFile, InlineKeyboardMarkup, InputFile, InputMediaPhoto, Message
+
+from ..config import Settings
+from ..db import repo
+
+log = logging.getLogger(__name__)
+
+# abs_path -> (mtime_ns, size, sha256): файл перечитываем, только если он поменялся
+_hashes: dict[str, tuple[int, int, str]] = {}
+# (asset_path, sha256) -> file_id; картинок единицы, поэтому без вытеснения
+_file_ids: dict[tuple[str, str], str] = {}
+
+
+def _sha256_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+async def _content_hash(abs_path: str) -> str:
+    st = os.stat(abs_path)
+    cached = _hashes.get(abs_path)
+    if cached is not None and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+        return cached[2]
+    digest = await asyncio.to_thread(_sha256_file, abs_path)
+    _hashes[abs_path] = (st.st_mtime_ns, st.st_size, digest)
+    return digest
+
+
+def _is_stale_file_id(e: TelegramBadRequest) -> bool:
+    # "wrong file identifier/HTTP URL specified", "wrong remote file identifier", FILE_REFERENCE_EXPIRED ...
+    text = str(e).lower()
+    return "file" in text and ("identifier" in text or "reference" in text or "not found" in text)
+
+
+async def _with_file_id(
+    settings: Settings,
+    photo_path: str,
+    send: Callable[[str | InputFile], Awaitable[Message | bool]],
+) -> Message | bool:
+    """
+    send(photo) по кэшированному file_id.
+    Первый раз (или если Telegram file_id не принял) — загрузка файла, file_id запоминаем в памяти и в БД.
+    """
+    db_path = settings.db_path_abs
+    abs_path = settings.assets_path(photo_path)
+    key = (photo_path, await _content_hash(abs_path))
+
+    file_id = _file_ids.get(key)
+    if file_id is None:
+        file_id = await repo.get_media_file_id(db_path, *key)
+        if file_id is not None:
+            _file_ids[key] = file_id
+
+    if file_id is not None:
+        try:
+            return await send(file_id)
+        except TelegramBadRequest as e:
+            if not _is_stale_file_id(e):
+                raise
+            log.warning("Stale file_id for %s, re-uploading: %s", photo_path, e)
+            _file_ids.pop(key, None)
+            await repo.forget_media_file_id(db_path, *key)
+
+    sent = await send(FSInputFile(abs_path))
+    if isinstance(sent, Message) and sent.photo:
+        # самый крупный размер — тот, что Telegram отдаст при повторной отправке
+        _file_ids[key] = sent.photo[-1].file_id
+        try:
+            await repo.set_media_file_id(db_path, *key, sent.photo[-1].file_id)
+        except Exception:
+            log.exception("Failed to store file_id for %s", photo_path)
+    return sent
+
+
+async def send_photo(
+    bot: Bot,
+    settings: Settings,
+    chat_id: int,
+    photo_path: str,
+    **kwargs: Any,
+) -> Message:
+    """send_photo картинки из assets (photo_path — как в replace_screen: "assets/images/xxx.jpg")."""
+    return await _with_file_id(
+        settings,
+        photo_path,
+        lambda photo: bot.send_photo(chat_id=chat_id, photo=photo, **kwargs),
+    )
+
+
+async def edit_photo(
+    bot: Bot,
+    settings: Settings,
+    chat_id: int,
+    message_id: int,
+    photo_path: str,
+    *,
+    caption: str,
+    reply_markup: InlineKeyboardMarkup | None = None,
+) -> Message | bool:
+    """Заменить картинку и подпись у существующего сообщения с фото (edit_message_media)."""
+    return await _with_file_id(
+        settings,
+        photo_path,
+        lambda photo: bot.edit_message_media(
+            media=InputMediaPhoto(media=photo, caption=caption),
+            chat_id=chat_id,
+            message_id=message_id,
+            reply_markup=reply_markup,
+        ),
+    )
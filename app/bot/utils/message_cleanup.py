@@ -3,10 +3,13 @@ from __future__ import annotations
 import os
 from typing import Optional
 
-from aiogram.types import Message, FSInputFile
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message
 
 from ..config import Settings
-from ..db import repo
+from ..db import user_writes
+from . import media
 
 
 async def replace_screen(
@@ -14,47 +17,144 @@ async def replace_screen(
     text: str,
     photo_path: Optional[str] = None,
     reply_markup=None,
-) -> Message:
+) -> Optional[Message]:
     """
-    Отправляет новый "экран" и удаляет предыдущий (по last_screen_message_id из БД).
+    Показывает новый "экран" вместо предыдущего (last_screen_message_id из БД), см. show_screen.
     photo_path можно передавать как "assets/images/xxx.jpg" — путь будет сделан абсолютным.
     """
-    settings = Settings()
+    # callback по экрану бота: from_user — сам бот, экран ищем по чату (в личке chat.id == user_id)
+    if message.from_user and not message.from_user.is_bot:
+        user_id = message.from_user.id
+    else:
+        user_id = message.chat.id
 
-    user_id = message.from_user.id if message.from_user else message.chat.id
+    return await show_screen(
+        message.bot,
+        Settings(),
+        user_id,
+        message.chat.id,
+        text,
+        photo_path=photo_path,
+        reply_markup=reply_markup,
+        current=message,
+    )
 
-    # 1) удалить прошлый экран
-    try:
-        last_chat_id, last_msg_id = await repo.get_last_screen(settings.db_path_abs, user_id)
-        if last_chat_id and last_msg_id:
-            await message.bot.delete_message(chat_id=last_chat_id, message_id=last_msg_id)
-    except Exception:
-        pass
 
-    # 2) удалить текущее сообщение (если это callback по старому экрану)
+async def show_screen(
+    bot: Bot,
+    settings: Settings,
+    user_id: int,
+    chat_id: int,
+    text: str,
+    *,
+    photo_path: Optional[str] = None,
+    reply_markup=None,
+    current: Optional[Message] = None,
+    edit: bool = True,
+) -> Optional[Message]:
+    """
+    По возможности (edit=True) редактирует прошлый экран на месте (edit_message_media / edit_message_text) —
+    один вызов Bot API. Если нельзя (фото <-> текст, сообщение удалено и т.п.) — удаляет его и шлёт новый.
+    current — сообщение, из-за которого меняем экран (команда или callback); если это не сам экран, удаляем.
+    edit=False — всегда новое сообщение: правка не присылает пользователю уведомление.
+    None — экран уже такой же, ничего не поменялось.
+    """
+    if photo_path and not os.path.exists(settings.assets_path(photo_path)):
+        photo_path = None
+
+    last_chat_id = last_msg_id = None
     try:
-        await message.delete()
+        last_chat_id, last_msg_id = await user_writes.get_last_screen(settings.db_path_abs, user_id)
     except Exception:
         pass
 
-    # 3) отправить новый экран
-    abs_photo_path = None
-    if photo_path:
-        abs_photo_path = settings.assets_path(photo_path)
+    # 1) что редактируем: прошлый экран, а если он неизвестен — сообщение бота, по которому нажали
+    current_key = (current.chat.id, current.message_id) if current is not None else None
+    if last_chat_id and last_msg_id:
+        target = (last_chat_id, last_msg_id)
+    elif current is not None and current.from_user and current.from_user.is_bot:
+        target = current_key
+    else:
+        target = None
+    is_photo = bool(current.photo) if current is not None and target == current_key else None
+
+    # 2) текущее сообщение, если это не сам экран (команда пользователя, callback по старому экрану)
+    if current is not None and target != current_key:
+        try:
+            await current.delete()
+        except Exception:
+            pass
+
+    # 3) редактируем на месте
+    if target is not None and edit:
+        try:
+            edited = await _edit_screen(bot, settings, *target, text, photo_path, reply_markup, is_photo)
+        except TelegramBadRequest as e:
+            if "message is not modified" in str(e):
+                return None
+            edited = None
+        if isinstance(edited, Message):
+            user_writes.set_last_screen(settings.db_path_abs, user_id, edited.chat.id, edited.message_id)
+            return edited
+
+    # не получилось (или нельзя) — удаляем старый экран
+    if target is not None:
+        try:
+            await bot.delete_message(chat_id=target[0], message_id=target[1])
+        except Exception:
+            pass
 
-    if abs_photo_path and os.path.exists(abs_photo_path):
-        sent = await message.answer_photo(
-            photo=FSInputFile(abs_photo_path),
+    # 4) отправить новый экран
+    if photo_path:
+        sent = await media.send_photo(
+            bot,
+            settings,
+            chat_id,
+            photo_path,
             caption=text,
             reply_markup=reply_markup,
         )
     else:
-        sent = await message.answer(text, reply_markup=reply_markup)
+        sent = await bot.send_message(chat_id=chat_id, text=text, reply_markup=reply_markup)
 
-    # 4) сохранить новый экран как последний
-    try:
-        await repo.set_last_screen(settings.db_path_abs, user_id, sent.chat.id, sent.message_id)
-    except Exception:
-        pass
+    # 5) сохранить новый экран как последний (write-behind, без ожидания коммита)
+    user_writes.set_last_screen(settings.db_path_abs, user_id, sent.chat.id, sent.message_id)
+
+    return sent
+
+
+async def _edit_screen(
+    bot: Bot,
+    settings: Settings,
+    chat_id: int,
+    message_id: int,
+    text: str,
+    photo_path: Optional[str],
+    reply_markup,
+    is_photo: Optional[bool],
+) -> Message | bool | None:
+    """
+    Один вызов Bot API вместо delete + send. is_photo — тип сообщения, если известен:
+    заведомо невозможную правку (фото <-> текст) даже не пробуем. None — правка невозможна.
+    """
+    if photo_path:
+        if is_photo is False:
+            return None
+        return await media.edit_photo(
+            bot,
+            settings,
+            chat_id,
+            message_id,
+            photo_path,
+            caption=text,
+            reply_markup=reply_markup,
+        )
 
-    return sent
\ No newline at end of file
+    if is_photo is True:
+        return None
+    return await bot.edit_message_text(
+        text=text,
+        chat_id=chat_id,
+        message_id=message_id,
+        reply_markup=reply_markup,
+    )
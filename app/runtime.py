@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from datetime import timedelta
+from typing import AsyncIterator
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.default import DefaultBotProperties
+
+from .bot.config import Settings
+from .bot.routers import start, access, payments, chat_member
+from .bot.middlewares.outgoing import OutgoingRateLimiter
+from .bot.middlewares.sharding import UserShardMiddleware
+from .bot.db.init_db import init_db
+from .bot.db.connection import open_pool, close_pools
+from .bot.db.user_writes import start_user_writes, stop_user_writes
+from .bot.db.fsm_storage import BoundedMemoryStorage, SQLiteStorage
+from .bot.jobs.scheduler import start_background_jobs, stop_background_jobs
+from .bot.jobs.reconciler import start_reconciler, stop_reconciler
+from .bot.jobs.outbox import start_outbox_workers, stop_outbox_workers
+from .bot.services.notifications import start_admin_notifier, stop_admin_notifier
+from .bot.services.payments.factory import close_providers
+
+log = logging.getLogger(__name__)
+
+# сколько ждём недообработанные webhook-апдейты при остановке
+UPDATES_DRAIN_TIMEOUT = 10
+
+
+def build_storage(settings: Settings) -> SQLiteStorage | BoundedMemoryStorage:
+    mode = settings.FSM_STORAGE.strip().lower()
+    if mode == "sqlite":
+        return SQLiteStorage(
+            settings.db_path_abs,
+            cache_size=settings.FSM_CACHE_SIZE,
+            cache_ttl=settings.FSM_CACHE_TTL,
+            state_ttl=timedelta(hours=settings.FSM_STATE_TTL_HOURS),
+        )
+    if mode == "memory":
+        return BoundedMemoryStorage(
+            max_entries=settings.FSM_CACHE_SIZE,
+            idle_ttl=settings.FSM_STATE_TTL_HOURS * 3600,
+        )
+    raise ValueError(f"Unknown FSM_STORAGE: {settings.FSM_STORAGE!r}")
+
+
+def build_dispatcher(settings: Settings) -> Dispatcher:
+    dp = Dispatcher(storage=build_storage(settings))
+    dp["settings"] = settings
+    dp.update.outer_middleware(UserShardMiddleware(settings.UPDATES_CONCURRENCY))
+
+    dp.include_router(start.router)
+    dp.include_router(access.router)
+    dp.include_router(payments.router)
+    dp.include_router(chat_member.router)
+    return dp
+
+
+class Runtime:
+    """
+    Всё, что живёт один раз на процесс: Bot (одна HTTP-сессия к Telegram), Dispatcher,
+    пул БД, провайдеры оплат и фоновые задачи. Бот и вебхуки работают поверх одного Runtime,
+    поэтому делят соединения и кэши (статусы инвойсов, last_screen и т.п.).
+    """
+
+    def __init__(self, settings: Settings) -> None:
+        self.settings = settings
+        self.bot = Bot(
+            token=settings.BOT_TOKEN,
+            default=DefaultBotProperties(parse_mode="Markdown"),
+        )
+        # все исходящие вызовы (хендлеры, выдача доступа, уведомления) — через общие лимиты
+        self.bot.session.middleware(OutgoingRateLimiter(global_rate=settings.TELEGRAM_GLOBAL_RATE))
+        self.dp = build_dispatcher(settings)
+        self.accepts_webhook_updates = False
+        self._polling: asyncio.Task | None = None
+        self._updates: set[asyncio.Task] = set()
+
+    async def start(
+        self,
+        *,
+        polling: bool = True,
+        telegram_webhook: bool = False,
+        bot_jobs: bool = True,
+    ) -> None:
+        """
+        polling — забирать апдейты через getUpdates в фоне.
+        telegram_webhook — принимать апдейты на settings.telegram_webhook_path (см. feed_update).
+        bot_jobs — планировщик дедлайнов и сверка оплат (нужны в одном процессе на деплой).
+        """
+        settings = self.settings
+
+        await init_db(settings)
+        await open_pool(settings.db_path_abs, readers=settings.DB_POOL_READERS)
+        start_user_writes(
+            settings.db_path_abs,
+            flush_ms=settings.USER_WRITES_FLUSH_MS,
+            max_batch=settings.USER_WRITES_MAX_BATCH,
+            cache_size=settings.LAST_SCREEN_CACHE_SIZE,
+            cache_ttl=settings.LAST_SCREEN_CACHE_TTL,
+        )
+        self.dp.storage.start()
+        if bot_jobs:
+            start_background_jobs(self.dp, self.bot, settings)
+            start_reconciler(settings)
+        start_admin_notifier(self.bot, settings)
+        start_outbox_workers(self.bot, settings)
+
+        if telegram_webhook:
+            await self._set_webhook()
+            self.accepts_webhook_updates = True
+
+        if polling:
+            # getUpdates не работает, пока у бота стоит webhook
+            await self.bot.delete_webhook()
+            self._polling = asyncio.get_running_loop().create_task(
+                self.dp.start_polling(self.bot, handle_signals=False, close_bot_session=False)
+            )
+            self._polling.add_done_callback(_log_polling_exit)
+
+    async def stop(self) -> None:
+        # webhook не снимаем: за балансировщиком его продолжают принимать другие воркеры
+        self.accepts_webhook_updates = False
+        polling, self._polling = self._polling, None
+        if polling is not None:
+            if not polling.done():
+                await self.dp.stop_polling()
+            await asyncio.gather(polling, return_exceptions=True)
+        if self._updates:
+            await asyncio.wait(self._updates, timeout=UPDATES_DRAIN_TIMEOUT)
+
+        await stop_reconciler()
+        await stop_background_jobs()
+        await stop_outbox_workers()
+        await stop_admin_notifier()
+        await stop_user_writes()
+        await self.dp.storage.close()
+        await close_providers()
+        await close_pools()
+        await self.bot.session.close()
+
+    def feed_update(self, update: dict) -> None:
+        """
+        Апдейт из Telegram webhook: обрабатываем в фоне, HTTP-ответ не ждёт хендлеров.
+        Ошибки хендлеров логирует сам Dispatcher; повторно Telegram апдейт не пришлёт.
+        """
+        task = asyncio.get_running_loop().create_task(self.dp.feed_raw_update(self.bot, update))
+        self._updates.add(task)
+        task.add_done_callback(self._update_done)
+
+    def _update_done(self, task: asyncio.Task) -> None:
+        self._updates.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            log.error("Failed to process webhook update", exc_info=task.exception())
+
+    async def _set_webhook(self) -> None:
+        settings = self.settings
+        base = settings.TELEGRAM_WEBHOOK_URL.strip().rstrip("/")
+        if not base:
+            raise RuntimeError("BOT_UPDATES_MODE=webhook requires TELEGRAM_WEBHOOK_URL")
+        secret = settings.TELEGRAM_WEBHOOK_SECRET.strip()
+        if not secret:
+            # без секрета любой, кто узнал путь, может слать боту поддельные апдейты
+            raise RuntimeError("BOT_UPDATES_MODE=webhook requires TELEGRAM_WEBHOOK_SECRET")
+        await self.bot.set_webhook(
+            base + settings.telegram_webhook_path,
+            secret_token=secret,
+            allowed_updates=self.dp.resolve_used_update_types(),
+        )
+        log.info("Telegram webhook set to %s/hooks/telegram/...", base)
+
+    @asynccontextmanager
+    async def lifespan(
+        self,
+        *,
+        polling: bool = True,
+        telegram_webhook: bool = False,
+        bot_jobs: bool = True,
+    ) -> AsyncIterator[Runtime]:
+        # start внутри try: если он упал на полпути, stop закроет уже запущенное —
+        # остановка каждой части безопасна и для незапущенной
+        try:
+            await self.start(polling=polling, telegram_webhook=telegram_webhook, bot_jobs=bot_jobs)
+            yield self
+        finally:
+            await self.stop()
+
+
+def _log_polling_exit(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        log.error("Polling stopped with error", exc_info=task.exception())
@@ -1,23 +1,70 @@
 from __future__ import annotations
 
+import hmac
 import json
 import logging
+from contextlib import asynccontextmanager
 from typing import Any
 
-from fastapi import FastAPI, Request, HTTPException, Response
-from aiogram import Bot
-from aiogram.client.default import DefaultBotProperties
+from fastapi import APIRouter, FastAPI, Request, HTTPException, Response
 
 from app.bot.config import Settings
-from app.bot.db import repo
+from app.bot.jobs.outbox import enqueue_payment_event
 from app.bot.services.payments.factory import get_provider
-from app.bot.services.payments.fulfill import fulfill_paid_order
+from app.runtime import Runtime
 
 log = logging.getLogger("webhooks")
-app = FastAPI()
 
-settings = Settings()
-bot = Bot(token=settings.BOT_TOKEN, default=DefaultBotProperties(parse_mode="Markdown"))
+router = APIRouter()
+
+
+def create_app(
+    runtime: Runtime,
+    *,
+    polling: bool = False,
+    telegram_webhook: bool = False,
+    bot_jobs: bool = False,
+) -> FastAPI:
+    """
+    FastAPI поверх общего Runtime: lifespan запускает и останавливает всё разом.
+    Единый процесс (app/app.py) — апдейты бота polling'ом или через /hooks/telegram/...;
+    отдельный процесс (`uvicorn app.webhooks.app:app`) — без polling, остальное по Settings.
+    """
+
+    @asynccontextmanager
+    async def lifespan(_: FastAPI):
+        async with runtime.lifespan(polling=polling, telegram_webhook=telegram_webhook, bot_jobs=bot_jobs):
+            yield
+
+    app = FastAPI(lifespan=lifespan)
+    app.state.runtime = runtime
+    app.include_router(router)
+    return app
+
+
+def __getattr__(name: str) -> Any:
+    # `uvicorn app.webhooks.app:app` — отдельный процесс (например, ещё один воркер за балансировщиком):
+    # getUpdates не делаем — он бы конфликтовал с основным процессом, а webhook-апдейты Telegram
+    # и фоновые задачи — как в Settings (BOT_UPDATES_MODE, BOT_JOBS).
+    # Собираем лениво, чтобы импорт create_app не создавал второй Bot/Settings
+    if name == "app":
+        global app
+        settings = Settings()
+        app = create_app(
+            Runtime(settings),
+            telegram_webhook=settings.updates_mode == "webhook",
+            bot_jobs=settings.BOT_JOBS,
+        )
+        return app
+    raise AttributeError(name)
+
+
+def _runtime(request: Request) -> Runtime:
+    return request.app.state.runtime
+
+
+def _settings(request: Request) -> Settings:
+    return _runtime(request).settings
 
 
 def _check_secret(request: Request) -> None:
@@ -25,7 +72,7 @@ def _check_secret(request: Request) -> None:
     Защита от "подделок": в URL должен быть ?s=<WEBHOOK_SECRET>
     Если WEBHOOK_SECRET пустой — проверку пропускаем (но лучше не оставлять пустым).
     """
-    need = (getattr(settings, "WEBHOOK_SECRET", "") or "").strip()
+    need = (getattr(_settings(request), "WEBHOOK_SECRET", "") or "").strip()
     if not need:
         return
     got = (request.query_params.get("s") or "").strip()
@@ -33,40 +80,48 @@ def _check_secret(request: Request) -> None:
         raise HTTPException(status_code=403, detail="forbidden")
 
 
-async def _find_created_order_by_id(order_id: str):
-    orders = await repo.get_created_orders(settings.db_path_abs, limit=500)
-    return next((o for o in orders if str(o.id) == str(order_id)), None)
-
-
-async def _find_created_order_by_crypto_invoice(invoice_id: str):
-    orders = await repo.get_created_orders(settings.db_path_abs, limit=500)
-    return next(
-        (o for o in orders if o.provider == "crypto" and str(o.provider_invoice_id) == str(invoice_id)),
-        None,
-    )
-
-
-@app.get("/hooks/health")
+@router.get("/hooks/health")
 async def health():
     return {"ok": True}
 
 
 # --- Чтобы платежки могли "проверить URL" (CryptoBot часто делает GET) ---
-@app.get("/hooks/crypto")
-@app.get("/hooks/cactus")
+@router.get("/hooks/crypto")
+@router.get("/hooks/cactus")
 async def hook_get(request: Request):
     _check_secret(request)
     return {"ok": True}
 
 
-@app.head("/hooks/crypto")
-@app.head("/hooks/cactus")
+@router.head("/hooks/crypto")
+@router.head("/hooks/cactus")
 async def hook_head():
     return Response(status_code=200)
 
 
+# -------------------- TELEGRAM --------------------
+@router.post("/hooks/telegram/{path_secret}")
+async def telegram_hook(path_secret: str, request: Request):
+    runtime = _runtime(request)
+    settings = runtime.settings
+
+    expected_path = settings.telegram_webhook_path.rsplit("/", 1)[-1]
+    if not runtime.accepts_webhook_updates or not hmac.compare_digest(path_secret, expected_path):
+        raise HTTPException(status_code=404, detail="not found")
+
+    # без секрета webhook не ставится (Runtime._set_webhook), так что пустой — значит чужой запрос
+    need = settings.TELEGRAM_WEBHOOK_SECRET.strip()
+    got = request.headers.get("x-telegram-bot-api-secret-token") or ""
+    if not need or not hmac.compare_digest(got, need):
+        raise HTTPException(status_code=403, detail="forbidden")
+
+    # отвечаем сразу: Telegram ждёт ответа, чтобы прислать следующий апдейт этому боту
+    runtime.feed_update(await request.json())
+    return {"ok": True}
+
+
 # -------------------- CACTUS --------------------
-@app.post("/hooks/cactus")
+@router.post("/hooks/cactus")
 async def cactus_hook(request: Request):
     _check_secret(request)
 
@@ -80,28 +135,22 @@ async def cactus_hook(request: Request):
     if not order_id:
         raise HTTPException(status_code=400, detail="order_id missing")
 
-    # По доке: после webhook обязательно проверить статус через API /get => ACCEPT/WAIT
-    provider = get_provider("cactus")
-    status = await provider.check_status(order_id)  # должен вернуть "paid" если ACCEPT
-
-    if status != "paid":
-        return {"ok": True, "status": status}
-
-    order = await _find_created_order_by_id(order_id)
-    if not order:
-        return {"ok": True, "status": "already_processed_or_not_found"}
-
-    await fulfill_paid_order(bot, settings, order)
-    return {"ok": True, "status": "paid_processed"}
+    # проверка статуса через API /get и выдача доступа — в outbox-воркере (jobs/outbox.py)
+    if await enqueue_payment_event(_settings(request), "cactus", {"order_id": order_id}) is None:
+        return {"ok": True, "status": "duplicate"}
+    return {"ok": True, "status": "queued"}
 
 
 # -------------------- CRYPTOBOT --------------------
-@app.post("/hooks/crypto")
+@router.post("/hooks/crypto")
 async def crypto_hook(request: Request):
-    _check_secret(request)
-
     raw = await request.body()
 
+    # Подпись Crypto Pay проверяем локально; если её нет/не сошлась — старая защита ?s=<secret>
+    signed = get_provider("crypto").verify_webhook(raw, request.headers.get("crypto-pay-api-signature"))
+    if not signed:
+        _check_secret(request)
+
     data: dict[str, Any] = {}
     # Обычно JSON, но на всякий поддержим и form
     try:
@@ -114,54 +163,39 @@ async def crypto_hook(request: Request):
             data = {}
 
     log.warning(
-        "CRYPTO_HOOK raw=%s json=%s",
+        "CRYPTO_HOOK signed=%s raw=%s json=%s",
+        signed,
         raw.decode("utf-8", "ignore"),
         json.dumps(data, ensure_ascii=False),
     )
 
+    # Формат Crypto Pay: {"update_type": "invoice_paid", "payload": {<Invoice>}}
+    invoice: dict[str, Any] = data["payload"] if isinstance(data.get("payload"), dict) else data
+
     # 1) invoice_id
     invoice_id = str(
-        data.get("invoice_id")
-        or data.get("invoiceId")
-        or data.get("id")
+        invoice.get("invoice_id")
+        or invoice.get("invoiceId")
+        or invoice.get("id")
         or ""
     ).strip()
 
     # 2) иногда полезно payload (если ты его кладешь при создании инвойса)
-    payload = str(data.get("payload") or data.get("data") or "").strip()
+    payload = str(invoice.get("payload") or invoice.get("data") or "").strip()
     order_id_from_payload = ""
     if payload.startswith("order:"):
         order_id_from_payload = payload.split("order:", 1)[1].strip()
 
-    provider = get_provider("crypto")
-
-    # Если в payload есть order_id — ищем по order.id и проверяем статус по сохраненному invoice_id
-    if order_id_from_payload:
-        order = await _find_created_order_by_id(order_id_from_payload)
-        if not order:
-            return {"ok": True, "status": "already_processed_or_not_found"}
-
-        if not order.provider_invoice_id:
-            return {"ok": True, "status": "order_missing_invoice_id"}
-
-        st = await provider.check_status(order.provider_invoice_id)
-        if st != "paid":
-            return {"ok": True, "status": st}
-
-        await fulfill_paid_order(bot, settings, order)
-        return {"ok": True, "status": "paid_processed"}
-
-    # Иначе — работаем по invoice_id
-    if not invoice_id:
+    if not order_id_from_payload and not invoice_id:
         return {"ok": True, "status": "no_invoice_id"}
 
-    st = await provider.check_status(invoice_id)
-    if st != "paid":
-        return {"ok": True, "status": st}
-
-    order = await _find_created_order_by_crypto_invoice(invoice_id)
-    if not order:
-        return {"ok": True, "status": "already_processed_or_not_found"}
+    event: dict[str, Any] = {"order_id": order_id_from_payload, "invoice_id": invoice_id}
+    if signed and invoice_id:
+        # подписанному статусу доверяем — воркер не будет перепроверять его через getInvoices
+        event["signed_status"] = str(invoice.get("status") or "").lower()
 
-    await fulfill_paid_order(bot, settings, order)
-    return {"ok": True, "status": "paid_processed"}
\ No newline at end of file
+    # выдача доступа (и проверка статуса, если подписи нет) — в outbox-воркере (jobs/outbox.py)
+    outbox_id = await enqueue_payment_event(_settings(request), "crypto", event)
+    if outbox_id is None:
+        return {"ok": True, "status": "duplicate"}
+    return {"ok": True, "status": "queued"}
@@ -0,0 +1,32 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.bot.db.connection import close_pools, open_pool
+from app.bot.db.init_db import init_db
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "bot.db")
+
+
+@pytest.fixture
+def run_db(db_path):
+    """
+    run_db(scenario): схема + пул на временной БД, scenario() в одном event loop, потом закрыть пул.
+    """
+
+    def run(scenario):
+        async def main():
+            await init_db(SimpleNamespace(db_path_abs=db_path))
+            await open_pool(db_path, readers=2)
+            try:
+                return await scenario()
+            finally:
+                await close_pools()
+
+        return asyncio.run(main())
+
+    return run
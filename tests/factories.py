@@ -0,0 +1,56 @@
+import uuid
+from datetime import datetime, timedelta
+
+from app.bot.db.connection import writer
+
+
+async def insert_order(
+    db_path,
+    order_id,
+    *,
+    user_id=42,
+    status="created",
+    provider="crypto",
+    invoice_id=None,
+    expires_in=600,
+):
+    """Заказ напрямую в БД: expires_in — секунды от текущего момента (отрицательные — уже истёк)."""
+    now = datetime.utcnow()
+    async with writer(db_path) as conn:
+        await conn.execute(
+            "INSERT OR IGNORE INTO users(user_id, created_at) VALUES(?, ?)",
+            (user_id, now.isoformat()),
+        )
+        await conn.execute(
+            """
+            INSERT INTO orders(id, user_id, tariff_code, price_rub, provider, status,
+                               provider_invoice_id, pay_url, created_at, expires_at)
+            VALUES(?, ?, 'month', 500, ?, ?, ?, 'https://pay', ?, ?)
+            """,
+            (
+                order_id,
+                user_id,
+                provider,
+                status,
+                invoice_id,
+                now.isoformat(),
+                (now + timedelta(seconds=expires_in)).isoformat(),
+            ),
+        )
+
+
+async def insert_subscription(db_path, *, user_id=42, ends_in=-60, status="active"):
+    """Оплаченный заказ + подписка; ends_in — секунды до окончания. Возвращает id подписки."""
+    sub_id = uuid.uuid4().hex[:12]
+    order_id = uuid.uuid4().hex[:10]
+    await insert_order(db_path, order_id, user_id=user_id, status="paid")
+    now = datetime.utcnow()
+    async with writer(db_path) as conn:
+        await conn.execute(
+            """
+            INSERT INTO subscriptions(id, user_id, tariff_code, starts_at, ends_at, status, order_id)
+            VALUES(?, ?, 'month', ?, ?, ?, ?)
+            """,
+            (sub_id, user_id, now.isoformat(), (now + timedelta(seconds=ends_in)).isoformat(), status, order_id),
+        )
+    return sub_id
@@ -0,0 +1,41 @@
+import time
+
+from app.bot.utils.cache import MISSING, TTLCache
+
+
+def test_lru_eviction_keeps_recently_used():
+    cache = TTLCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "a" теперь свежее "b"
+
+    cache.set("c", 3)
+
+    assert "b" not in cache
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.evictions == 1
+
+
+def test_ttl_expiry_on_read_and_purge():
+    cache = TTLCache(maxsize=10, ttl=0.05)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+
+    time.sleep(0.1)
+
+    assert cache.get("a", MISSING) is MISSING
+    assert cache.purge_expired() == 1  # "b" протух без обращений
+    assert len(cache) == 0
+    assert cache.stats()["evictions"] == 2
+
+
+def test_set_refreshes_ttl():
+    cache = TTLCache(maxsize=10, ttl=0.1)
+    cache.set("a", 1)
+    time.sleep(0.06)
+    cache.set("a", 2)
+    time.sleep(0.06)
+
+    assert cache.get("a") == 2
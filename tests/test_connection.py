@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+
+from app.bot.db.connection import Pool, close_pools, open_pool, reader, writer
+
+
+async def _open(db_path, readers=2):
+    pool = Pool(db_path, readers=readers)
+    await pool.open()
+    async with pool.writer() as conn:
+        await conn.execute("CREATE TABLE kv (k TEXT PRIMARY KEY, v TEXT NOT NULL)")
+    return pool
+
+
+def test_writer_commits_and_readers_see_it(db_path):
+    async def scenario():
+        pool = await _open(db_path)
+        try:
+            async with pool.writer() as conn:
+                await conn.execute("INSERT INTO kv(k, v) VALUES('a', '1')")
+            async with pool.reader() as conn:
+                cur = await conn.execute("SELECT v FROM kv WHERE k='a'")
+                return await cur.fetchone()
+        finally:
+            await pool.close()
+
+    assert asyncio.run(scenario()) == ("1",)
+
+
+def test_writer_rolls_back_on_error(db_path):
+    async def scenario():
+        pool = await _open(db_path)
+        try:
+            with pytest.raises(RuntimeError):
+                async with pool.writer() as conn:
+                    await conn.execute("INSERT INTO kv(k, v) VALUES('a', '1')")
+                    raise RuntimeError("boom")
+            async with pool.reader() as conn:
+                cur = await conn.execute("SELECT COUNT(*) FROM kv")
+                return (await cur.fetchone())[0]
+        finally:
+            await pool.close()
+
+    assert asyncio.run(scenario()) == 0
+
+
+def test_readers_are_query_only(db_path):
+    async def scenario():
+        pool = await _open(db_path)
+        try:
+            async with pool.reader() as conn:
+                await conn.execute("INSERT INTO kv(k, v) VALUES('a', '1')")
+        finally:
+            await pool.close()
+
+    with pytest.raises(Exception, match="readonly"):
+        asyncio.run(scenario())
+
+
+def test_close_fails_pending_readers(db_path):
+    async def scenario():
+        pool = await _open(db_path, readers=1)
+
+        async def wait_reader():
+            async with pool.reader():
+                pass
+
+        async with pool.reader():
+            # единственный читатель занят — оба ждут в очереди
+            waiters = [asyncio.create_task(wait_reader()) for _ in range(2)]
+            await asyncio.sleep(0)
+            await pool.close()
+        return await asyncio.gather(*waiters, return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(r, RuntimeError) and "closed" in str(r) for r in results)
+
+
+def test_no_lazy_reopen_after_close_pools(db_path):
+    async def scenario():
+        await open_pool(db_path, readers=1)
+        async with writer(db_path) as conn:
+            await conn.execute("CREATE TABLE kv (k TEXT PRIMARY KEY, v TEXT NOT NULL)")
+        await close_pools()
+        try:
+            async with reader(db_path):
+                pass
+        finally:
+            await close_pools()
+
+    with pytest.raises(RuntimeError, match="closed"):
+        asyncio.run(scenario())
@@ -0,0 +1,43 @@
+import hashlib
+import hmac
+
+import pytest
+
+from app.bot.services.payments.cryptobot import CryptoBotProvider
+
+TOKEN = "12345:AAtest"
+BODY = b'{"update_type":"invoice_paid","payload":{"invoice_id":1,"status":"paid"}}'
+
+
+def _sign(body, token=TOKEN):
+    return hmac.new(hashlib.sha256(token.encode()).digest(), body, hashlib.sha256).hexdigest()
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    monkeypatch.setenv("CRYPTOBOT_TOKEN", TOKEN)
+    return CryptoBotProvider()
+
+
+def test_accepts_valid_signature(provider):
+    assert provider.verify_webhook(BODY, _sign(BODY))
+    assert provider.verify_webhook(BODY, " " + _sign(BODY).upper() + " ")
+
+
+@pytest.mark.parametrize(
+    "body, signature",
+    [
+        (BODY + b" ", _sign(BODY)),  # тело изменили
+        (BODY, _sign(BODY, token="other:token")),  # подписано чужим токеном
+        (BODY, ""),
+        (BODY, None),
+    ],
+)
+def test_rejects_invalid_signature(provider, body, signature):
+    assert not provider.verify_webhook(body, signature)
+
+
+def test_rejects_everything_without_token(monkeypatch):
+    monkeypatch.setenv("CRYPTOBOT_TOKEN", "")
+    provider = CryptoBotProvider()
+    assert not provider.verify_webhook(BODY, _sign(BODY, token=""))
@@ -0,0 +1,107 @@
+import asyncio
+from datetime import timedelta
+
+from aiogram.fsm.storage.base import StorageKey
+
+from app.bot.db.fsm_storage import BoundedMemoryStorage, SQLiteStorage
+
+
+def _key(user_id):
+    return StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+
+
+def test_sqlite_state_survives_restart(run_db, db_path):
+    async def scenario():
+        storage = SQLiteStorage(db_path)
+        await storage.set_state(_key(1), "Checkout:confirm")
+        await storage.set_data(_key(1), {"tariff": "month"})
+        await storage.close()  # сбрасывает буфер
+
+        restarted = SQLiteStorage(db_path)
+        try:
+            return await restarted.get_state(_key(1)), await restarted.get_data(_key(1))
+        finally:
+            await restarted.close()
+
+    assert run_db(scenario) == ("Checkout:confirm", {"tariff": "month"})
+
+
+def test_sqlite_without_cache_sees_other_worker_writes(run_db, db_path):
+    async def scenario():
+        first, second = SQLiteStorage(db_path), SQLiteStorage(db_path)
+        try:
+            await second.get_state(_key(1))  # второй воркер уже читал этот ключ
+            await first.set_state(_key(1), "Checkout:pay")
+            await first.flush()
+            return await second.get_state(_key(1))
+        finally:
+            await first.close()
+            await second.close()
+
+    assert run_db(scenario) == "Checkout:pay"
+
+
+def test_sqlite_read_sees_unflushed_write_and_returns_copy(run_db, db_path):
+    async def scenario():
+        storage = SQLiteStorage(db_path, flush_ms=60_000, cache_ttl=60)
+        try:
+            await storage.set_data(_key(1), {"items": [1]})
+            data = await storage.get_data(_key(1))
+            data["items"].append(2)  # правка копии не портит хранилище
+            return await storage.get_data(_key(1))
+        finally:
+            await storage.close()
+
+    assert run_db(scenario) == {"items": [1]}
+
+
+def test_sqlite_forgets_abandoned_state(run_db, db_path):
+    async def scenario():
+        storage = SQLiteStorage(db_path, state_ttl=timedelta(seconds=0.05))
+        await storage.set_state(_key(1), "Checkout:confirm")
+        await storage.close()
+        await asyncio.sleep(0.1)
+
+        restarted = SQLiteStorage(db_path, state_ttl=timedelta(seconds=0.05))
+        try:
+            return await restarted.get_state(_key(1))
+        finally:
+            await restarted.close()
+
+    assert run_db(scenario) is None
+
+
+def test_memory_storage_evicts_least_recently_used():
+    async def scenario():
+        storage = BoundedMemoryStorage(max_entries=2)
+        await storage.set_state(_key(1), "a")
+        await storage.set_state(_key(2), "b")
+        await storage.get_state(_key(1))  # 1 свежее 2
+        await storage.set_state(_key(3), "c")
+        states = [await storage.get_state(_key(uid)) for uid in (1, 2, 3)]
+        return states, storage.stats()
+
+    states, stats = asyncio.run(scenario())
+
+    assert states == ["a", None, "c"]
+    assert stats["evictions"] == 1
+
+
+def test_memory_storage_forgets_idle_and_cleared_records():
+    async def scenario():
+        storage = BoundedMemoryStorage(idle_ttl=0.05)
+        await storage.set_state(_key(1), "idle")
+        await storage.set_state(_key(2), "cleared")
+        await storage.set_data(_key(2), {"x": 1})
+        await storage.set_state(_key(2), None)
+        await storage.set_data(_key(2), {})
+        cleared = len(storage.records)
+
+        await asyncio.sleep(0.1)
+        return cleared, await storage.get_state(_key(1)), len(storage.records)
+
+    cleared, idle_state, left = asyncio.run(scenario())
+
+    assert cleared == 1  # пустая запись (state=None, data={}) не занимает место
+    assert idle_state is None
+    assert left == 0
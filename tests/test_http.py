@@ -0,0 +1,93 @@
+import asyncio
+
+import aiohttp
+import pytest
+
+from app.bot.services.payments.http import ProviderGuard, ProviderHTTPError, ProviderUnavailable
+
+
+class Flaky:
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+
+def _guard(**options):
+    options.setdefault("base_delay", 0)
+    return ProviderGuard("test", **options)
+
+
+def test_idempotent_call_retries_transient_errors():
+    guard = _guard(retries=2)
+    fn = Flaky(aiohttp.ClientConnectionError(), ProviderHTTPError(502, "bad gateway"), "ok")
+
+    assert asyncio.run(guard.call(fn, idempotent=True)) == "ok"
+    assert fn.calls == 3
+    assert guard.healthy
+
+
+def test_non_idempotent_call_is_not_retried():
+    guard = _guard(retries=2)
+    fn = Flaky(asyncio.TimeoutError(), "ok")
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(guard.call(fn))
+    assert fn.calls == 1
+
+
+def test_api_errors_do_not_open_breaker():
+    guard = _guard(failure_threshold=1, retries=2)
+    fn = Flaky(ProviderHTTPError(400, "bad request"))
+
+    with pytest.raises(ProviderHTTPError):
+        asyncio.run(guard.call(fn, idempotent=True))
+    assert fn.calls == 1
+    assert guard.healthy
+
+
+def test_breaker_opens_and_recovers_after_probe():
+    guard = _guard(failure_threshold=2, reset_timeout=0.05, retries=0)
+    failing = Flaky(aiohttp.ClientConnectionError(), aiohttp.ClientConnectionError())
+
+    async def scenario():
+        for _ in range(2):
+            with pytest.raises(aiohttp.ClientConnectionError):
+                await guard.call(failing)
+        opened = guard.healthy
+
+        skipped = Flaky("ok")
+        with pytest.raises(ProviderUnavailable):
+            await guard.call(skipped)
+
+        await asyncio.sleep(0.06)
+        probe = Flaky("ok")
+        result = await guard.call(probe)
+        return opened, skipped.calls, result, probe.calls
+
+    opened, skipped_calls, result, probe_calls = asyncio.run(scenario())
+
+    assert opened is False
+    assert skipped_calls == 0  # запрос даже не отправляли
+    assert result == "ok" and probe_calls == 1
+    assert guard.healthy
+
+
+def test_failed_probe_reopens_breaker():
+    guard = _guard(failure_threshold=1, reset_timeout=0.05, retries=0)
+
+    async def scenario():
+        with pytest.raises(aiohttp.ClientConnectionError):
+            await guard.call(Flaky(aiohttp.ClientConnectionError()))
+        await asyncio.sleep(0.06)
+        with pytest.raises(aiohttp.ClientConnectionError):
+            await guard.call(Flaky(aiohttp.ClientConnectionError()))
+
+    asyncio.run(scenario())
+    assert not guard.healthy
@@ -0,0 +1,96 @@
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import EditMessageText
+from aiogram.types import Chat, Message
+
+from app.bot.utils import message_cleanup
+from app.bot.utils.message_cleanup import show_screen
+
+SETTINGS = SimpleNamespace(db_path_abs="unused.db", assets_path=lambda relative: relative)
+
+
+def _message(message_id, chat_id=1):
+    return Message(message_id=message_id, date=datetime.now(), chat=Chat(id=chat_id, type="private"))
+
+
+class FakeBot:
+    def __init__(self, edit_error=None):
+        self.edit_error = edit_error
+        self.calls = []
+
+    async def edit_message_text(self, *, text, chat_id, message_id, reply_markup=None):
+        self.calls.append(("edit", message_id))
+        if self.edit_error:
+            raise TelegramBadRequest(
+                method=EditMessageText(text=text, chat_id=chat_id, message_id=message_id),
+                message=self.edit_error,
+            )
+        return _message(message_id, chat_id)
+
+    async def delete_message(self, *, chat_id, message_id):
+        self.calls.append(("delete", message_id))
+
+    async def send_message(self, *, chat_id, text, reply_markup=None):
+        self.calls.append(("send", None))
+        return _message(100, chat_id)
+
+
+@pytest.fixture
+def screens(monkeypatch):
+    """Последний экран пользователя 1 — сообщение 10; записи новых экранов — в список."""
+    saved = []
+
+    async def get_last_screen(db_path, user_id):
+        return 1, 10
+
+    def set_last_screen(db_path, user_id, chat_id, message_id):
+        saved.append(message_id)
+
+    monkeypatch.setattr(message_cleanup.user_writes, "get_last_screen", get_last_screen)
+    monkeypatch.setattr(message_cleanup.user_writes, "set_last_screen", set_last_screen)
+    return saved
+
+
+def _show(bot, **kwargs):
+    return asyncio.run(show_screen(bot, SETTINGS, 1, 1, "text", **kwargs))
+
+
+def test_edits_last_screen_in_place(screens):
+    bot = FakeBot()
+
+    shown = _show(bot)
+
+    assert bot.calls == [("edit", 10)]
+    assert shown.message_id == 10
+    assert screens == [10]
+
+
+def test_falls_back_to_delete_and_send(screens):
+    bot = FakeBot(edit_error="Bad Request: message to edit not found")
+
+    shown = _show(bot)
+
+    assert bot.calls == [("edit", 10), ("delete", 10), ("send", None)]
+    assert shown.message_id == 100
+    assert screens == [100]
+
+
+def test_unchanged_screen_is_left_alone(screens):
+    bot = FakeBot(edit_error="Bad Request: message is not modified")
+
+    assert _show(bot) is None
+    assert bot.calls == [("edit", 10)]
+    assert screens == []
+
+
+def test_without_edit_sends_new_message(screens):
+    bot = FakeBot()
+
+    shown = _show(bot, edit=False)
+
+    assert bot.calls == [("delete", 10), ("send", None)]
+    assert screens == [shown.message_id]
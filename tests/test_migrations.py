@@ -0,0 +1,115 @@
+import asyncio
+import sqlite3
+from types import SimpleNamespace
+
+from app.bot.db.init_db import _load_migrations, init_db
+
+# схема до первой миграции (user_version=0): с одноколоночными индексами, которые убирают 0001/0002
+BASELINE_SCHEMA = """
+CREATE TABLE users (
+    user_id INTEGER PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    last_screen_chat_id INTEGER,
+    last_screen_message_id INTEGER
+);
+
+CREATE TABLE orders (
+    id TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    tariff_code TEXT NOT NULL,
+    price_rub INTEGER NOT NULL,
+    provider TEXT NOT NULL,
+    status TEXT NOT NULL,
+    provider_invoice_id TEXT,
+    pay_url TEXT,
+    created_at TEXT NOT NULL,
+    expires_at TEXT NOT NULL,
+    paid_at TEXT,
+    FOREIGN KEY (user_id) REFERENCES users(user_id)
+);
+
+CREATE TABLE subscriptions (
+    id TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    tariff_code TEXT NOT NULL,
+    starts_at TEXT NOT NULL,
+    ends_at TEXT,
+    status TEXT NOT NULL,
+    order_id TEXT NOT NULL,
+    FOREIGN KEY (user_id) REFERENCES users(user_id),
+    FOREIGN KEY (order_id) REFERENCES orders(id)
+);
+
+CREATE INDEX idx_orders_status ON orders(status);
+CREATE INDEX idx_orders_expires ON orders(expires_at);
+CREATE INDEX idx_subs_status ON subscriptions(status);
+CREATE INDEX idx_subs_ends ON subscriptions(ends_at);
+"""
+
+
+def _schema(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        objects = {
+            (row[0], row[1]) for row in conn.execute("SELECT type, name FROM sqlite_master WHERE name NOT LIKE 'sqlite_%'")
+        }
+        orders = conn.execute("SELECT id, status FROM orders").fetchall()
+    finally:
+        conn.close()
+    tables = {name for kind, name in objects if kind == "table"}
+    indexes = {name for kind, name in objects if kind == "index"}
+    return version, tables, indexes, orders
+
+
+def test_migrations_are_numbered_without_gaps():
+    numbers = [num for num, _ in _load_migrations()]
+    assert numbers == list(range(1, len(numbers) + 1))
+
+
+def test_migrates_baseline_schema_to_latest(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.execute("INSERT INTO users(user_id, created_at) VALUES(42, '2024-01-01T00:00:00')")
+    conn.execute(
+        """
+        INSERT INTO orders(id, user_id, tariff_code, price_rub, provider, status, created_at, expires_at)
+        VALUES('o1', 42, 'month', 500, 'crypto', 'created', '2024-01-01T00:00:00', '2024-01-01T00:10:00')
+        """
+    )
+    conn.commit()
+    conn.close()
+
+    settings = SimpleNamespace(db_path_abs=db_path)
+    asyncio.run(init_db(settings))
+    migrated = _schema(db_path)
+    # повторный старт на уже мигрированной БД ничего не меняет
+    asyncio.run(init_db(settings))
+    version, tables, indexes, orders = _schema(db_path)
+
+    assert migrated == (version, tables, indexes, orders)
+    assert version == len(_load_migrations())
+    assert orders == [("o1", "created")]
+    assert {
+        "idx_orders_created_expires",
+        "idx_orders_provider_invoice",
+        "idx_subs_active_ends",
+        "idx_subs_user_status_starts",
+    } <= indexes
+    assert not indexes & {"idx_orders_status", "idx_orders_expires", "idx_subs_status", "idx_subs_ends"}
+
+
+def test_fresh_database_matches_migrated_one(tmp_path):
+    fresh = str(tmp_path / "fresh.db")
+    migrated = str(tmp_path / "migrated.db")
+
+    conn = sqlite3.connect(migrated)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.close()
+
+    for path in (fresh, migrated):
+        asyncio.run(init_db(SimpleNamespace(db_path_abs=path)))
+
+    fresh_version, fresh_tables, fresh_indexes, _ = _schema(fresh)
+    version, tables, indexes, _ = _schema(migrated)
+    assert (fresh_version, fresh_tables, fresh_indexes) == (version, tables, indexes)
@@ -0,0 +1,83 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.bot.db import repo
+from app.bot.jobs import outbox
+from app.bot.jobs.outbox import OutboxWorkerPool, enqueue_payment_event
+
+
+def _pool(db_path, **options):
+    return OutboxWorkerPool(None, SimpleNamespace(db_path_abs=db_path), **options)
+
+
+def test_slow_delivery_keeps_its_lease(run_db, db_path, monkeypatch):
+    async def slow_delivery(bot, settings, item):
+        await asyncio.sleep(0.5)
+        return "paid_processed"
+
+    monkeypatch.setattr(outbox, "process_payment_event", slow_delivery)
+
+    async def scenario():
+        pool = _pool(db_path, lease_seconds=0.3)
+        await repo.enqueue_outbox(db_path, "crypto", {"invoice_id": "inv-slow"})
+        item = await repo.claim_outbox(db_path, pool._lease_seconds)
+
+        handling = asyncio.create_task(pool._handle(item))
+        await asyncio.sleep(0.4)  # исходная аренда уже истекла бы
+        stolen = await repo.claim_outbox(db_path, lease_seconds=60)
+        await handling
+        after = await repo.claim_outbox(db_path, lease_seconds=60)
+        return stolen, after
+
+    stolen, after = run_db(scenario)
+
+    assert stolen is None
+    assert after is None  # done — больше не выдаётся
+
+
+@pytest.mark.parametrize(
+    "result, accepted_again",
+    [
+        ("paid_processed", False),
+        ("already_processed_or_not_found", False),
+        ("expired", False),
+        ("order_missing_invoice_id", False),
+        ("unknown_provider", False),
+        ("created", True),
+        ("something_new", True),
+    ],
+)
+def test_result_decides_whether_event_is_accepted_again(run_db, db_path, monkeypatch, result, accepted_again):
+    async def process(bot, settings, item):
+        return result
+
+    monkeypatch.setattr(outbox, "process_payment_event", process)
+    settings = SimpleNamespace(db_path_abs=db_path)
+    payload = {"invoice_id": f"inv-{result}"}
+
+    async def scenario():
+        pool = _pool(db_path)
+        assert await enqueue_payment_event(settings, "crypto", payload) is not None
+        await pool._handle(await repo.claim_outbox(db_path, lease_seconds=60))
+        return await enqueue_payment_event(settings, "crypto", payload)
+
+    redelivered = run_db(scenario)
+
+    assert (redelivered is not None) is accepted_again
+
+
+def test_failed_event_is_retried_later(run_db, db_path, monkeypatch):
+    async def broken(bot, settings, item):
+        raise RuntimeError("telegram is down")
+
+    monkeypatch.setattr(outbox, "process_payment_event", broken)
+
+    async def scenario():
+        pool = _pool(db_path)
+        await repo.enqueue_outbox(db_path, "crypto", {"invoice_id": "inv-broken"})
+        await pool._handle(await repo.claim_outbox(db_path, lease_seconds=60))
+        return await repo.claim_outbox(db_path, lease_seconds=60)
+
+    assert run_db(scenario) is None  # ретрай — с задержкой, не сразу
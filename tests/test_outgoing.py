@@ -0,0 +1,79 @@
+import asyncio
+import time
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import BanChatMember, SendMessage
+
+from app.bot.middlewares.outgoing import BROADCAST, PAYMENT, OutgoingRateLimiter, send_priority
+
+
+def test_payment_goes_before_queued_broadcast():
+    limiter = OutgoingRateLimiter(global_rate=20)
+    sent = []
+
+    async def make_request(bot, method):
+        sent.append(method.chat_id)
+        return True
+
+    async def send(chat_id, priority):
+        with send_priority(priority):
+            await limiter(make_request, None, SendMessage(chat_id=chat_id, text="hi"))
+
+    async def scenario():
+        limiter._global.tokens = 0  # общий лимит исчерпан: все ждут раздачи токенов
+        broadcast = [asyncio.create_task(send(chat_id, BROADCAST)) for chat_id in (1, 2, 3)]
+        await asyncio.sleep(0)
+        payment = asyncio.create_task(send(100, PAYMENT))
+        await asyncio.gather(*broadcast, payment)
+
+    asyncio.run(scenario())
+
+    assert sent == [100, 1, 2, 3]
+
+
+def test_chat_admin_calls_skip_per_chat_limit():
+    limiter = OutgoingRateLimiter(global_rate=30, group_rate=1 / 60, burst=1)
+    calls = 0
+
+    async def make_request(bot, method):
+        nonlocal calls
+        calls += 1
+        return True
+
+    async def scenario():
+        started = time.monotonic()
+        for user_id in range(5):
+            await limiter(make_request, None, BanChatMember(chat_id=-100, user_id=user_id))
+        return time.monotonic() - started
+
+    elapsed = asyncio.run(scenario())
+
+    assert calls == 5
+    assert elapsed < 0.5  # по лимиту группы (1 в минуту) это заняло бы минуты
+
+
+def test_retry_after_pauses_only_that_chat_and_retries():
+    limiter = OutgoingRateLimiter()
+    sent = []
+
+    async def make_request(bot, method):
+        if method.chat_id == 1 and not any(chat_id == 1 for chat_id, _ in sent):
+            sent.append((1, None))
+            raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=1)
+        sent.append((method.chat_id, time.monotonic()))
+        return True
+
+    async def scenario():
+        started = time.monotonic()
+        flooded = asyncio.create_task(limiter(make_request, None, SendMessage(chat_id=1, text="a")))
+        await asyncio.sleep(0.05)
+        await limiter(make_request, None, SendMessage(chat_id=2, text="b"))
+        await flooded
+        return started
+
+    started = asyncio.run(scenario())
+
+    (first, _), (other, other_at), (retried, retried_at) = sent
+    assert (first, other, retried) == (1, 2, 1)
+    assert other_at - started < 0.5  # другой чат паузу не ждал
+    assert retried_at - started >= 1
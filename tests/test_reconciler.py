@@ -0,0 +1,49 @@
+from datetime import timedelta
+from types import SimpleNamespace
+
+from app.bot.db import repo
+from app.bot.jobs import reconciler
+from app.bot.jobs.reconciler import InvoiceReconciler
+from tests.factories import insert_order
+
+
+class FakeBatchProvider:
+    name = "crypto"
+
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.requests = []
+
+    async def check_status_many(self, invoice_ids):
+        ids = list(invoice_ids)
+        self.requests.append(ids)
+        return {i: self.statuses.get(i, "created") for i in ids}
+
+
+def test_reconcile_queues_paid_invoices_once(run_db, db_path, monkeypatch):
+    provider = FakeBatchProvider({"inv-paid": "paid", "inv-late": "paid", "inv-old": "paid"})
+    monkeypatch.setattr(reconciler, "all_providers", lambda: [provider])
+
+    async def scenario():
+        await insert_order(db_path, "paid", invoice_id="inv-paid")
+        await insert_order(db_path, "waiting", invoice_id="inv-waiting")
+        # оплатили уже после нашего дедлайна — в пределах late_grace
+        await insert_order(db_path, "late", status="expired", invoice_id="inv-late", expires_in=-60)
+        await insert_order(db_path, "old", status="expired", invoice_id="inv-old", expires_in=-7200)
+
+        job = InvoiceReconciler(SimpleNamespace(db_path_abs=db_path), page_size=1, late_grace=timedelta(hours=1))
+        first = await job.reconcile()
+        second = await job.reconcile()  # те же оплаты ещё не обработаны — журнал отсекает дубли
+
+        events = []
+        while (item := await repo.claim_outbox(db_path, lease_seconds=60)) is not None:
+            events.append(item.payload)
+        return first, second, events
+
+    first, second, events = run_db(scenario)
+
+    assert first == 2
+    assert second == 0
+    assert sorted(e["order_id"] for e in events) == ["late", "paid"]
+    assert all(len(ids) == 1 for ids in provider.requests)  # page_size=1: keyset-пачки по одному
+    assert ["inv-old"] not in provider.requests
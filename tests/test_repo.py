@@ -0,0 +1,136 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from app.bot.db import repo
+from app.bot.db.connection import reader
+from tests.factories import insert_order
+
+
+def test_point_lookups(run_db, db_path):
+    async def scenario():
+        await insert_order(db_path, "o1", invoice_id="inv-1")
+        await insert_order(db_path, "o2", status="paid", invoice_id="inv-2")
+        return (
+            await repo.get_created_order_by_id(db_path, "o1"),
+            await repo.get_created_order_by_id(db_path, "o2"),
+            await repo.get_order_by_provider_invoice(db_path, "crypto", "inv-2"),
+            await repo.get_order_by_provider_invoice(db_path, "cactus", "inv-2"),
+        )
+
+    created, paid, by_invoice, other_provider = run_db(scenario)
+
+    assert created.id == "o1"
+    assert paid is None  # уже оплачен — не created
+    assert by_invoice.id == "o2" and by_invoice.status == "paid"
+    assert other_provider is None
+
+
+def test_claim_order_paid_race_has_single_winner(run_db, db_path):
+    async def scenario():
+        await insert_order(db_path, "o1")
+        now_iso = datetime.utcnow().isoformat()
+        results = await asyncio.gather(
+            *(repo.claim_order_paid(db_path, "o1", paid_at_iso=now_iso, ends_at_iso=None) for _ in range(5))
+        )
+        async with reader(db_path) as conn:
+            cur = await conn.execute("SELECT id FROM subscriptions WHERE order_id='o1'")
+            subs = await cur.fetchall()
+        order = await repo.get_order_by_id(db_path, "o1")
+        return results, subs, order
+
+    results, subs, order = run_db(scenario)
+
+    winners = [r for r in results if r is not None]
+    assert len(winners) == 1
+    assert order.status == "paid"
+    assert subs == [(winners[0][1].id,)]
+
+
+def test_claim_order_paid_accepts_expired_order(run_db, db_path):
+    async def scenario():
+        await insert_order(db_path, "o1", status="expired", expires_in=-60)
+        await insert_order(db_path, "o2", status="canceled")
+        now_iso = datetime.utcnow().isoformat()
+        first = await repo.claim_order_paid(db_path, "o1", paid_at_iso=now_iso, ends_at_iso=None)
+        second = await repo.claim_order_paid(db_path, "o1", paid_at_iso=now_iso, ends_at_iso=None)
+        canceled = await repo.claim_order_paid(db_path, "o2", paid_at_iso=now_iso, ends_at_iso=None)
+        return first, second, canceled
+
+    first, second, canceled = run_db(scenario)
+
+    assert first is not None and first[0].status == "paid"
+    assert second is None
+    assert canceled is None
+
+
+def test_outbox_lease_expiry_resumes_claimed_order(run_db, db_path):
+    async def scenario():
+        await insert_order(db_path, "o1", invoice_id="inv-1")
+        outbox_id = await repo.enqueue_outbox(db_path, "crypto", {"invoice_id": "inv-1"})
+
+        first = await repo.claim_outbox(db_path, lease_seconds=0.2)
+        # воркер выиграл claim заказа и "упал" до отправки
+        await repo.claim_order_paid(
+            db_path,
+            "o1",
+            paid_at_iso=datetime.utcnow().isoformat(),
+            ends_at_iso=None,
+            outbox_id=first.id,
+        )
+        while_leased = await repo.claim_outbox(db_path, lease_seconds=0.2)
+
+        await asyncio.sleep(0.3)
+        resumed = await repo.claim_outbox(db_path, lease_seconds=60)
+        return outbox_id, first, while_leased, resumed
+
+    outbox_id, first, while_leased, resumed = run_db(scenario)
+
+    assert first.id == outbox_id and first.claimed_order_id is None
+    assert while_leased is None
+    assert resumed.id == outbox_id
+    assert resumed.attempts == 2
+    assert resumed.claimed_order_id == "o1"
+
+
+def test_renewed_lease_is_not_reclaimed(run_db, db_path):
+    async def scenario():
+        await repo.enqueue_outbox(db_path, "crypto", {"invoice_id": "inv-1"})
+        item = await repo.claim_outbox(db_path, lease_seconds=0.2)
+        renewed = await repo.renew_outbox_lease(db_path, item.id, item.attempts, lease_seconds=60)
+
+        await asyncio.sleep(0.3)
+        while_renewed = await repo.claim_outbox(db_path, lease_seconds=0.2)
+
+        # аренду потеряли (другой воркер взял событие после истечения) — продлить её уже нельзя
+        stale = await repo.renew_outbox_lease(db_path, item.id, item.attempts - 1, lease_seconds=60)
+        return renewed, while_renewed, stale
+
+    renewed, while_renewed, stale = run_db(scenario)
+
+    assert renewed is True
+    assert while_renewed is None
+    assert stale is False
+
+
+def test_webhook_ledger_drops_duplicate_events(run_db, db_path):
+    async def scenario():
+        first = await repo.enqueue_outbox(db_path, "crypto", {"invoice_id": "inv-1"}, dedupe_key="invoice:inv-1")
+        duplicate = await repo.enqueue_outbox(
+            db_path, "crypto", {"invoice_id": "inv-1"}, dedupe_key="invoice:inv-1"
+        )
+        other_provider = await repo.enqueue_outbox(db_path, "cactus", {"order_id": "o1"}, dedupe_key="invoice:inv-1")
+
+        await repo.forget_webhook_event(db_path, "crypto", "invoice:inv-1")
+        redelivered = await repo.enqueue_outbox(
+            db_path, "crypto", {"invoice_id": "inv-1"}, dedupe_key="invoice:inv-1"
+        )
+        pruned = await repo.prune_webhook_events(db_path, (datetime.utcnow() + timedelta(seconds=1)).isoformat())
+        return first, duplicate, other_provider, redelivered, pruned
+
+    first, duplicate, other_provider, redelivered, pruned = run_db(scenario)
+
+    assert first is not None
+    assert duplicate is None
+    assert other_provider is not None
+    assert redelivered is not None and redelivered != first
+    assert pruned == 2
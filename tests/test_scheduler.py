@@ -0,0 +1,160 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from app.bot.db import repo
+from app.bot.jobs.scheduler import ORDER, SUBSCRIPTION, DeadlineScheduler
+from tests.factories import insert_order, insert_subscription
+
+
+class FakeBot:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = []
+
+    async def ban_chat_member(self, chat_id, user_id):
+        self.calls.append(("ban", user_id))
+        if self.fail:
+            raise RuntimeError("telegram is down")
+
+    async def unban_chat_member(self, chat_id, user_id):
+        self.calls.append(("unban", user_id))
+
+
+def _scheduler(db_path, bot=None, **options):
+    settings = SimpleNamespace(db_path_abs=db_path, TARGET_CHAT_ID=-100)
+    return DeadlineScheduler(bot or FakeBot(), settings, **options)
+
+
+def _queued(scheduler, kind):
+    return sorted(when for when, k in scheduler._heap if k == kind)
+
+
+async def _subscription_status(db_path, user_id=42):
+    sub = await repo.get_active_subscription_for_user(db_path, user_id)
+    return sub.status if sub else None
+
+
+def test_expires_due_orders_and_waits_for_the_next_one(run_db, db_path):
+    async def scenario():
+        scheduler = _scheduler(db_path)
+        await insert_order(db_path, "due", expires_in=-60)
+        await insert_order(db_path, "later", expires_in=600)
+        now = datetime.utcnow()
+        await scheduler._expire_orders(now)
+        await scheduler._reload(now)
+        due = await repo.get_order_by_id(db_path, "due")
+        later = await repo.get_order_by_id(db_path, "later")
+        return due.status, later, _queued(scheduler, ORDER)
+
+    due_status, later, queued = run_db(scenario)
+
+    assert due_status == "expired"
+    assert later.status == "created"
+    assert queued == [datetime.fromisoformat(later.expires_at)]
+
+
+def test_failed_order_waits_for_retry_instead_of_spinning(run_db, db_path, monkeypatch):
+    calls = []
+
+    async def broken_expire_order(db_path, order_id):
+        calls.append(order_id)
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(repo, "expire_order", broken_expire_order)
+
+    async def scenario():
+        scheduler = _scheduler(db_path, retry=30)
+        await insert_order(db_path, "due", expires_in=-60)
+        now = datetime.utcnow()
+        await scheduler._expire_orders(now)
+        await scheduler._reload(now)
+        queued = _queued(scheduler, ORDER)
+        # пока ретрай не наступил, заказ не трогаем, даже если дренаж случился раньше
+        await scheduler._expire_orders(now + timedelta(seconds=10))
+        return now, queued
+
+    now, queued = run_db(scenario)
+
+    assert calls == ["due"]
+    assert queued == [now + timedelta(seconds=30)]
+
+
+def test_reload_after_drain_sees_deadlines_passed_during_drain(run_db, db_path):
+    async def scenario():
+        scheduler = _scheduler(db_path, bot=FakeBot(fail=True))
+        await insert_subscription(db_path, user_id=1, ends_in=-60)
+        drained_at = datetime.utcnow()
+        await scheduler._expire_subscriptions(drained_at)
+        # подписка истекла, пока шёл дренаж: её дедлайн уже в прошлом, но позже drained_at
+        await insert_subscription(db_path, user_id=2, ends_in=-0.001)
+        await scheduler._reload(drained_at)
+        return drained_at, _queued(scheduler, SUBSCRIPTION)
+
+    drained_at, queued = run_db(scenario)
+
+    assert len(queued) == 2
+    assert drained_at < queued[0] <= datetime.utcnow()  # сразу будимся за новой
+    assert queued[1] == drained_at + timedelta(seconds=5)  # ретрай кика первой
+
+
+def test_subscription_expires_only_after_successful_kick(run_db, db_path):
+    bot = FakeBot(fail=True)
+
+    async def scenario():
+        scheduler = _scheduler(db_path, bot=bot, retry=5)
+        await insert_subscription(db_path, ends_in=-60)
+        now = datetime.utcnow()
+
+        await scheduler._expire_subscriptions(now)
+        after_failure = await _subscription_status(db_path)
+
+        bot.fail = False
+        await scheduler._expire_subscriptions(now + timedelta(seconds=1))  # ретрай ещё не наступил
+        before_retry = await _subscription_status(db_path)
+        await scheduler._expire_subscriptions(now + timedelta(seconds=5))
+        after_retry = await _subscription_status(db_path)
+        return after_failure, before_retry, after_retry
+
+    after_failure, before_retry, after_retry = run_db(scenario)
+
+    assert after_failure == before_retry == "active"
+    assert after_retry is None
+    assert bot.calls == [("ban", 42), ("ban", 42), ("unban", 42)]
+
+
+def test_renewed_user_is_not_kicked(run_db, db_path):
+    bot = FakeBot()
+
+    async def scenario():
+        scheduler = _scheduler(db_path, bot=bot)
+        await insert_subscription(db_path, ends_in=-60)
+        await insert_subscription(db_path, ends_in=3600)
+        await scheduler._expire_subscriptions(datetime.utcnow())
+        return await repo.get_active_subscription_for_user(db_path, 42)
+
+    active = run_db(scenario)
+
+    assert active is not None
+    assert bot.calls == []
+
+
+def test_running_scheduler_expires_order_at_its_deadline(run_db, db_path):
+    async def scenario():
+        scheduler = _scheduler(db_path)
+        scheduler.start()
+        try:
+            await asyncio.sleep(0.05)  # первый _reload: дедлайнов нет
+            await insert_order(db_path, "soon", expires_in=0.2)
+            order = await repo.get_order_by_id(db_path, "soon")
+            scheduler.notify(ORDER, order.expires_at)
+            for _ in range(100):
+                order = await repo.get_order_by_id(db_path, "soon")
+                if order.status != "created":
+                    break
+                await asyncio.sleep(0.02)
+            return order.status
+        finally:
+            await scheduler.stop()
+
+    assert run_db(scenario) == "expired"
@@ -0,0 +1,54 @@
+import asyncio
+
+from aiogram.types import User
+
+from app.bot.middlewares.sharding import UserShardMiddleware
+
+
+def _data(user_id):
+    return {"event_from_user": User(id=user_id, is_bot=False, first_name="u")} if user_id else {}
+
+
+def test_updates_of_one_user_run_in_order():
+    middleware = UserShardMiddleware(concurrency=10)
+    log = []
+
+    def handler(name, delay):
+        async def handle(event, data):
+            log.append(f"{name}:start")
+            await asyncio.sleep(delay)
+            log.append(f"{name}:end")
+
+        return handle
+
+    async def scenario():
+        await asyncio.gather(
+            middleware(handler("first", 0.05), None, _data(1)),
+            middleware(handler("second", 0), None, _data(1)),
+        )
+
+    asyncio.run(scenario())
+
+    assert log == ["first:start", "first:end", "second:start", "second:end"]
+    assert len(middleware) == 0  # шард освобождается, когда у пользователя нет апдейтов
+
+
+def test_different_users_run_concurrently_up_to_limit():
+    middleware = UserShardMiddleware(concurrency=2)
+    running = peak = 0
+
+    async def handle(event, data):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.02)
+        running -= 1
+        return data.get("event_from_user")
+
+    async def scenario():
+        return await asyncio.gather(*(middleware(handle, None, _data(uid)) for uid in (1, 2, 3, 4, 0)))
+
+    results = asyncio.run(scenario())
+
+    assert peak == 2
+    assert [u.id if u else None for u in results] == [1, 2, 3, 4, None]
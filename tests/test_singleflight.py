@@ -0,0 +1,87 @@
+import asyncio
+
+from app.bot.services.payments.base import SupportsBatchStatus
+from app.bot.services.payments.singleflight import SingleFlightProvider, single_flight
+
+
+class FakeProvider:
+    name = "fake"
+
+    def __init__(self, status="created", delay=0.05):
+        self.status = status
+        self.delay = delay
+        self.calls = 0
+
+    async def check_status(self, invoice_id):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return self.status
+
+    async def cancel(self, invoice_id):
+        return None
+
+
+class FakeBatchProvider(FakeProvider):
+    async def check_status_many(self, invoice_ids):
+        return {i: "paid" for i in invoice_ids}
+
+
+def test_concurrent_checks_share_one_request():
+    provider = FakeProvider(status="created")
+    wrapped = single_flight(provider)
+
+    async def scenario():
+        first = await asyncio.gather(*(wrapped.check_status("inv-1") for _ in range(10)))
+        # не терминальный статус не кэшируется: следующий вызов снова идёт к провайдеру
+        second = await wrapped.check_status("inv-1")
+        return first, second
+
+    first, second = asyncio.run(scenario())
+
+    assert first == ["created"] * 10
+    assert second == "created"
+    assert provider.calls == 2
+
+
+def test_terminal_status_is_served_from_cache():
+    provider = FakeProvider(status="paid")
+    wrapped = single_flight(provider)
+
+    async def scenario():
+        return [await wrapped.check_status("inv-1") for _ in range(3)]
+
+    assert asyncio.run(scenario()) == ["paid"] * 3
+    assert provider.calls == 1
+
+
+def test_cancelled_waiter_does_not_cancel_shared_request():
+    provider = FakeProvider(status="paid", delay=0.1)
+    wrapped = single_flight(provider)
+
+    async def scenario():
+        impatient = asyncio.create_task(wrapped.check_status("inv-1"))
+        patient = asyncio.create_task(wrapped.check_status("inv-1"))
+        await asyncio.sleep(0.01)
+        impatient.cancel()
+        return await patient
+
+    assert asyncio.run(scenario()) == "paid"
+    assert provider.calls == 1
+
+
+def test_batch_provider_keeps_batch_api_and_fills_cache():
+    provider = FakeBatchProvider(status="created")
+    plain = single_flight(FakeProvider())
+    wrapped = single_flight(provider)
+
+    async def scenario():
+        statuses = await wrapped.check_status_many(["inv-1", "inv-2"])
+        return statuses, await wrapped.check_status("inv-1")
+
+    statuses, cached = asyncio.run(scenario())
+
+    assert isinstance(wrapped, SupportsBatchStatus)
+    assert not isinstance(plain, SupportsBatchStatus)
+    assert isinstance(plain, SingleFlightProvider)
+    assert statuses == {"inv-1": "paid", "inv-2": "paid"}
+    assert cached == "paid" and provider.calls == 0
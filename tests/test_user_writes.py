@@ -0,0 +1,64 @@
+import asyncio
+
+from app.bot.db import repo, user_writes
+from app.bot.db.user_writes import UserWriteQueue
+
+
+def test_coalesces_repeated_writes_per_user(run_db, db_path):
+    async def scenario():
+        queue = UserWriteQueue(db_path, flush_ms=60_000)
+        queue.set_last_screen(1, 1, 10)
+        queue.set_last_screen(1, 1, 11)
+        queue.set_last_screen(2, 2, 20)
+        pending = len(queue)
+        await queue.stop()  # stop сбрасывает накопленное
+        return pending, await repo.get_last_screen(db_path, 1), await repo.get_last_screen(db_path, 2)
+
+    pending, first, second = run_db(scenario)
+
+    assert pending == 2
+    assert first == (1, 11)
+    assert second == (2, 20)
+
+
+def test_flushes_as_soon_as_batch_is_full(run_db, db_path):
+    async def scenario():
+        queue = UserWriteQueue(db_path, flush_ms=60_000, max_batch=2)
+        queue.set_last_screen(1, 1, 10)
+        queue.set_last_screen(2, 2, 20)
+        # flush_ms не дождались бы — сбрасывает заполненная пачка
+        for _ in range(100):
+            stored = await repo.get_last_screen(db_path, 2)
+            if stored == (2, 20):
+                break
+            await asyncio.sleep(0.01)
+        await queue.stop()
+        return stored
+
+    assert run_db(scenario) == (2, 20)
+
+
+def test_last_screen_read_path(run_db, db_path):
+    async def scenario():
+        user_writes.start_user_writes(db_path, flush_ms=60_000)
+        try:
+            user_writes.set_last_screen(db_path, 1, 1, 10)
+            pending = await user_writes.get_last_screen(db_path, 1)  # ещё не в БД
+            await user_writes.get_queue(db_path).flush()
+
+            # БД поменяли в обход очереди: пока запись в кэше, читаем из кэша
+            await repo.apply_user_writes(db_path, {1: (1, 99), 2: (2, 20)})
+            cached = await user_writes.get_last_screen(db_path, 1)
+            from_db = await user_writes.get_last_screen(db_path, 2)
+            unknown = await user_writes.get_last_screen(db_path, 3)
+            warmed = user_writes.get_queue(db_path).screen_cache.get(2)
+        finally:
+            await user_writes.stop_user_writes()
+        return pending, cached, from_db, unknown, warmed
+
+    pending, cached, from_db, unknown, warmed = run_db(scenario)
+
+    assert pending == (1, 10)
+    assert cached == (1, 10)
+    assert from_db == (2, 20) and warmed == (2, 20)
+    assert unknown == (None, None)